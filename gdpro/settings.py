@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 import os
+import json
 from pathlib import Path
 from urllib.parse import urlparse
 
@@ -34,6 +35,114 @@ GHBEARER = os.environ.get("GHBEARER", '')
 PROTOCOL = os.environ.get("PROTOCOL", 'https')
 REPONAME = os.environ.get("REPONAME", 'gdpro')
 
+# Outbound HTTP (uigdpro.outbound): one keep-alive pool per upstream host
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '10'))
+# Async views share one httpx client per event loop, capped at this many connections
+HTTP_ASYNC_MAX_CONNECTIONS = int(os.getenv('HTTP_ASYNC_MAX_CONNECTIONS', '100'))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '30'))
+
+# Dispatch pool: JSON list of {"name", "owner", "repo", "token", "weight", "max_running"};
+# every repo needs the generator workflows. Empty = GHUSER/REPONAME with GHBEARER.
+DISPATCH_TARGETS = json.loads(os.getenv('DISPATCH_TARGETS', '[]'))
+DISPATCH_RATE_LIMIT_RESERVE = int(os.getenv('DISPATCH_RATE_LIMIT_RESERVE', '50'))
+
+# GitHub REST API base; point at `manage.py fake_github_api` to test offline
+GITHUB_API_URL = os.getenv('GITHUB_API_URL', 'https://api.github.com')
+# manage.py reconcile_runs: check dispatched builds older than MIN_AGE, fail ones missing after LOST_AFTER
+RECONCILE_MIN_AGE = int(os.getenv('RECONCILE_MIN_AGE', '600'))
+RECONCILE_LOST_AFTER = int(os.getenv('RECONCILE_LOST_AFTER', str(12 * 3600)))
+
+# Fair-share scheduling in front of dispatch: runners per platform, lane for startgh
+PLATFORM_CONCURRENCY = {
+    'windows': int(os.getenv('CONCURRENCY_WINDOWS', '20')),
+    'windows-x86': int(os.getenv('CONCURRENCY_WINDOWS_X86', '20')),
+    'linux': int(os.getenv('CONCURRENCY_LINUX', '20')),
+    'macos': int(os.getenv('CONCURRENCY_MACOS', '5')),
+    'android': int(os.getenv('CONCURRENCY_ANDROID', '20')),
+}
+DEFAULT_PLATFORM_CONCURRENCY = 20
+STARTGH_PRIORITY = int(os.getenv('STARTGH_PRIORITY', '10'))
+# Bulk API (api/bulk/): runs per call, and their lane (0 = same as the web form, shared fairly)
+BULK_MAX_BUILDS = int(os.getenv('BULK_MAX_BUILDS', '500'))
+BULK_BUILD_PRIORITY = int(os.getenv('BULK_BUILD_PRIORITY', '0'))
+BUILD_DURATION_ESTIMATE = int(os.getenv('BUILD_DURATION_ESTIMATE', str(25 * 60)))  # seconds, until there is history
+# Key fair-share lanes on the client address the front proxy appends to X-Forwarded-For.
+# Only set this to True behind a proxy: otherwise clients can pick their own address
+TRUST_X_FORWARDED_FOR = os.getenv('TRUST_X_FORWARDED_FOR', 'False') == 'True'
+
+# Identical submissions attach to an InProgress build younger than this (seconds)
+INFLIGHT_MAX_AGE = int(os.getenv('INFLIGHT_MAX_AGE', str(3 * 3600)))
+
+# manage.py prebuild_pool: keep the TOP_N most requested stock configurations per
+# platform built for the newest version (or PREBUILD_VERSIONS, comma-separated),
+# rebuilding after MAX_AGE seconds, within CI_MINUTES billable minutes per 24h
+PREBUILD_TOP_N = int(os.getenv('PREBUILD_TOP_N', '5'))
+PREBUILD_VERSIONS = [v for v in os.getenv('PREBUILD_VERSIONS', '').split(',') if v]
+PREBUILD_HISTORY_DAYS = int(os.getenv('PREBUILD_HISTORY_DAYS', '30'))
+PREBUILD_MAX_AGE = int(os.getenv('PREBUILD_MAX_AGE', str(7 * 86400)))
+PREBUILD_CI_MINUTES = float(os.getenv('PREBUILD_CI_MINUTES', '600'))
+PREBUILD_MAX_INFLIGHT = int(os.getenv('PREBUILD_MAX_INFLIGHT', '2'))
+# GitHub bills hosted runner minutes at these rates
+PREBUILD_MINUTE_MULTIPLIERS = {'linux': 1, 'android': 1, 'windows': 2, 'windows-x86': 2, 'macos': 10}
+
+# Per-request budget (seconds) shared by all outbound calls, and circuit
+# breakers per upstream ('github', 'upload'); state is shown in the admin
+REQUEST_DEADLINE = float(os.getenv('REQUEST_DEADLINE', '20'))
+# Budget for the generator form, which may push a custom client to the upload server
+UPLOAD_REQUEST_DEADLINE = float(os.getenv('UPLOAD_REQUEST_DEADLINE', '600'))
+BREAKER_WINDOW = int(os.getenv('BREAKER_WINDOW', '60'))
+BREAKER_MIN_CALLS = int(os.getenv('BREAKER_MIN_CALLS', '5'))
+BREAKER_FAILURE_RATE = float(os.getenv('BREAKER_FAILURE_RATE', '0.5'))
+BREAKER_SLOW_SECONDS = float(os.getenv('BREAKER_SLOW_SECONDS', '10'))
+BREAKER_COOLDOWN = int(os.getenv('BREAKER_COOLDOWN', '30'))
+
+# Background workflow dispatch (manage.py run_dispatcher)
+DISPATCH_CONCURRENCY = int(os.getenv('DISPATCH_CONCURRENCY', '4'))
+DISPATCH_MAX_ATTEMPTS = int(os.getenv('DISPATCH_MAX_ATTEMPTS', '6'))
+DISPATCH_BACKOFF_BASE = float(os.getenv('DISPATCH_BACKOFF_BASE', '5'))
+DISPATCH_BACKOFF_MAX = float(os.getenv('DISPATCH_BACKOFF_MAX', '600'))
+DISPATCH_LEASE_SECONDS = int(os.getenv('DISPATCH_LEASE_SECONDS', '120'))
+DISPATCH_TIMEOUT = (5, 30)  # (connect, read) seconds
+
+# Build status streams (Server-Sent Events, ASGI only)
+SSE_RECHECK_INTERVAL = int(os.getenv('SSE_RECHECK_INTERVAL', '15'))
+SSE_MAX_DURATION = int(os.getenv('SSE_MAX_DURATION', '300'))
+STATUS_API_MAX_UUIDS = int(os.getenv('STATUS_API_MAX_UUIDS', '200'))
+
+# Build status callbacks arriving within STATUS_BATCH_WINDOW seconds share one
+# transaction; each is acknowledged only once committed (0 writes each directly)
+STATUS_BATCH_WINDOW = float(os.getenv('STATUS_BATCH_WINDOW', '0.05'))
+
+# Artifact download offload to the front proxy: '' (serve from Django), 'nginx' or 'sendfile'.
+# nginx needs an internal location mapping the prefix onto the exe/ directory, e.g.
+#   location /_protected/ { internal; alias /opt/gdpro/exe/; }
+DOWNLOAD_OFFLOAD = os.getenv('DOWNLOAD_OFFLOAD', '')
+DOWNLOAD_ACCEL_PREFIX = os.getenv('DOWNLOAD_ACCEL_PREFIX', '/_protected/')
+
+# In-process LRU for icon/logo PNGs served by get_png
+PNG_CACHE_MAX_BYTES = int(os.getenv('PNG_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+PNG_CACHE_MAX_ITEM_BYTES = int(os.getenv('PNG_CACHE_MAX_ITEM_BYTES', str(2 * 1024 * 1024)))
+
+# Uploaded icon/logo processing (0 workers = convert in the request thread)
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', '2'))
+IMAGE_MAX_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', str(4096 * 4096)))
+IMAGE_TIMEOUT = int(os.getenv('IMAGE_TIMEOUT', '30'))
+
+# Resumable chunked artifact uploads (/upload/init|part|status|complete/)
+UPLOAD_PART_SIZE = int(os.getenv('UPLOAD_PART_SIZE', str(8 * 1024 * 1024)))
+UPLOAD_MAX_SIZE = int(os.getenv('UPLOAD_MAX_SIZE', str(2 * 1024 ** 3)))
+UPLOAD_SESSION_TTL = int(os.getenv('UPLOAD_SESSION_TTL', str(24 * 3600)))
+
+# Artifact retention (manage.py prune_artifacts [--loop SECONDS]); 0 disables a limit
+RETENTION_MAX_AGE_DAYS = float(os.getenv('RETENTION_MAX_AGE_DAYS', '30'))
+RETENTION_MAX_BYTES = os.getenv('RETENTION_MAX_BYTES', '0')  # e.g. 50G
+RETENTION_ORPHAN_GRACE = int(os.getenv('RETENTION_ORPHAN_GRACE', '3600'))
+
+# Content-addressed store for icons, logos and artifacts; keep it on the same
+# filesystem as exe/ and png/ so per-build paths can be hardlinks into it.
+BLOB_ROOT = os.getenv('BLOB_ROOT', str(BASE_DIR / 'blobs'))
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
@@ -83,6 +192,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'uigdpro.middleware.DeadlineMiddleware',
 ]
 
 ROOT_URLCONF = 'gdpro.urls'
@@ -109,10 +219,30 @@ WSGI_APPLICATION = 'gdpro.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# SQLite in WAL mode lets readers run alongside the single writer; writes
+# take the lock up front (IMMEDIATE) and wait up to SQLITE_TIMEOUT seconds
+# for it instead of failing with "database is locked". Connections are not
+# kept between requests: the web server runs under ASGI, where database work
+# happens in sync_to_async worker threads that Django never closes, so a
+# non-zero CONN_MAX_AGE would leak a connection per thread.
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '0')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': float(os.getenv('SQLITE_TIMEOUT', '20')),
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                f"PRAGMA synchronous={os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')};"
+                f"PRAGMA cache_size=-{int(os.getenv('SQLITE_CACHE_KB', '20000'))};"
+                'PRAGMA temp_store=MEMORY;'
+                f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_BYTES', str(128 * 1024 * 1024)))};"
+                'PRAGMA journal_size_limit=67108864;'
+            ),
+        },
     }
 }
 
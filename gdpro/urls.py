@@ -7,12 +7,21 @@ urlpatterns = [
     path('', views.generator_view, name='generator'),
     path('generator/', views.generator_view, name='generator_alias'), 
     path('check_for_file/', views.check_for_file, name='check_for_file'),
+    path('batch/', views.batch_view, name='batch'),
+    path('status_stream/', views.status_stream, name='status_stream'),
+    path('api/status/', views.build_status, name='build_status'),
     path('download/', views.download, name='download'), 
     path('creategh/', views.create_github_run, name='creategh'),
     path('updategh/', views.update_github_run, name='updategh'),
     path('startgh/', views.startgh, name='startgh'),
+    path('api/bulk/', views.bulk_build, name='bulk_build'),
+    path('api/batch/', views.batch_status, name='batch_status'),
     path('get_png/', views.get_png, name='get_png'),
     path('save_custom_client/', views.save_custom_client, name='save_custom_client'),
+    path('upload/init/', views.upload_init, name='upload_init'),
+    path('upload/part/', views.upload_part, name='upload_part'),
+    path('upload/status/', views.upload_status_view, name='upload_status'),
+    path('upload/complete/', views.upload_complete, name='upload_complete'),
    
     # Django Admin
     path('admin/', admin.site.urls),
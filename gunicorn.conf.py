@@ -1,9 +1,20 @@
 import os
 
 # Adjust these values as needed
-bind = "0.0.0.0:8000"  # Host and port for Gunicorn to listen on
-workers = 4  # The number of worker processes for concurrency (adjust based on system resources)
-activate_base = True  # Activate your virtual environment if applicable
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")  # Host and port for Gunicorn to listen on
+# Each worker is one asyncio event loop: idle waiting pages (SSE) cost a coroutine, not a
+# worker, so a few workers per host are enough; CPU-bound image work runs in IMAGE_WORKERS
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn_worker.UvicornWorker"
+# Seconds a worker may stay silent before the arbiter restarts it; streams send keep-alives
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+# Recycle workers now and then so slow leaks cannot accumulate
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "1000"))
+accesslog = "-"
+forwarded_allow_ips = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
 
-# Path to your Django project's main WSGI application file (usually manage.py)
-wsgi_app = "gdpro.wsgi.application"
+# Path to your Django project's ASGI application
+wsgi_app = "gdpro.asgi:application"
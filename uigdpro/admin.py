@@ -2,7 +2,8 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
-from .models import GithubRun
+from django.utils import timezone
+from .models import BuildBatch, GithubRun, UpstreamBreaker
 
 
 @admin.register(GithubRun)
@@ -16,18 +17,29 @@ class GithubRunAdmin(admin.ModelAdmin):
         'created_at',
         'download_link',
     )
-    list_filter = ('platform', 'status', 'direction', 'created_at')
+    list_filter = ('platform', 'status', 'dispatch_state', 'dispatch_target', 'direction', 'created_at')
     search_fields = ('uuid', 'filename')
-    readonly_fields = ('uuid', 'created_at', 'updated_at')
+    readonly_fields = (
+        'uuid', 'fingerprint', 'created_at', 'updated_at',
+        'workflow', 'dispatch_target', 'dispatch_payload', 'dispatch_attempts', 'dispatched_at', 'dispatch_error',
+        'last_downloaded_at', 'evicted_at', 'hits',
+    )
     ordering = ('-created_at',)
     date_hierarchy = 'created_at'
 
     fieldsets = (
         ('Build Info', {
-            'fields': ('uuid', 'filename', 'platform', 'direction')
+            'fields': ('uuid', 'filename', 'platform', 'direction', 'fingerprint')
         }),
         ('Status & Timing', {
-            'fields': ('status', 'created_at', 'updated_at')
+            'fields': ('status', 'created_at', 'updated_at', 'last_downloaded_at', 'evicted_at', 'hits')
+        }),
+        ('Dispatch', {
+            'classes': ('collapse',),
+            'fields': (
+                'dispatch_state', 'dispatch_target', 'workflow', 'dispatch_attempts', 'next_dispatch_at',
+                'dispatched_at', 'dispatch_error', 'dispatch_payload',
+            )
         }),
     )
 
@@ -54,6 +66,7 @@ class GithubRunAdmin(admin.ModelAdmin):
             'Success': '#4caf50',
             'Failed': '#f44336',
             'Cancelled': '#9e9e9e',
+            'Expired': '#795548',
         }
         color = colors.get(obj.status, '#666')
         return format_html(
@@ -80,9 +93,86 @@ class GithubRunAdmin(admin.ModelAdmin):
     #     return False
 
 
-    actions = ['mark_as_failed']
+    actions = ['mark_as_failed', 'requeue_dispatch']
 
     @admin.action(description="Mark selected runs as Failed")
     def mark_as_failed(self, request, queryset):
-        updated = queryset.update(status='Failed')
+        updated = queryset.update(status='Failed', inflight_key=None, updated_at=timezone.now())
         self.message_user(request, f"{updated} build(s) marked as Failed.")
+
+    @admin.action(description="Re-queue dispatch for selected runs")
+    def requeue_dispatch(self, request, queryset):
+        updated = queryset.exclude(dispatch_payload=None).update(
+            dispatch_state='Queued',
+            dispatch_attempts=0,
+            next_dispatch_at=timezone.now(),
+            status='InProgress',
+            inflight_key=None,
+            updated_at=timezone.now(),
+        )
+        self.message_user(request, f"{updated} build(s) re-queued for dispatch.")
+
+
+
+@admin.register(UpstreamBreaker)
+class UpstreamBreakerAdmin(admin.ModelAdmin):
+    list_display = (
+        'name',
+        'state_badge',
+        'window_calls',
+        'window_failures',
+        'window_slow',
+        'last_latency_ms',
+        'opened_at',
+        'last_failure_at',
+    )
+    readonly_fields = (
+        'name', 'state', 'window_started_at', 'window_calls', 'window_failures', 'window_slow',
+        'opened_at', 'last_failure_at', 'last_error', 'last_latency_ms', 'updated_at',
+    )
+    actions = ['reset_breaker']
+
+    def state_badge(self, obj):
+        colors = {
+            'Closed': '#4caf50',
+            'HalfOpen': '#ff9800',
+            'Open': '#f44336',
+        }
+        return format_html(
+            '<strong><span style="color: {};">●</span> {}</strong>',
+            colors.get(obj.state, '#666'),
+            obj.get_state_display()
+        )
+    state_badge.short_description = "State"
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description="Close selected circuits")
+    def reset_breaker(self, request, queryset):
+        updated = queryset.update(
+            state='Closed',
+            opened_at=None,
+            window_started_at=None,
+            window_calls=0,
+            window_failures=0,
+            window_slow=0,
+            updated_at=timezone.now(),
+        )
+        self.message_user(request, f"{updated} circuit(s) closed.")
+
+
+@admin.register(BuildBatch)
+class BuildBatchAdmin(admin.ModelAdmin):
+    list_display = ('batch_id', 'run_count', 'created_at')
+    search_fields = ('batch_id', 'runs__uuid')
+    readonly_fields = ('batch_id', 'client_key', 'idempotency_key', 'created_at')
+    filter_horizontal = ('runs',)
+    ordering = ('-created_at',)
+
+    def run_count(self, obj):
+        return obj.runs.count()
+    run_count.short_description = "Runs"
+
+    def has_add_permission(self, request):
+        return False
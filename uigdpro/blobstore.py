@@ -0,0 +1,140 @@
+import os
+import stat
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def blob_root() -> Path:
+    root = getattr(settings, 'BLOB_ROOT', None)
+    return Path(root) if root else Path(settings.BASE_DIR) / "blobs"
+
+
+def blob_path(digest: str) -> Path:
+    return blob_root() / digest[:2] / digest[2:]
+
+
+def staging_file(directory: Path | None = None):
+    """
+    Open a named temp file on the blob volume so it can later be renamed
+    into the store without copying. Returns (file object, Path).
+    """
+    directory = directory or blob_root() / "tmp"
+    directory.mkdir(parents=True, exist_ok=True)
+    fd, name = tempfile.mkstemp(dir=directory, prefix=".incoming-")
+    return os.fdopen(fd, "wb"), Path(name)
+
+
+def adopt(temp_path: Path, digest: str) -> Path:
+    """
+    Move a fully written temp file into the store under its SHA-256.
+    If the blob already exists the temp file is discarded.
+    """
+    target = blob_path(digest)
+    if touch(target):
+        temp_path.unlink(missing_ok=True)
+        return target
+    target.parent.mkdir(parents=True, exist_ok=True)
+    os.chmod(temp_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+    os.replace(temp_path, target)
+    return target
+
+
+def touch(path: Path) -> bool:
+    """
+    Mark an existing blob as just used so the orphan collector leaves it
+    alone until the caller has linked it. Returns False if there is no
+    such blob.
+
+    Only the ctime moves: the times are rewritten with their own values.
+    The mtime is shared by every hardlink and feeds the download ETag and
+    Last-Modified, which must not change while the bytes don't.
+    """
+    try:
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def store_bytes(data: bytes) -> str:
+    digest = hashlib.sha256(data).hexdigest()
+    if touch(blob_path(digest)):
+        return digest
+    f, temp_path = staging_file()
+    try:
+        with f:
+            f.write(data)
+        adopt(temp_path, digest)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+    return digest
+
+
+def link_blob(digest: str, dest: Path) -> None:
+    """
+    Make `dest` refer to a stored blob: a hardlink when the blob store and
+    destination share a filesystem, a plain copy otherwise. Replaces any
+    existing file at `dest` atomically.
+    """
+    source = blob_path(digest)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    temp_dest = dest.with_name(f".{dest.name}.{os.urandom(4).hex()}.tmp")
+    try:
+        os.link(source, temp_dest)
+    except OSError as e:
+        logger.warning(f"Hardlink into {dest.parent} failed ({e}); copying blob {digest[:12]}")
+        # Link counts no longer tell which blobs are in use; see orphaned_blobs
+        copies_marker().touch()
+        shutil.copyfile(source, temp_dest)
+    os.replace(temp_dest, dest)
+
+
+def write_bytes(dest: Path, data: bytes) -> str:
+    """
+    Store `data` content-addressed and expose it at `dest`. Returns the digest.
+    """
+    digest = store_bytes(data)
+    link_blob(digest, dest)
+    return digest
+
+
+def copies_marker() -> Path:
+    return blob_root() / ".copied"
+
+
+def orphaned_blobs(grace: float = 3600):
+    """
+    Yield (path, size) for blobs no per-UUID path links to any more and
+    that nothing stored, touched, linked or unlinked in the last `grace`
+    seconds (so a blob between store_bytes and link_blob is safe). Yields
+    nothing once any link had to fall back to a copy, since st_nlink then
+    undercounts references.
+    """
+    root = blob_root()
+    if not root.is_dir():
+        return
+    if copies_marker().exists():
+        logger.warning(f"Blobs under {root} were copied rather than hardlinked; skipping orphan collection")
+        return
+    cutoff = time.time() - grace
+    for shard in root.iterdir():
+        if not shard.is_dir() or shard.name == "tmp":
+            continue
+        for blob in shard.iterdir():
+            try:
+                st = blob.stat()
+            except OSError:
+                continue
+            # ctime moves whenever a link to the blob is added or removed
+            if st.st_nlink <= 1 and max(st.st_mtime, st.st_ctime) < cutoff:
+                yield blob, st.st_size
@@ -0,0 +1,178 @@
+import time
+import logging
+import threading
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+
+from .models import UpstreamBreaker
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamUnavailable(requests.ConnectionError):
+    """
+    Raised instead of calling an upstream whose breaker is open. Subclasses
+    ConnectionError so existing `except requests.RequestException` paths
+    treat it like a refused connection.
+    """
+
+    def __init__(self, upstream: str, retry_after: float):
+        super().__init__(f"{upstream} is unavailable (circuit open, retry in {retry_after:.0f}s)")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+def _config(name: str, default):
+    return getattr(settings, f'BREAKER_{name}', default)
+
+
+class _Window:
+    """Call outcomes of one upstream in the current rolling window, per process."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.calls = self.failures = self.slow = 0
+
+
+# Window counters live in process memory; only state changes hit the database
+_windows: dict[str, _Window] = {}
+# name -> (breaker row, monotonic time read), so Closed calls skip the query too
+_cached: dict[str, tuple[UpstreamBreaker, float]] = {}
+_lock = threading.Lock()
+
+# Seconds a Closed breaker's row is trusted before re-reading it
+STATE_TTL = 1.0
+
+
+def get_breaker(name: str) -> UpstreamBreaker:
+    """
+    The breaker row; a Closed one is reused for STATE_TTL seconds, anything
+    else is always re-read.
+    """
+    with _lock:
+        cached = _cached.get(name)
+    if cached and cached[0].state == 'Closed' and time.monotonic() - cached[1] < STATE_TTL:
+        return cached[0]
+    breaker, _ = UpstreamBreaker.objects.get_or_create(name=name)
+    with _lock:
+        _cached[name] = (breaker, time.monotonic())
+    return breaker
+
+
+def _forget(name: str) -> None:
+    with _lock:
+        _cached.pop(name, None)
+
+
+def retry_after(breaker: UpstreamBreaker) -> float:
+    if breaker.state == 'Closed' or not breaker.opened_at:
+        return 0
+    reopen = breaker.opened_at + timedelta(seconds=_config('COOLDOWN', 30))
+    return max((reopen - timezone.now()).total_seconds(), 0)
+
+
+def is_available(name: str) -> bool:
+    """
+    Whether a call to `name` would be let through right now (no state change).
+    """
+    breaker = get_breaker(name)
+    return breaker.state == 'Closed' or retry_after(breaker) <= 0
+
+
+def acquire(name: str) -> None:
+    """
+    Let a call through or raise UpstreamUnavailable. Once the cooldown has
+    passed, exactly one caller wins the half-open probe; the rest keep
+    failing fast until the probe reports back (or its own cooldown lapses).
+    """
+    breaker = get_breaker(name)
+    if breaker.state == 'Closed':
+        return
+    wait = retry_after(breaker)
+    if wait > 0:
+        raise UpstreamUnavailable(name, wait)
+    now = timezone.now()
+    won = UpstreamBreaker.objects.filter(
+        pk=breaker.pk, state=breaker.state, opened_at=breaker.opened_at
+    ).update(state='HalfOpen', opened_at=now, updated_at=now)
+    _forget(name)
+    if not won:
+        raise UpstreamUnavailable(name, _config('COOLDOWN', 30))
+
+
+def _count(name: str, ok: bool, slow: bool) -> tuple[float, int, int, int]:
+    """
+    Add one outcome to the process-local window; returns (started, calls, failures, slow).
+    """
+    with _lock:
+        window = _windows.get(name)
+        if window is None or time.monotonic() - window.started > _config('WINDOW', 60):
+            window = _windows[name] = _Window()
+        window.calls += 1
+        window.failures += 0 if ok else 1
+        window.slow += int(slow)
+        return window.started, window.calls, window.failures, window.slow
+
+
+def record(name: str, ok: bool, latency: float, error: str = '') -> None:
+    """
+    Report the outcome of one call. Closed breakers trip when, within this
+    process's rolling window, enough calls failed or were slower than
+    BREAKER_SLOW_SECONDS; the Open state is then shared through the database.
+    Only the half-open probe moves a tripped breaker: it closes it on success
+    and reopens it on failure. Results of calls that were already in flight
+    when the breaker tripped are ignored. Only these transitions are
+    written; counting calls is in memory.
+    """
+    slow = latency > _config('SLOW_SECONDS', 10)
+    latency_ms = int(latency * 1000)
+    breaker = get_breaker(name)
+    if breaker.state == 'Open':
+        # A call that started before the breaker tripped; it proves nothing now
+        return
+    if breaker.state == 'HalfOpen':
+        now = timezone.now()
+        if breaker.opened_at and now - timedelta(seconds=latency) < breaker.opened_at:
+            # Started before the probe was let through, so it isn't the probe
+            return
+        if ok and not slow:
+            closed = UpstreamBreaker.objects.filter(pk=breaker.pk, state='HalfOpen').update(
+                state='Closed', opened_at=None, window_started_at=now,
+                window_calls=0, window_failures=0, window_slow=0,
+                last_latency_ms=latency_ms, updated_at=now,
+            )
+            with _lock:
+                _windows.pop(name, None)
+            if closed:
+                logger.info(f"Circuit for {name} closed")
+        else:
+            reopened = UpstreamBreaker.objects.filter(pk=breaker.pk, state='HalfOpen').update(
+                state='Open', opened_at=now, last_failure_at=now,
+                last_error=error[:1000], last_latency_ms=latency_ms, updated_at=now,
+            )
+            if reopened:
+                logger.warning(f"Circuit for {name} re-opened: {error or 'slow response'}")
+        _forget(name)
+        return
+
+    started, calls, failures, slow_calls = _count(name, ok, slow)
+    if ok and not slow:
+        return
+    bad = failures + slow_calls
+    if calls < _config('MIN_CALLS', 5) or bad / calls < _config('FAILURE_RATE', 0.5):
+        return
+    now = timezone.now()
+    # The window snapshot is kept on the row for the admin
+    tripped = UpstreamBreaker.objects.filter(pk=breaker.pk, state='Closed').update(
+        state='Open', opened_at=now, last_failure_at=now, last_error=error[:1000],
+        last_latency_ms=latency_ms, window_started_at=now - timedelta(seconds=time.monotonic() - started),
+        window_calls=calls, window_failures=failures, window_slow=slow_calls, updated_at=now,
+    )
+    _forget(name)
+    with _lock:
+        _windows.pop(name, None)
+    if tripped:
+        logger.error(f"Circuit for {name} opened: {bad}/{calls} bad calls, last error: {error or 'slow response'}")
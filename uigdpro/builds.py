@@ -0,0 +1,171 @@
+import re
+import json
+import base64
+
+from django.conf import settings
+
+
+def sanitize_filename(filename: str) -> str:
+    if filename and all(c.isascii() for c in filename):
+        filename = re.sub(r'[^\w\s\-]', '_', filename).strip().replace(' ', '_')
+        if not filename:
+            filename = "rustdesk"
+    else:
+        filename = "rustdesk"
+    return filename
+
+
+def build_dispatch_data(cd: dict, platform: str, myuuid: str, iconlink: str | None,
+                        logolink: str | None) -> tuple[str, dict]:
+    """
+    Turn validated GenerateForm data into the workflow_dispatch body for one
+    platform. Returns (sanitized filename, body); custom_file_url is left
+    empty for the caller to fill in after uploading.
+    """
+    delayFix = cd['delayFix']
+    version = cd['version']
+    cycleMonitor = cd['cycleMonitor']
+    xOffline = cd['xOffline']
+    hidecm = cd['hidecm']
+    removeNewVersionNotif = cd['removeNewVersionNotif']
+    hidePassword = cd['hidePassword']
+    hideMenuBar = cd['hideMenuBar']
+    removeTopNotice = cd['removeTopNotice']
+    password_security_length = cd['password_security_length']
+    server = cd['serverIP'] or 'rs-ny.rustdesk.com'
+    key = cd['key'] or 'OeVuKk5nlHiXp+APNn0Y3pC1Iwpwn44JGqrQCsWqmBw='
+    apiServer = cd['apiServer'] or f"{server}:21114"
+    urlLink = cd['urlLink'] or "https://rustdesk.com"
+    downloadLink = cd['downloadLink'] or "https://rustdesk.com/download"
+    direction = cd['direction']
+    installation = cd['installation']
+    settings_flag = cd['settings']
+    appname = cd['appname']
+    filename = sanitize_filename(cd['exename'])
+    compname = (cd['compname'] or "Purslane Ltd").replace("&", "\\&")
+    permPass = cd['permanentPassword']
+    theme = cd['theme']
+    themeDorO = cd['themeDorO']
+    passApproveMode = cd['passApproveMode']
+    denyLan = cd['denyLan']
+    enableDirectIP = cd['enableDirectIP']
+    autoClose = cd['autoClose']
+    permissionsDorO = cd['permissionsDorO']
+    permissionsType = cd['permissionsType']
+
+    # Boolean flags
+    bool_flags = {
+        'enableKeyboard': cd['enableKeyboard'],
+        'enableClipboard': cd['enableClipboard'],
+        'enableFileTransfer': cd['enableFileTransfer'],
+        'enableAudio': cd['enableAudio'],
+        'enableTCP': cd['enableTCP'],
+        'enableRemoteRestart': cd['enableRemoteRestart'],
+        'enableRecording': cd['enableRecording'],
+        'enableBlockingInput': cd['enableBlockingInput'],
+        'enableRemoteModi': cd['enableRemoteModi'],
+        'removeWallpaper': cd['removeWallpaper'],
+        'enablePrinter': cd['enablePrinter'],
+        'enableCamera': cd['enableCamera'],
+        'enableTerminal': cd['enableTerminal'],
+    }
+
+    # Sanitize appname
+    if not appname or not all(c.isascii() for c in appname):
+        appname = "rustdesk"
+
+    # Build custom config
+    decodedCustom = {}
+    decodedCustom['conn-type'] = direction
+    if installation == "installationN":
+        decodedCustom['disable-installation'] = 'Y'
+    if settings_flag == "settingsN":
+        decodedCustom['disable-settings'] = 'Y'
+    if appname.lower() != "rustdesk":
+        decodedCustom['app-name'] = appname
+
+    decodedCustom['override-settings'] = {}
+    decodedCustom['default-settings'] = {}
+
+    if permPass:
+        decodedCustom['password'] = permPass
+
+    # Theme handling
+    if theme != "system":
+        target = decodedCustom['default-settings'] if themeDorO == "default" else decodedCustom['override-settings']
+        if platform == "windows-x86":
+            target['allow-darktheme'] = 'Y' if theme == "dark" else 'N'
+        else:
+            target['theme'] = theme
+
+    decodedCustom['enable-lan-discovery'] = 'N' if denyLan else 'Y'
+    decodedCustom['allow-auto-disconnect'] = 'Y' if autoClose else 'N'
+
+    # Permissions
+    target_perm = decodedCustom['default-settings'] if permissionsDorO == "default" else decodedCustom['override-settings']
+    target_perm.update({
+        'access-mode': permissionsType,
+        'verification-method': 'use-permanent-password' if hidecm else 'use-both-passwords',
+        'approve-mode': passApproveMode,
+        'allow-hide-cm': 'Y' if hidecm else 'N',
+        'allow-remove-wallpaper': 'Y' if cd['removeWallpaper'] else 'N',
+        'direct-server': 'Y' if enableDirectIP else 'N',
+    })
+    for key_name, value in bool_flags.items():
+        target_perm[key_name] = 'Y' if value else 'N'
+
+    # Manual overrides
+    for line in (cd.get('defaultManual') or '').splitlines():
+        if '=' in line:
+            k, v = line.split('=', 1)
+            decodedCustom['default-settings'][k.strip()] = v.strip()
+    for line in (cd.get('overrideManual') or '').splitlines():
+        if '=' in line:
+            k, v = line.split('=', 1)
+            decodedCustom['override-settings'][k.strip()] = v.strip()
+
+    # Encode custom config
+    custom_json = json.dumps(decodedCustom)
+    encodedCustom = base64.b64encode(custom_json.encode("ascii")).decode("ascii")
+
+    # Extras
+    extras = {
+        'genurl': getattr(settings, 'GENURL', ''),
+        'urlLink': urlLink,
+        'downloadLink': downloadLink,
+        'delayFix': delayFix,
+        'version': version,
+        'gdpro': "true",
+        'cycleMonitor': cycleMonitor,
+        'xOffline': xOffline,
+        'removeNewVersionNotif': removeNewVersionNotif,
+        'hidePassword': hidePassword,
+        'hideMenuBar': hideMenuBar,
+        'removeTopNotice': removeTopNotice,
+        'password_security_length': password_security_length,
+        'compname': compname,
+        'upload_token': getattr(settings, 'GH_UPLOAD_TOKEN', ''),
+    }
+    extra_input = json.dumps(extras)
+
+    # Prepare GitHub Action payload
+    data = {
+        "ref": "master",
+        "inputs": {
+            "server": server,
+            "key": key,
+            "apiServer": apiServer,
+            "custom": encodedCustom,
+            "uuid": myuuid,
+            "iconlink": iconlink or "null",
+            "logolink": logolink or "null",
+            "appname": appname,
+            "extras": extra_input,
+            "filename": filename,
+            "upload_token": getattr(settings, 'GH_UPLOAD_TOKEN', ''),
+            "custom_file_url": "",
+            "custom_target_path": cd.get('custom_target_path') or "",
+        }
+    }
+    return filename, data
+
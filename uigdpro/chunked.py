@@ -0,0 +1,232 @@
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import logging
+from pathlib import Path
+
+from django.conf import settings
+
+from . import blobstore
+
+logger = logging.getLogger(__name__)
+
+MIN_PART_SIZE = 1024 * 1024
+MAX_PART_SIZE = 64 * 1024 * 1024
+COPY_CHUNK = 1024 * 1024
+
+
+class ChunkedUploadError(ValueError):
+    """Raised when a chunked upload request can't be honoured; carries an HTTP status."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def uploads_root() -> Path:
+    return blobstore.blob_root() / "tmp" / "uploads"
+
+
+def session_dir(uuid_str: str, filename: str) -> Path:
+    """
+    uploads_root()/<uuid>/<filename>, refusing anything that would resolve
+    elsewhere ('.', '..', separators): completing a session deletes it.
+    """
+    root = uploads_root().resolve()
+    directory = (root / uuid_str / filename).resolve()
+    if directory.parent.parent != root or directory.parent.name != uuid_str or directory.name != filename:
+        raise ChunkedUploadError("Invalid upload path")
+    return directory
+
+
+def _write_json(path: Path, data: dict) -> None:
+    temp = path.with_name(f".{path.name}.{os.urandom(4).hex()}.tmp")
+    temp.write_text(json.dumps(data))
+    os.replace(temp, path)
+
+
+def load_manifest(uuid_str: str, filename: str) -> dict:
+    path = session_dir(uuid_str, filename) / "manifest.json"
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        raise ChunkedUploadError("Unknown upload, call init first", status=404)
+
+
+def part_count(manifest: dict) -> int:
+    return max(1, -(-manifest["size"] // manifest["part_size"]))
+
+
+def part_length(manifest: dict, index: int) -> int:
+    start = index * manifest["part_size"]
+    return max(0, min(manifest["part_size"], manifest["size"] - start))
+
+
+def committed_parts(uuid_str: str, filename: str) -> list[int]:
+    parts_dir = session_dir(uuid_str, filename) / "parts"
+    try:
+        return sorted(int(p.name) for p in parts_dir.iterdir() if p.name.isdigit())
+    except OSError:
+        return []
+
+
+def upload_status(uuid_str: str, filename: str) -> dict:
+    """
+    Parts already committed and the contiguous offset a sequential client
+    can resume from.
+    """
+    manifest = load_manifest(uuid_str, filename)
+    committed = committed_parts(uuid_str, filename)
+    offset = 0
+    done = set(committed)
+    for index in range(part_count(manifest)):
+        if index not in done:
+            break
+        offset += part_length(manifest, index)
+    return {
+        "uuid": uuid_str,
+        "filename": filename,
+        "size": manifest["size"],
+        "sha256": manifest["sha256"],
+        "part_size": manifest["part_size"],
+        "parts": part_count(manifest),
+        "committed": committed,
+        "committed_offset": offset,
+    }
+
+
+def init_upload(uuid_str: str, filename: str, size: int, sha256: str, part_size: int | None = None) -> dict:
+    """
+    Start (or resume) the upload of `filename` for build `uuid_str`. Calling
+    init again with the same size and hash keeps the parts already sent;
+    anything else restarts the upload.
+    """
+    max_size = getattr(settings, 'UPLOAD_MAX_SIZE', 2 * 1024 ** 3)
+    if size < 0 or size > max_size:
+        raise ChunkedUploadError(f"Size must be between 0 and {max_size} bytes", status=413 if size > 0 else 400)
+    if not re.fullmatch(r'[0-9a-f]{64}', sha256 or ''):
+        raise ChunkedUploadError("sha256 must be 64 lowercase hex characters")
+    part_size = part_size or getattr(settings, 'UPLOAD_PART_SIZE', 8 * 1024 * 1024)
+    part_size = min(max(part_size, MIN_PART_SIZE), MAX_PART_SIZE)
+
+    directory = session_dir(uuid_str, filename)
+    try:
+        manifest = load_manifest(uuid_str, filename)
+    except ChunkedUploadError:
+        manifest = None
+    if manifest and manifest["size"] == size and manifest["sha256"] == sha256:
+        return upload_status(uuid_str, filename)
+
+    if manifest:
+        logger.info(f"Restarting chunked upload of {uuid_str}/{filename}: size or hash changed")
+        shutil.rmtree(directory, ignore_errors=True)
+    (directory / "parts").mkdir(parents=True, exist_ok=True)
+    # Parts are written in place at their offsets, so the finished file never has to be reassembled.
+    fd = os.open(directory / "data", os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        os.ftruncate(fd, size)
+    finally:
+        os.close(fd)
+    _write_json(directory / "manifest.json", {"size": size, "sha256": sha256, "part_size": part_size})
+    return upload_status(uuid_str, filename)
+
+
+def write_part(uuid_str: str, filename: str, index: int, stream, length: int,
+               part_sha256: str | None = None) -> dict:
+    """
+    Write one part from `stream` (the request body) at its offset in the data
+    file. Parts may arrive in any order and in parallel; re-sending a part
+    overwrites it. The part is only marked committed after fsync.
+    """
+    manifest = load_manifest(uuid_str, filename)
+    if not 0 <= index < part_count(manifest):
+        raise ChunkedUploadError(f"Part must be between 0 and {part_count(manifest) - 1}")
+    expected = part_length(manifest, index)
+    if length != expected:
+        raise ChunkedUploadError(f"Part {index} must be exactly {expected} bytes, got {length}")
+
+    directory = session_dir(uuid_str, filename)
+    digest = hashlib.sha256()
+    offset = index * manifest["part_size"]
+    received = 0
+    try:
+        fd = os.open(directory / "data", os.O_WRONLY)
+    except OSError:
+        raise ChunkedUploadError("Upload is no longer open", status=409)
+    try:
+        while received < expected:
+            chunk = stream.read(min(COPY_CHUNK, expected - received))
+            if not chunk:
+                break
+            digest.update(chunk)
+            os.pwrite(fd, chunk, offset + received)
+            received += len(chunk)
+        if received != expected:
+            raise ChunkedUploadError(f"Part {index} truncated: {received} of {expected} bytes")
+        if part_sha256 and part_sha256.lower() != digest.hexdigest():
+            raise ChunkedUploadError(f"Part {index} checksum mismatch", status=422)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    _write_json(directory / "parts" / str(index), {"sha256": digest.hexdigest(), "at": time.time()})
+    return {"part": index, "sha256": digest.hexdigest(), "size": received}
+
+
+def complete_upload(uuid_str: str, filename: str) -> tuple[str, int]:
+    """
+    Verify that every part arrived and that the assembled file matches the
+    declared SHA-256, then move it into the blob store. Returns (digest, size).
+    """
+    manifest = load_manifest(uuid_str, filename)
+    missing = sorted(set(range(part_count(manifest))) - set(committed_parts(uuid_str, filename)))
+    if missing:
+        raise ChunkedUploadError(f"Missing parts: {missing[:20]}", status=409)
+
+    directory = session_dir(uuid_str, filename)
+    data_path = directory / "data"
+    digest = hashlib.sha256()
+    try:
+        with open(data_path, "rb") as f:
+            for chunk in iter(lambda: f.read(COPY_CHUNK), b""):
+                digest.update(chunk)
+    except OSError:
+        raise ChunkedUploadError("Upload is no longer open", status=409)
+    if digest.hexdigest() != manifest["sha256"]:
+        # Keep the session so the client can re-send parts and retry
+        raise ChunkedUploadError("Assembled file does not match sha256", status=422)
+
+    blobstore.adopt(data_path, manifest["sha256"])
+    shutil.rmtree(directory, ignore_errors=True)
+    try:
+        directory.parent.rmdir()
+    except OSError:
+        pass
+    return manifest["sha256"], manifest["size"]
+
+
+def expire_sessions(max_age: float) -> int:
+    """
+    Remove upload sessions untouched for `max_age` seconds. Returns how many.
+    """
+    root = uploads_root()
+    if not root.is_dir():
+        return 0
+    cutoff = time.time() - max_age
+    expired = 0
+    for uuid_dir in root.iterdir():
+        for directory in list(uuid_dir.iterdir()) if uuid_dir.is_dir() else []:
+            try:
+                latest = max(p.stat().st_mtime for p in directory.rglob("*"))
+            except (OSError, ValueError):
+                latest = 0
+            if latest < cutoff:
+                shutil.rmtree(directory, ignore_errors=True)
+                expired += 1
+        try:
+            uuid_dir.rmdir()
+        except OSError:
+            pass
+    return expired
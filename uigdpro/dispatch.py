@@ -0,0 +1,219 @@
+import json
+import random
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from . import outbound, scheduler, targets
+from .models import GithubRun
+
+logger = logging.getLogger(__name__)
+
+WORKFLOW_MAP = {
+    'windows-x86': 'generator-windows-x86.yml',
+    'windows': 'generator-windows.yml',
+    'linux': 'generator-linux.yml',
+    'android': 'generator-android.yml',
+    'macos': 'generator-macos.yml',
+}
+
+# HTTP statuses worth retrying; anything else outside 2xx is a permanent failure.
+# A 403 is only retried when GitHub says it is a rate limit (see is_retryable).
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+def workflow_for(platform: str) -> str:
+    return WORKFLOW_MAP.get(platform, 'generator-windows.yml')
+
+
+def api_url() -> str:
+    return getattr(settings, 'GITHUB_API_URL', 'https://api.github.com').rstrip('/')
+
+
+def dispatch_url(workflow_file: str, target: dict | None = None) -> str:
+    target = target or targets.configured_targets()[0]
+    return f"{api_url()}/repos/{target['owner']}/{target['repo']}/actions/workflows/{workflow_file}/dispatches"
+
+
+def github_headers(target: dict | None = None) -> dict:
+    target = target or targets.configured_targets()[0]
+    return {
+        'Accept': 'application/vnd.github+json',
+        'Content-Type': 'application/json',
+        'Authorization': f'Bearer {target["token"]}',
+        'X-GitHub-Api-Version': '2022-11-28'
+    }
+
+
+def strip_secrets(data: dict) -> dict:
+    """
+    Copy of a dispatch body with the upload token removed, safe to persist.
+    """
+    data = json.loads(json.dumps(data))
+    inputs = data.get("inputs", {})
+    inputs.pop("upload_token", None)
+    if isinstance(inputs.get("extras"), str):
+        extras = json.loads(inputs["extras"])
+        extras.pop("upload_token", None)
+        inputs["extras"] = json.dumps(extras)
+    return data
+
+
+def with_secrets(data: dict) -> dict:
+    data = json.loads(json.dumps(data))
+    token = getattr(settings, 'GH_UPLOAD_TOKEN', '') or ''
+    inputs = data.setdefault("inputs", {})
+    if "uuid" in inputs:
+        inputs["upload_token"] = token
+    if isinstance(inputs.get("extras"), str):
+        extras = json.loads(inputs["extras"])
+        extras["upload_token"] = token
+        inputs["extras"] = json.dumps(extras)
+    return data
+
+
+def enqueue_dispatch(run: GithubRun, workflow_file: str, data: dict) -> GithubRun:
+    """
+    Attach a workflow_dispatch body to a run and mark it for the dispatcher.
+    The caller is expected to save the run.
+    """
+    run.workflow = workflow_file
+    run.dispatch_payload = strip_secrets(data)
+    run.dispatch_state = 'Queued'
+    run.dispatch_attempts = 0
+    run.next_dispatch_at = timezone.now()
+    return run
+
+
+def backoff_delay(attempts: int) -> float:
+    base = getattr(settings, 'DISPATCH_BACKOFF_BASE', 5)
+    cap = getattr(settings, 'DISPATCH_BACKOFF_MAX', 600)
+    delay = min(cap, base * (2 ** max(attempts - 1, 0)))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def is_retryable(response) -> bool:
+    """
+    Whether a failed dispatch response is transient. GitHub answers both
+    rate limits and missing permissions with 403; only the former is
+    worth retrying.
+    """
+    if response.status_code == 403:
+        return response.headers.get('X-RateLimit-Remaining') == '0' or 'Retry-After' in response.headers
+    return response.status_code in RETRYABLE_STATUS
+
+
+def claim_due_runs(limit: int) -> list[GithubRun]:
+    """
+    Lease up to `limit` due runs, chosen by the fair-share scheduler. A
+    conditional UPDATE makes the claim safe when several dispatcher
+    processes share the database; a run whose lease expires while Sending
+    (crashed worker) becomes due again.
+    """
+    now = timezone.now()
+    lease = timedelta(seconds=getattr(settings, 'DISPATCH_LEASE_SECONDS', 120))
+    claimed = []
+    for row in scheduler.pick_due(limit):
+        pk, attempts = row['id'], row['dispatch_attempts']
+        updated = GithubRun.objects.filter(
+            pk=pk, dispatch_attempts=attempts, dispatch_state__in=['Queued', 'Sending']
+        ).update(
+            dispatch_state='Sending',
+            dispatch_attempts=attempts + 1,
+            next_dispatch_at=now + lease,
+            updated_at=now,
+        )
+        if updated:
+            claimed.append(GithubRun.objects.get(pk=pk))
+    return claimed
+
+
+def send_dispatch(run: GithubRun, target: dict | None) -> None:
+    """
+    POST one queued workflow_dispatch to `target` and record the outcome on
+    the run. Without a target the run goes back to the queue.
+    """
+    max_attempts = getattr(settings, 'DISPATCH_MAX_ATTEMPTS', 6)
+    timeout = getattr(settings, 'DISPATCH_TIMEOUT', (5, 30))
+    if target is None:
+        # Every target is saturated, rate limited or open; wait without spending an attempt
+        GithubRun.objects.filter(pk=run.pk).update(
+            dispatch_state='Queued',
+            dispatch_attempts=F('dispatch_attempts') - 1,
+            next_dispatch_at=timezone.now() + timedelta(seconds=getattr(settings, 'DISPATCH_BACKOFF_BASE', 5)),
+            updated_at=timezone.now(),
+        )
+        return
+
+    error = ''
+    retryable = True
+    try:
+        response = outbound.post(
+            dispatch_url(run.workflow, target),
+            upstream=targets.breaker_name(target),
+            json=with_secrets(run.dispatch_payload or {}),
+            headers=github_headers(target),
+            timeout=timeout,
+        )
+        targets.note_rate_limit(target, response)
+        logger.info(f"GitHub Action trigger: {response.status_code} for {run.uuid} on {target['name']} (attempt {run.dispatch_attempts})")
+        if response.status_code == 204:
+            GithubRun.objects.filter(pk=run.pk).update(
+                dispatch_target=target['name'],
+                dispatch_state='Dispatched',
+                dispatched_at=timezone.now(),
+                updated_at=timezone.now(),
+                next_dispatch_at=None,
+                dispatch_error='',
+            )
+            return
+        error = f"HTTP {response.status_code}: {response.text[:500]}"
+        retryable = is_retryable(response)
+    except (requests.RequestException, outbound.DeadlineExceeded) as e:
+        error = f"{type(e).__name__}: {e}"
+
+    if retryable and run.dispatch_attempts < max_attempts:
+        delay = backoff_delay(run.dispatch_attempts)
+        logger.warning(f"Dispatch of {run.uuid} failed ({error}); retrying in {delay:.0f}s")
+        GithubRun.objects.filter(pk=run.pk).update(
+            dispatch_state='Queued',
+            next_dispatch_at=timezone.now() + timedelta(seconds=delay),
+            dispatch_error=error,
+            updated_at=timezone.now(),
+        )
+    else:
+        logger.error(f"Dispatch of {run.uuid} failed permanently: {error}")
+        GithubRun.objects.filter(pk=run.pk).update(
+            dispatch_state='Failed',
+            status='Failed',
+            inflight_key=None,
+            next_dispatch_at=None,
+            dispatch_error=error,
+            updated_at=timezone.now(),
+        )
+
+
+def process_queue(executor: ThreadPoolExecutor, concurrency: int) -> int:
+    """
+    Send one batch of due dispatches with at most `concurrency` in flight.
+    Returns the number of runs processed. Nothing is claimed while no
+    dispatch target can take work (all circuits open, rate limited or
+    full), so queued builds wait instead of burning retries.
+    """
+    if not targets.available_targets():
+        return 0
+    runs = claim_due_runs(concurrency)
+    if runs:
+        # Targets are picked up front, not by the concurrent senders, and
+        # recorded on the leased rows so other dispatchers count them as running
+        picks = targets.choose_targets(len(runs))
+        for run, target in zip(runs, picks):
+            if target is not None:
+                GithubRun.objects.filter(pk=run.pk, dispatch_state='Sending').update(dispatch_target=target['name'])
+        list(executor.map(send_dispatch, runs, picks))
+    return len(runs)
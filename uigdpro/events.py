@@ -0,0 +1,46 @@
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# uuid -> set of (event loop, asyncio.Event) pairs waiting on that build
+_subscribers: dict[str, set] = {}
+_lock = threading.Lock()
+
+
+def publish(uuid_str: str) -> None:
+    """
+    Wake every status stream in this process that is waiting on `uuid_str`.
+    Safe to call from sync views running in worker threads.
+    Streams in other processes pick the change up on their next recheck.
+    """
+    with _lock:
+        waiters = list(_subscribers.get(uuid_str, ()))
+    for loop, event in waiters:
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            # Loop already closed; the stream is gone.
+            pass
+
+
+@contextmanager
+def subscribe(uuid_str: str):
+    """
+    Register an asyncio.Event that is set whenever `uuid_str` is published.
+    Must be entered from inside a running event loop.
+    """
+    entry = (asyncio.get_running_loop(), asyncio.Event())
+    with _lock:
+        _subscribers.setdefault(uuid_str, set()).add(entry)
+    try:
+        yield entry[1]
+    finally:
+        with _lock:
+            waiters = _subscribers.get(uuid_str)
+            if waiters is not None:
+                waiters.discard(entry)
+                if not waiters:
+                    del _subscribers[uuid_str]
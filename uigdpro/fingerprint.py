@@ -0,0 +1,113 @@
+import base64
+import hashlib
+import json
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import GithubRun
+
+# Inputs that differ on every submission without changing the build output.
+VOLATILE_INPUTS = {"uuid", "iconlink", "logolink", "upload_token", "custom_file_url"}
+VOLATILE_EXTRAS = {"upload_token"}
+
+
+def sha256_file(file_obj) -> str:
+    """
+    Hash an UploadedFile (or any object with .chunks()) without loading it into memory.
+    The file is rewound afterwards so it can still be uploaded.
+    """
+    digest = hashlib.sha256()
+    for chunk in file_obj.chunks():
+        digest.update(chunk)
+    if hasattr(file_obj, "seek"):
+        file_obj.seek(0)
+    return digest.hexdigest()
+
+
+def sha256_path(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def compute_fingerprint(platform: str, inputs: dict, blobs: dict) -> str:
+    """
+    Canonical SHA-256 over everything that determines the built artifacts:
+    the target platform, the dispatch inputs (minus per-request values) and
+    the content hashes of attached files (icon, logo, custom file).
+    """
+    stable_inputs = {k: v for k, v in inputs.items() if k not in VOLATILE_INPUTS}
+    extras = stable_inputs.get("extras")
+    if isinstance(extras, str):
+        try:
+            extras = json.loads(extras)
+        except ValueError:
+            extras = None
+    if isinstance(extras, dict):
+        stable_inputs["extras"] = {k: v for k, v in extras.items() if k not in VOLATILE_EXTRAS}
+
+    custom = stable_inputs.get("custom")
+    if isinstance(custom, str):
+        # Hash the decoded config with sorted keys so dict ordering never matters.
+        try:
+            stable_inputs["custom"] = json.loads(base64.b64decode(custom))
+        except (ValueError, base64.binascii.Error):
+            pass
+
+    canonical = json.dumps(
+        {
+            "platform": platform,
+            "inputs": stable_inputs,
+            "blobs": {k: v for k, v in blobs.items() if v},
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def artifacts_present(uuid_str: str) -> bool:
+    build_dir = Path(settings.BASE_DIR) / "exe" / uuid_str
+    try:
+        return any(p.is_file() for p in build_dir.iterdir())
+    except OSError:
+        return False
+
+
+def find_cached_build(fingerprint: str) -> GithubRun | None:
+    """
+    Return the newest successful run with this fingerprint whose artifacts are
+    still on disk, or None.
+    """
+    if not fingerprint:
+        return None
+    candidates = GithubRun.objects.filter(
+        fingerprint=fingerprint, status="Success"
+    ).order_by("-updated_at")
+    for run in candidates[:5]:
+        if artifacts_present(run.uuid):
+            return run
+    return None
+
+
+def find_inflight_build(fingerprint: str) -> GithubRun | None:
+    """
+    Return the InProgress run currently holding this fingerprint, or None.
+    A holder older than INFLIGHT_MAX_AGE is presumed dead (its runner never
+    reported back) and releases the key so a fresh build can start.
+    """
+    if not fingerprint:
+        return None
+    run = GithubRun.objects.filter(inflight_key=fingerprint).first()
+    if run is None:
+        return None
+    max_age = timedelta(seconds=getattr(settings, 'INFLIGHT_MAX_AGE', 3 * 3600))
+    if run.status == "InProgress" and timezone.now() - run.created_at < max_age:
+        return run
+    GithubRun.objects.filter(pk=run.pk, inflight_key=fingerprint).update(inflight_key=None)
+    return None
@@ -1,9 +1,10 @@
 from django import forms
-from PIL import Image
+
+from .images import ImageRejected, probe_image
 
 class GenerateForm(forms.Form):
     # 平台
-    platform = forms.ChoiceField(
+    platform = forms.MultipleChoiceField(
         choices=[
             ('windows', 'Windows 64位'),
             ('windows-x86', 'Windows 32位'),
@@ -11,7 +12,7 @@ class GenerateForm(forms.Form):
             ('android', 'Android'),
             ('macos', 'macOS')
         ],
-        initial='windows',
+        initial=['windows'],
         label="目标平台"
     )
     
@@ -218,18 +219,18 @@ class GenerateForm(forms.Form):
     removeTopNotice = forms.BooleanField(initial=True,required=False,label="移除顶部温馨提示（固定密码默认会显示）")
     password_security_length=forms.BooleanField(initial=False,required=False,label="修改临时密码的长度")
     def clean_iconfile(self):
-        print("checking icon")
         image = self.cleaned_data['iconfile']
         if image:
             try:
-                img = Image.open(image)
-                if img.format != 'PNG':
-                    raise forms.ValidationError("仅允许 PNG 图像。")
-                width, height = img.size
-                if width != height:
-                    raise forms.ValidationError("应用图标必须为正方形。")
-                return image
-            except OSError:
-                raise forms.ValidationError("无效的图标文件。")
-            except Exception as e:
-                raise forms.ValidationError(f"处理图标时出错：{e}")
+                # Header only; the full decode happens once, in render_png
+                img = probe_image(image)
+            except ImageRejected as e:
+                raise forms.ValidationError(f"无效的图标文件：{e}")
+            finally:
+                image.seek(0)
+            if img.format != 'PNG':
+                raise forms.ValidationError("仅允许 PNG 图像。")
+            width, height = img.size
+            if width != height:
+                raise forms.ValidationError("应用图标必须为正方形。")
+        return image
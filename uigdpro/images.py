@@ -0,0 +1,245 @@
+import io
+import base64
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image, ImageOps
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Limit image size to prevent DoS
+MAX_IMAGE_SIZE = 5 * 1024 * 1024  # 5MB
+
+
+class ImageRejected(ValueError):
+    """Raised when an uploaded image fails validation."""
+
+
+def max_pixels() -> int:
+    return getattr(settings, 'IMAGE_MAX_PIXELS', 4096 * 4096)
+
+
+def read_image_bytes(file_input) -> bytes:
+    """
+    Read an UploadedFile or a 'data:image/...;base64,' string into a single
+    bytes object, refusing anything larger than MAX_IMAGE_SIZE.
+    """
+    if isinstance(file_input, str):
+        if not file_input.startswith("data:image/"):
+            raise ImageRejected("Base64 input missing 'data:image/' prefix")
+        try:
+            header, b64_part = file_input.split(";base64,", 1)
+        except ValueError:
+            raise ImageRejected("Malformed data URL")
+        # 4 base64 characters encode 3 bytes; reject before decoding
+        if len(b64_part) * 3 // 4 > MAX_IMAGE_SIZE + 3:
+            raise ImageRejected("Base64 image too large")
+        try:
+            return base64.b64decode(b64_part)
+        except ValueError as e:
+            raise ImageRejected(f"Base64 decode error: {e}")
+
+    if hasattr(file_input, 'read'):
+        if getattr(file_input, 'size', None) and file_input.size > MAX_IMAGE_SIZE:
+            raise ImageRejected("Uploaded image too large")
+        file_input.seek(0)
+        image_bytes = file_input.read(MAX_IMAGE_SIZE + 1)
+        file_input.seek(0)
+        if len(image_bytes) > MAX_IMAGE_SIZE:
+            raise ImageRejected("Uploaded image too large")
+        return image_bytes
+
+    raise ImageRejected("Unsupported file_input type")
+
+
+def probe_image(source) -> Image.Image:
+    """
+    Parse only the image header (bytes or a file object) and enforce the
+    format and pixel budget before anything is decoded.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    else:
+        source.seek(0)
+    try:
+        img = Image.open(source)
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ImageRejected(f"Unreadable image: {e}")
+    width, height = img.size
+    if width * height > max_pixels():
+        raise ImageRejected(f"Image too large: {width}x{height} pixels")
+    return img
+
+
+def normalize_png(image_bytes: bytes, pixel_limit: int) -> bytes:
+    """
+    Decode once, convert to RGBA and re-encode as PNG.
+    Runs in a worker process, so it must not touch Django.
+    """
+    img = Image.open(io.BytesIO(image_bytes))
+    if img.width * img.height > pixel_limit:
+        raise ImageRejected(f"Image too large: {img.width}x{img.height} pixels")
+    img.load()
+    if img.mode != "RGBA":
+        img = img.convert("RGBA")
+    output_buffer = io.BytesIO()
+    img.save(output_buffer, format="PNG")
+    return output_buffer.getvalue()
+
+
+# Pre-rendered variants of icon.png, named after the files the runners used to build themselves.
+ICO_SIZES = [256, 64, 48, 32, 16]
+RES_SIZES = {
+    "32x32.png": 32,
+    "64x64.png": 64,
+    "128x128.png": 128,
+    "128x128-2x.png": 256,
+}
+MACOS_APP_ICON_SIZES = [16, 32, 64, 128, 256, 512, 1024]
+TRAY_SIZE = 22
+
+
+def _encode(img: Image.Image, fmt: str, **params) -> bytes:
+    output_buffer = io.BytesIO()
+    img.save(output_buffer, format=fmt, **params)
+    return output_buffer.getvalue()
+
+
+def _embedded_svg(img: Image.Image, png_bytes: bytes) -> bytes:
+    """
+    SVG wrapping the PNG, which is what `convert icon.png icon.svg` produced
+    on the runners.
+    """
+    data = base64.b64encode(png_bytes).decode("ascii")
+    return (
+        f'<?xml version="1.0" encoding="UTF-8" standalone="no"?>\n'
+        f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+        f'width="{img.width}" height="{img.height}" viewBox="0 0 {img.width} {img.height}">\n'
+        f'<image width="{img.width}" height="{img.height}" xlink:href="data:image/png;base64,{data}"/>\n'
+        f'</svg>\n'
+    ).encode("ascii")
+
+
+def render_icon_assets(png_bytes: bytes) -> dict[str, bytes]:
+    """
+    Produce every variant of a normalised RGBA icon the workflows use:
+    multi-size .ico, .icns, desktop resource sizes, macOS app icon set,
+    macOS menu bar tray icons, the Flutter icon.svg and the bitmap the
+    macOS runner traces with potrace.
+    Runs in a worker process, so it must not touch Django.
+    """
+    img = Image.open(io.BytesIO(png_bytes))
+    img.load()
+    if img.mode != "RGBA":
+        img = img.convert("RGBA")
+
+    def resized(size: int) -> Image.Image:
+        return img.resize((size, size), Image.Resampling.LANCZOS)
+
+    assets = {
+        "icon.ico": _encode(img, "ICO", sizes=[(s, s) for s in ICO_SIZES]),
+        "AppIcon.icns": _encode(resized(1024), "ICNS"),
+        "icon.svg": _embedded_svg(img, png_bytes),
+    }
+    for name, size in RES_SIZES.items():
+        assets[name] = _encode(resized(size), "PNG")
+    for size in MACOS_APP_ICON_SIZES:
+        assets[f"app_icon_{size}.png"] = _encode(resized(size), "PNG")
+
+    # Menu bar icons as the runners made them: grayscale (inverted for light
+    # mode) with the alpha channel set fully opaque
+    tray = resized(TRAY_SIZE).convert("RGB")
+    for variant, source in (("dark", tray), ("light", ImageOps.invert(tray))):
+        gray = source.convert("L").convert("LA")
+        gray.putalpha(255)
+        assets[f"mac-tray-{variant}-x2.png"] = _encode(gray, "PNG")
+
+    # `magick icon.png -flatten icon.pbm`: onto white, then black and white
+    flat = Image.new("RGB", img.size, (255, 255, 255))
+    flat.paste(img, mask=img.getchannel("A"))
+    assets["icon.pbm"] = _encode(flat.convert("L").point(lambda p: 255 if p >= 128 else 0, "1"), "PPM")
+    return assets
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker(pixel_limit: int) -> None:
+    # Pillow's decompression-bomb limit is process-wide, so it is only set
+    # in the pool's own processes, never in the web process
+    Image.MAX_IMAGE_PIXELS = pixel_limit
+
+
+def get_pool() -> ProcessPoolExecutor | None:
+    """
+    Lazily start the image worker pool (per process, so it is created after
+    a gunicorn fork). IMAGE_WORKERS = 0 runs conversions inline.
+    """
+    global _pool
+    workers = getattr(settings, 'IMAGE_WORKERS', 2)
+    if workers <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(max_pixels(),),
+            )
+        return _pool
+
+
+def discard_pool(pool: ProcessPoolExecutor) -> None:
+    """
+    Drop `pool` so the next call starts a fresh one, and stop its workers:
+    one may still be stuck on the image that timed out.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    processes = list((getattr(pool, '_processes', None) or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+
+
+def run_in_pool(func, *args):
+    pool = get_pool()
+    if pool is None:
+        return func(*args)
+    timeout = getattr(settings, 'IMAGE_TIMEOUT', 30)
+    try:
+        return pool.submit(func, *args).result(timeout=timeout)
+    except BrokenProcessPool:
+        # A worker died (OOM, killed)
+        logger.error("Image worker pool broken, restarting")
+        discard_pool(pool)
+        raise
+    except FutureTimeout:
+        logger.error(f"Image job exceeded {timeout}s, restarting the worker pool")
+        discard_pool(pool)
+        raise
+
+
+def process_image(file_input) -> bytes:
+    """
+    Full validation-and-normalisation pipeline: bounded read, header-only
+    probe (rejects decompression bombs cheaply), then a single decode and
+    re-encode in the worker pool. Raises ImageRejected on bad input.
+    """
+    image_bytes = read_image_bytes(file_input)
+    probe_image(image_bytes)
+    try:
+        return run_in_pool(normalize_png, image_bytes, max_pixels())
+    except ImageRejected:
+        raise
+    except Exception as e:
+        raise ImageRejected(f"Image processing failed: {e!r}")
@@ -0,0 +1,159 @@
+import json
+import time
+import random
+import hashlib
+import threading
+from datetime import datetime, timezone as dt_timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from django.core.management.base import BaseCommand
+
+
+class FakeActions:
+    """
+    In-memory stand-in for the parts of the GitHub REST API the dispatcher
+    and reconciler use: workflow_dispatch and the Actions runs listing.
+    """
+
+    def __init__(self, queue_seconds: float, run_seconds: float, conclusion: str, rate_limit: int):
+        self.queue_seconds = queue_seconds
+        self.run_seconds = run_seconds
+        self.conclusion = conclusion
+        self.rate_limit = rate_limit
+        self.remaining = rate_limit
+        self.reset_at = int(time.time()) + 3600
+        self.runs = []
+        self.lock = threading.Lock()
+
+    def dispatch(self, owner: str, repo: str, workflow: str, body: dict) -> None:
+        inputs = body.get('inputs') or {}
+        now = time.time()
+        with self.lock:
+            run_id = len(self.runs) + 1
+            conclusion = self.conclusion
+            if conclusion == 'mixed':
+                conclusion = random.choice(['success', 'failure', 'cancelled'])
+            self.runs.append({
+                'id': run_id,
+                'repo': f"{owner}/{repo}",
+                'name': workflow,
+                'display_title': f"{workflow} ({inputs.get('uuid', '')})",
+                'event': 'workflow_dispatch',
+                'created': now,
+                'final_conclusion': conclusion,
+            })
+
+    def _render(self, run: dict) -> dict:
+        age = time.time() - run['created']
+        if age < self.queue_seconds:
+            status, conclusion = 'queued', None
+        elif age < self.queue_seconds + self.run_seconds:
+            status, conclusion = 'in_progress', None
+        else:
+            status, conclusion = 'completed', run['final_conclusion']
+        stamp = datetime.fromtimestamp(run['created'], tz=dt_timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        return {
+            'id': run['id'],
+            'name': run['name'],
+            'display_title': run['display_title'],
+            'event': run['event'],
+            'status': status,
+            'conclusion': conclusion,
+            'created_at': stamp,
+        }
+
+    def list_runs(self, owner: str, repo: str, query: dict) -> tuple[dict, bool]:
+        per_page = min(int(query.get('per_page', ['30'])[0]), 100)
+        page = max(int(query.get('page', ['1'])[0]), 1)
+        created = query.get('created', [''])[0].lstrip('>=')
+        since = 0.0
+        if created:
+            since = datetime.strptime(created, '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=dt_timezone.utc).timestamp()
+        with self.lock:
+            matching = [
+                r for r in reversed(self.runs)
+                if r['repo'] == f"{owner}/{repo}" and r['created'] >= since
+            ]
+        window = matching[(page - 1) * per_page:page * per_page]
+        body = {'total_count': len(matching), 'workflow_runs': [self._render(r) for r in window]}
+        return body, page * per_page < len(matching)
+
+
+def make_handler(api: FakeActions, verbose: bool):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, body: bytes = b'', headers: dict | None = None):
+            self.send_response(status)
+            self.send_header('X-RateLimit-Limit', str(api.rate_limit))
+            self.send_header('X-RateLimit-Remaining', str(api.remaining))
+            self.send_header('X-RateLimit-Reset', str(api.reset_at))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            parts = urlsplit(self.path).path.strip('/').split('/')
+            # repos/<owner>/<repo>/actions/workflows/<file>/dispatches
+            if len(parts) != 7 or parts[0] != 'repos' or parts[6] != 'dispatches':
+                return self._send(404, b'{"message": "Not Found"}')
+            length = int(self.headers.get('Content-Length') or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b'{}')
+            except ValueError:
+                return self._send(400, b'{"message": "Problems parsing JSON"}')
+            api.remaining -= 1
+            api.dispatch(parts[1], parts[2], parts[5], body)
+            self._send(204)
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            parts = url.path.strip('/').split('/')
+            # repos/<owner>/<repo>/actions/runs
+            if len(parts) != 5 or parts[0] != 'repos' or parts[3:] != ['actions', 'runs']:
+                return self._send(404, b'{"message": "Not Found"}')
+            query = parse_qs(url.query)
+            body, has_next = api.list_runs(parts[1], parts[2], query)
+            payload = json.dumps(body).encode()
+            etag = f'W/"{hashlib.sha256(payload).hexdigest()[:40]}"'
+            if self.headers.get('If-None-Match') == etag:
+                # Conditional hits don't count against the real API's rate limit either
+                return self._send(304, headers={'ETag': etag})
+            api.remaining -= 1
+            headers = {'ETag': etag, 'Content-Type': 'application/json'}
+            if has_next:
+                page = int(query.get('page', ['1'])[0])
+                headers['Link'] = f'<{url.path}?page={page + 1}>; rel="next"'
+            self._send(200, payload, headers)
+
+        def log_message(self, format, *args):
+            if verbose:
+                super().log_message(format, *args)
+
+    return Handler
+
+
+class Command(BaseCommand):
+    help = "Serve a local stand-in for the GitHub Actions API (point GITHUB_API_URL at it)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--queue-seconds', type=float, default=5, help="Time a run stays queued.")
+        parser.add_argument('--run-seconds', type=float, default=30, help="Time a run stays in_progress.")
+        parser.add_argument(
+            '--conclusion', default='success', choices=['success', 'failure', 'cancelled', 'mixed'],
+            help="Conclusion of finished runs.",
+        )
+        parser.add_argument('--rate-limit', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        api = FakeActions(options['queue_seconds'], options['run_seconds'], options['conclusion'], options['rate_limit'])
+        server = ThreadingHTTPServer(('127.0.0.1', options['port']), make_handler(api, options['verbosity'] > 1))
+        self.stdout.write(f"Fake GitHub API on http://127.0.0.1:{options['port']} (set GITHUB_API_URL to use it)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,49 @@
+import time
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from uigdpro.prebuild import refresh_pool
+
+
+class Command(BaseCommand):
+    help = "Keep fresh builds of the most requested configurations ready, within a daily CI-minutes budget."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=None, help="Configurations per platform (default PREBUILD_TOP_N).")
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be queued without queueing it.")
+        parser.add_argument(
+            '--loop', type=float, metavar='SECONDS', default=0,
+            help="Keep running, refreshing the pool every SECONDS.",
+        )
+
+    def handle(self, *args, **options):
+        self._running = True
+        if options['loop']:
+            signal.signal(signal.SIGTERM, self._stop)
+            signal.signal(signal.SIGINT, self._stop)
+
+        while True:
+            close_old_connections()
+            result = refresh_pool(top_n=options['top'], dry_run=options['dry_run'])
+            verb = "Would queue" if options['dry_run'] else "Queued"
+            self.stdout.write(
+                f"{verb} {result['queued']} of {result['wanted']} pooled build(s): {result['fresh']} fresh, "
+                f"{result['building']} building, {result['skipped_budget']} over budget "
+                f"({result['minutes_spent']}/{result['budget']} CI minutes in 24h)"
+                + (", deferred while user builds are queued" if result['deferred'] else "")
+            )
+            if options['verbosity'] > 1:
+                for platform, fingerprint, uuid_str in result['queued_runs']:
+                    self.stdout.write(f"  {platform} {fingerprint} {uuid_str or ''}")
+            if not options['loop']:
+                break
+            deadline = time.monotonic() + options['loop']
+            while self._running and time.monotonic() < deadline:
+                time.sleep(1)
+            if not self._running:
+                break
+
+    def _stop(self, signum, frame):
+        self._running = False
@@ -0,0 +1,80 @@
+import re
+import time
+import signal
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from uigdpro.retention import prune
+
+SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+
+def parse_size(value: str) -> int:
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMGT]?)B?\s*', str(value), re.IGNORECASE)
+    if not match:
+        raise CommandError(f"Invalid size: {value!r} (use e.g. 500M or 20G)")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).upper()])
+
+
+def format_size(num: int) -> str:
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if num < 1024:
+            return f"{num:.1f} {unit}" if unit != 'B' else f"{num} B"
+        num /= 1024
+    return f"{num:.1f} TB"
+
+
+class Command(BaseCommand):
+    help = "Evict old or least recently downloaded build artifacts from exe/ and png/ and sweep orphaned blobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-age-days', type=float,
+            default=getattr(settings, 'RETENTION_MAX_AGE_DAYS', 30),
+            help="Evict builds not downloaded or updated for this many days (0 disables).",
+        )
+        parser.add_argument(
+            '--max-bytes',
+            default=getattr(settings, 'RETENTION_MAX_BYTES', '0'),
+            help="Total size budget for exe/ and png/, e.g. 50G (0 disables).",
+        )
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be evicted without deleting.")
+        parser.add_argument(
+            '--loop', type=float, metavar='SECONDS', default=0,
+            help="Keep running, pruning every SECONDS.",
+        )
+
+    def handle(self, *args, **options):
+        max_age = timedelta(days=options['max_age_days']) if options['max_age_days'] > 0 else None
+        max_bytes = parse_size(options['max_bytes']) or None
+        self._running = True
+        if options['loop']:
+            signal.signal(signal.SIGTERM, self._stop)
+            signal.signal(signal.SIGINT, self._stop)
+
+        while True:
+            close_old_connections()
+            result = prune(max_age=max_age, max_bytes=max_bytes, dry_run=options['dry_run'])
+            verb = "Would evict" if options['dry_run'] else "Evicted"
+            self.stdout.write(
+                f"{verb} {len(result['evicted'])} build(s), "
+                f"{result['orphaned_blobs']} orphaned blob(s), {result['stale_uploads']} stale upload(s); "
+                f"reclaimed {format_size(result['bytes_reclaimed'])} "
+                f"of {format_size(result['artifact_bytes'])}"
+            )
+            if options['verbosity'] > 1:
+                for uuid_str in result['evicted']:
+                    self.stdout.write(f"  {uuid_str}")
+            if not options['loop']:
+                break
+            deadline = time.monotonic() + options['loop']
+            while self._running and time.monotonic() < deadline:
+                time.sleep(1)
+            if not self._running:
+                break
+
+    def _stop(self, signum, frame):
+        self._running = False
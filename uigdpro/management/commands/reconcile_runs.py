@@ -0,0 +1,47 @@
+import time
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from uigdpro.reconcile import reconcile
+
+
+class Command(BaseCommand):
+    help = "Sync stuck InProgress builds from the GitHub Actions runs listing."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report what would change without writing.")
+        parser.add_argument(
+            '--loop', type=float, metavar='SECONDS', default=0,
+            help="Keep running, reconciling every SECONDS (ETags are reused between passes).",
+        )
+
+    def handle(self, *args, **options):
+        self._running = True
+        if options['loop']:
+            signal.signal(signal.SIGTERM, self._stop)
+            signal.signal(signal.SIGINT, self._stop)
+
+        while True:
+            close_old_connections()
+            result = reconcile(dry_run=options['dry_run'])
+            verb = "Would update" if options['dry_run'] else "Updated"
+            self.stdout.write(
+                f"{verb} {result['updated']} of {result['stale']} stale run(s) "
+                f"({result['lost']} lost) with {result['requests']} request(s), "
+                f"{result['not_modified']} not modified, {result['errors']} error(s)"
+            )
+            if options['verbosity'] > 1:
+                for uuid_str, status in result['changed']:
+                    self.stdout.write(f"  {uuid_str} -> {status}")
+            if not options['loop']:
+                break
+            deadline = time.monotonic() + options['loop']
+            while self._running and time.monotonic() < deadline:
+                time.sleep(1)
+            if not self._running:
+                break
+
+    def _stop(self, signum, frame):
+        self._running = False
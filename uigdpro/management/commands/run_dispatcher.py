@@ -0,0 +1,46 @@
+import time
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from uigdpro.dispatch import process_queue
+
+
+class Command(BaseCommand):
+    help = "Send queued GitHub workflow dispatches with bounded concurrency, retries and backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int,
+            default=getattr(settings, 'DISPATCH_CONCURRENCY', 4),
+            help="Maximum number of dispatch requests in flight.",
+        )
+        parser.add_argument(
+            '--poll-interval', type=float,
+            default=getattr(settings, 'DISPATCH_POLL_INTERVAL', 1.0),
+            help="Seconds to sleep when the queue is empty.",
+        )
+        parser.add_argument('--once', action='store_true', help="Drain the due queue once and exit.")
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        self._running = True
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        self.stdout.write(f"Dispatcher started (concurrency={concurrency})")
+        with ThreadPoolExecutor(max_workers=concurrency, initializer=close_old_connections) as executor:
+            while self._running:
+                close_old_connections()
+                processed = process_queue(executor, concurrency)
+                if options['once'] and not processed:
+                    break
+                if not processed:
+                    time.sleep(options['poll_interval'])
+        self.stdout.write("Dispatcher stopped")
+
+    def _stop(self, signum, frame):
+        self._running = False
@@ -0,0 +1,54 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.urls import Resolver404, get_resolver
+
+from .outbound import deadline
+
+
+def request_deadline(setting: str):
+    """
+    Give a view the outbound budget named by `setting` instead of
+    REQUEST_DEADLINE, for endpoints (builds, uploads) whose upstream calls
+    legitimately take longer. Apply it outermost so the attribute survives
+    other decorators.
+    """
+    def decorator(view):
+        view.request_deadline = setting
+        return view
+    return decorator
+
+
+class DeadlineMiddleware:
+    """
+    Give each request a REQUEST_DEADLINE-second budget shared by all of its
+    outbound calls (GitHub, upload server), so a slow upstream can hold a
+    worker for at most that long in total. Views marked with
+    @request_deadline get their own budget.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.seconds = getattr(settings, 'REQUEST_DEADLINE', 20)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def budget(self, request):
+        try:
+            match = get_resolver(getattr(request, 'urlconf', None)).resolve(request.path_info)
+        except Resolver404:
+            return self.seconds
+        setting = getattr(match.func, 'request_deadline', None)
+        return getattr(settings, setting, self.seconds) if setting else self.seconds
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with deadline(self.budget(request)):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with deadline(self.budget(request)):
+            return await self.get_response(request)
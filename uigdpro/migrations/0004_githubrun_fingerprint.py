@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uigdpro', '0003_alter_githubrun_options_githubrun_created_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='githubrun',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', help_text='SHA-256 of the canonical dispatch inputs, used to reuse identical builds', max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='githubrun',
+            index=models.Index(fields=['fingerprint', 'status'], name='uigdpro_git_fingerp_98d56e_idx'),
+        ),
+    ]
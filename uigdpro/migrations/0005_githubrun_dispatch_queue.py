@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uigdpro', '0004_githubrun_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='githubrun',
+            name='dispatch_attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='githubrun',
+            name='dispatch_error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='githubrun',
+            name='dispatch_payload',
+            field=models.JSONField(blank=True, help_text='Body of the workflow_dispatch request, without secrets', null=True),
+        ),
+        migrations.AddField(
+            model_name='githubrun',
+            name='dispatch_state',
+            field=models.CharField(choices=[('Queued', 'Queued'), ('Sending', 'Sending'), ('Dispatched', 'Dispatched'), ('Failed', 'Failed')], default='Dispatched', help_text='Delivery state of the workflow_dispatch request', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='githubrun',
+            name='dispatched_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='githubrun',
+            name='next_dispatch_at',
+            field=models.DateTimeField(blank=True, help_text='Earliest time the dispatcher may (re)try this run; also the lease expiry while Sending', null=True),
+        ),
+        migrations.AddField(
+            model_name='githubrun',
+            name='workflow',
+            field=models.CharField(blank=True, default='', help_text="Workflow file dispatched for this build (e.g., 'generator-windows.yml')", max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='githubrun',
+            index=models.Index(fields=['dispatch_state', 'next_dispatch_at'], name='uigdpro_git_dispatc_800785_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uigdpro', '0005_githubrun_dispatch_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='githubrun',
+            name='evicted_at',
+            field=models.DateTimeField(blank=True, help_text="When the retention engine deleted this build's artifacts", null=True),
+        ),
+        migrations.AddField(
+            model_name='githubrun',
+            name='last_downloaded_at',
+            field=models.DateTimeField(blank=True, help_text='Last artifact download (hour resolution), used for LRU retention', null=True),
+        ),
+        migrations.AlterField(
+            model_name='githubrun',
+            name='status',
+            field=models.CharField(choices=[('InProgress', 'In Progress'), ('Success', 'Success'), ('Failed', 'Failed'), ('Cancelled', 'Cancelled'), ('Expired', 'Expired')], default='InProgress', help_text='Current status of the GitHub Action workflow', max_length=20),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uigdpro', '0006_githubrun_retention'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UpstreamBreaker',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=32, unique=True)),
+                ('state', models.CharField(choices=[('Closed', 'Closed'), ('Open', 'Open'), ('HalfOpen', 'Half-open')], default='Closed', max_length=10)),
+                ('window_started_at', models.DateTimeField(blank=True, null=True)),
+                ('window_calls', models.PositiveIntegerField(default=0)),
+                ('window_failures', models.PositiveIntegerField(default=0)),
+                ('window_slow', models.PositiveIntegerField(default=0)),
+                ('opened_at', models.DateTimeField(blank=True, null=True)),
+                ('last_failure_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('last_latency_ms', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Upstream Circuit Breaker',
+                'verbose_name_plural': 'Upstream Circuit Breakers',
+            },
+        ),
+    ]
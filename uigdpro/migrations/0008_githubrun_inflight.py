@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uigdpro', '0007_upstreambreaker'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='githubrun',
+            name='idempotency_key',
+            field=models.CharField(blank=True, help_text='Idempotency-Key sent by an API caller (startgh)', max_length=128, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='githubrun',
+            name='inflight_key',
+            field=models.CharField(blank=True, help_text='Fingerprint while the build is InProgress; identical submissions attach to this run', max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uigdpro', '0008_githubrun_inflight'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='githubrun',
+            name='client_key',
+            field=models.CharField(blank=True, default='', help_text='Hashed client IP (or API client id) used for fair-share scheduling', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='githubrun',
+            name='priority',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Scheduling lane; higher is dispatched first (startgh API callers)'),
+        ),
+        migrations.AddIndex(
+            model_name='githubrun',
+            index=models.Index(fields=['platform', 'dispatch_state', 'status'], name='uigdpro_git_platfor_a9a9d6_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uigdpro', '0009_githubrun_scheduling'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='githubrun',
+            name='dispatch_target',
+            field=models.CharField(blank=True, default='', help_text='Name of the DISPATCH_TARGETS entry (repo + token) the workflow was sent to', max_length=64),
+        ),
+    ]
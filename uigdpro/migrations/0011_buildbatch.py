@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uigdpro', '0010_githubrun_dispatch_target'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BuildBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_id', models.CharField(max_length=36, unique=True)),
+                ('client_key', models.CharField(blank=True, default='', max_length=64)),
+                ('idempotency_key', models.CharField(blank=True, help_text='Idempotency-Key sent by the API caller', max_length=128, null=True, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('runs', models.ManyToManyField(blank=True, related_name='batches', to='uigdpro.githubrun')),
+            ],
+            options={
+                'verbose_name': 'Build Batch',
+                'verbose_name_plural': 'Build Batches',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uigdpro', '0011_buildbatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='githubrun',
+            name='hits',
+            field=models.PositiveIntegerField(default=0, help_text='Later submissions served by this build (cache hits and coalesced duplicates)'),
+        ),
+    ]
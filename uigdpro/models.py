@@ -15,11 +15,19 @@ class GithubRun(models.Model):
         ('android', 'Android'),
     ]
 
+    DISPATCH_STATE_CHOICES = [
+        ('Queued', 'Queued'),
+        ('Sending', 'Sending'),
+        ('Dispatched', 'Dispatched'),
+        ('Failed', 'Failed'),
+    ]
+
     STATUS_CHOICES = [
         ('InProgress', 'In Progress'),
         ('Success', 'Success'),
         ('Failed', 'Failed'),
         ('Cancelled', 'Cancelled'),
+        ('Expired', 'Expired'),
     ]
 
     uuid = models.CharField(
@@ -46,6 +54,81 @@ class GithubRun(models.Model):
         default='InProgress',
         help_text="Current status of the GitHub Action workflow"
     )
+    fingerprint = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        help_text="SHA-256 of the canonical dispatch inputs, used to reuse identical builds"
+    )
+    workflow = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        help_text="Workflow file dispatched for this build (e.g., 'generator-windows.yml')"
+    )
+    dispatch_payload = models.JSONField(
+        null=True,
+        blank=True,
+        help_text="Body of the workflow_dispatch request, without secrets"
+    )
+    dispatch_state = models.CharField(
+        max_length=20,
+        choices=DISPATCH_STATE_CHOICES,
+        default='Dispatched',
+        help_text="Delivery state of the workflow_dispatch request"
+    )
+    dispatch_attempts = models.PositiveIntegerField(default=0)
+    next_dispatch_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Earliest time the dispatcher may (re)try this run; also the lease expiry while Sending"
+    )
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    dispatch_error = models.TextField(blank=True, default='')
+    dispatch_target = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        help_text="Name of the DISPATCH_TARGETS entry (repo + token) the workflow was sent to"
+    )
+    client_key = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        help_text="Hashed client IP (or API client id) used for fair-share scheduling"
+    )
+    priority = models.PositiveSmallIntegerField(
+        default=0,
+        help_text="Scheduling lane; higher is dispatched first (startgh API callers)"
+    )
+    inflight_key = models.CharField(
+        max_length=64,
+        unique=True,
+        null=True,
+        blank=True,
+        help_text="Fingerprint while the build is InProgress; identical submissions attach to this run"
+    )
+    idempotency_key = models.CharField(
+        max_length=128,
+        unique=True,
+        null=True,
+        blank=True,
+        help_text="Idempotency-Key sent by an API caller (startgh)"
+    )
+    hits = models.PositiveIntegerField(
+        default=0,
+        help_text="Later submissions served by this build (cache hits and coalesced duplicates)"
+    )
+    last_downloaded_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Last artifact download (hour resolution), used for LRU retention"
+    )
+    evicted_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="When the retention engine deleted this build's artifacts"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -56,6 +139,9 @@ class GithubRun(models.Model):
             models.Index(fields=['uuid']),
             models.Index(fields=['status']),
             models.Index(fields=['platform']),
+            models.Index(fields=['fingerprint', 'status']),
+            models.Index(fields=['dispatch_state', 'next_dispatch_at']),
+            models.Index(fields=['platform', 'dispatch_state', 'status']),
         ]
 
     def __str__(self):
@@ -68,3 +154,63 @@ class GithubRun(models.Model):
         except ValueError:
             raise models.ValidationError({'uuid': 'Invalid UUID format.'})
         super().clean()
+
+
+class UpstreamBreaker(models.Model):
+    """
+    Circuit breaker state for one outbound dependency (GitHub API, upload server),
+    shared by every worker process through the database.
+    """
+
+    STATE_CHOICES = [
+        ('Closed', 'Closed'),
+        ('Open', 'Open'),
+        ('HalfOpen', 'Half-open'),
+    ]
+
+    name = models.CharField(max_length=32, unique=True)
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default='Closed')
+    window_started_at = models.DateTimeField(null=True, blank=True)
+    window_calls = models.PositiveIntegerField(default=0)
+    window_failures = models.PositiveIntegerField(default=0)
+    window_slow = models.PositiveIntegerField(default=0)
+    opened_at = models.DateTimeField(null=True, blank=True)
+    last_failure_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    last_latency_ms = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Upstream Circuit Breaker"
+        verbose_name_plural = "Upstream Circuit Breakers"
+
+    def __str__(self):
+        return f"{self.name}: {self.state}"
+
+
+class BuildBatch(models.Model):
+    """
+    A group of builds submitted together (bulk API or a multi-platform form
+    submission), tracked as one unit.
+    Runs reused from the build cache or attached to an identical in-flight
+    build are members too, so progress covers everything the caller asked for.
+    """
+
+    batch_id = models.CharField(max_length=36, unique=True)
+    client_key = models.CharField(max_length=64, blank=True, default='')
+    idempotency_key = models.CharField(
+        max_length=128,
+        unique=True,
+        null=True,
+        blank=True,
+        help_text="Idempotency-Key sent by the API caller"
+    )
+    runs = models.ManyToManyField(GithubRun, related_name='batches', blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Build Batch"
+        verbose_name_plural = "Build Batches"
+
+    def __str__(self):
+        return self.batch_id
@@ -0,0 +1,212 @@
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+import weakref
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+from . import breakers
+
+logger = logging.getLogger(__name__)
+
+# (scheme, host, port) -> Session; one keep-alive pool per upstream, per process
+_sessions: dict[tuple, requests.Session] = {}
+_lock = threading.Lock()
+
+# event loop -> AsyncClient for async views; httpx keeps a pool per host inside it
+_async_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+# Monotonic time by which the current request's outbound calls must finish
+_deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar('outbound_deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when the request's outbound time budget is used up. Deliberately
+    neither a requests nor an httpx exception: the same error comes out of
+    request() and arequest(), and it is our limit, not the upstream's.
+    """
+
+
+@contextmanager
+def deadline(seconds: float | None):
+    """
+    Give every outbound call made inside the block a shared time budget.
+    Nested budgets can only shrink the outer one.
+    """
+    if not seconds:
+        yield
+        return
+    until = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(min(until, outer) if outer else until)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_budget() -> float | None:
+    until = _deadline.get()
+    return None if until is None else until - time.monotonic()
+
+
+def default_timeout() -> tuple[float, float]:
+    return (
+        getattr(settings, 'HTTP_CONNECT_TIMEOUT', 5),
+        getattr(settings, 'HTTP_READ_TIMEOUT', 30),
+    )
+
+
+def session_for(url: str) -> requests.Session:
+    """
+    Shared Session for the host in `url`. Sessions are created lazily, so
+    each gunicorn worker gets its own pool after the fork.
+    """
+    parts = urlsplit(url)
+    key = (parts.scheme, parts.hostname, parts.port)
+    session = _sessions.get(key)
+    if session is not None:
+        return session
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=getattr(settings, 'HTTP_POOL_MAXSIZE', 10),
+                pool_block=False,
+            )
+            session.mount(f"{parts.scheme}://", adapter)
+            _sessions[key] = session
+            logger.debug(f"Opened HTTP pool for {parts.scheme}://{parts.netloc}")
+        return session
+
+
+def async_client() -> httpx.AsyncClient:
+    """
+    Shared AsyncClient for the running event loop (one per uvicorn worker).
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(limits=httpx.Limits(
+            max_connections=getattr(settings, 'HTTP_ASYNC_MAX_CONNECTIONS', 100),
+            max_keepalive_connections=getattr(settings, 'HTTP_POOL_MAXSIZE', 10),
+        ))
+        _async_clients[loop] = client
+    return client
+
+
+def _clamp(timeout, budget: float) -> tuple[tuple, bool]:
+    connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+    clamped = (min(connect, budget), min(read, budget))
+    return clamped, clamped[1] < read
+
+
+def request(method: str, url: str, upstream: str | None = None, **kwargs) -> requests.Response:
+    """
+    requests.request() over the pooled session for the URL's host, with an
+    explicit (connect, read) timeout unless the caller passes one. Timeouts
+    are clamped to the request's deadline budget. When `upstream` names a
+    circuit breaker, open circuits fail fast with UpstreamUnavailable and
+    the call's outcome and latency are recorded.
+    """
+    timeout = kwargs.pop('timeout', None) or default_timeout()
+    clamped = False
+    budget = remaining_budget()
+    if budget is not None:
+        if budget <= 0:
+            raise DeadlineExceeded(f"No time budget left for {method} {url}")
+        timeout, clamped = _clamp(timeout, budget)
+    if upstream is None:
+        return session_for(url).request(method, url, timeout=timeout, **kwargs)
+
+    breakers.acquire(upstream)
+    started = time.monotonic()
+    try:
+        response = session_for(url).request(method, url, timeout=timeout, **kwargs)
+    except requests.Timeout as e:
+        # Running out of our own budget says nothing about the upstream
+        if not clamped:
+            breakers.record(upstream, False, time.monotonic() - started, f"{type(e).__name__}: {e}")
+        raise
+    except requests.RequestException as e:
+        breakers.record(upstream, False, time.monotonic() - started, f"{type(e).__name__}: {e}")
+        raise
+    failed = response.status_code >= 500 or response.status_code == 429
+    breakers.record(
+        upstream, not failed, time.monotonic() - started,
+        f"HTTP {response.status_code}" if failed else '',
+    )
+    return response
+
+
+def get(url: str, upstream: str | None = None, **kwargs) -> requests.Response:
+    return request('GET', url, upstream=upstream, **kwargs)
+
+
+def post(url: str, upstream: str | None = None, **kwargs) -> requests.Response:
+    return request('POST', url, upstream=upstream, **kwargs)
+
+
+async def arequest(method: str, url: str, upstream: str | None = None, **kwargs) -> httpx.Response:
+    """
+    Non-blocking request() for async views, over the loop's AsyncClient:
+    same default timeouts, deadline budget and circuit breaker accounting.
+    Raises httpx exceptions instead of requests ones.
+    """
+    timeout = kwargs.pop('timeout', None) or default_timeout()
+    clamped = False
+    budget = remaining_budget()
+    if budget is not None:
+        if budget <= 0:
+            raise DeadlineExceeded(f"No time budget left for {method} {url}")
+        timeout, clamped = _clamp(timeout, budget)
+    connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+    timeout = httpx.Timeout(read, connect=connect)
+    client = async_client()
+    if upstream is None:
+        return await client.request(method, url, timeout=timeout, **kwargs)
+
+    await sync_to_async(breakers.acquire)(upstream)
+    started = time.monotonic()
+    try:
+        response = await client.request(method, url, timeout=timeout, **kwargs)
+    except httpx.TimeoutException as e:
+        if not clamped:
+            await sync_to_async(breakers.record)(upstream, False, time.monotonic() - started, f"{type(e).__name__}: {e}")
+        raise
+    except httpx.HTTPError as e:
+        await sync_to_async(breakers.record)(upstream, False, time.monotonic() - started, f"{type(e).__name__}: {e}")
+        raise
+    failed = response.status_code >= 500 or response.status_code == 429
+    await sync_to_async(breakers.record)(
+        upstream, not failed, time.monotonic() - started,
+        f"HTTP {response.status_code}" if failed else '',
+    )
+    return response
+
+
+async def aget(url: str, upstream: str | None = None, **kwargs) -> httpx.Response:
+    return await arequest('GET', url, upstream=upstream, **kwargs)
+
+
+async def apost(url: str, upstream: str | None = None, **kwargs) -> httpx.Response:
+    return await arequest('POST', url, upstream=upstream, **kwargs)
+
+
+def close_all() -> None:
+    with _lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
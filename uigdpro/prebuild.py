@@ -0,0 +1,224 @@
+import os
+import json
+import logging
+from datetime import timedelta
+from uuid import UUID
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import scheduler
+from .dispatch import enqueue_dispatch, workflow_for
+from .fingerprint import compute_fingerprint, find_cached_build, find_inflight_build
+from .forms import GenerateForm
+from .models import GithubRun
+
+logger = logging.getLogger(__name__)
+
+# client_key of pool builds: keeps them out of the popularity counts and lets
+# the budget find them
+PREBUILD_CLIENT = "prebuild"
+
+# Fingerprints looked at per platform when ranking configurations
+HISTORY_SCAN = 200
+
+
+def target_versions() -> list[str]:
+    """
+    Versions the pool keeps builds for: PREBUILD_VERSIONS, or the newest
+    release offered by the form, so adding a version to GenerateForm.version
+    moves the whole pool to it.
+    """
+    configured = getattr(settings, 'PREBUILD_VERSIONS', None)
+    if configured:
+        return list(configured)
+    releases = [value for value, _label in GenerateForm.base_fields['version'].choices if value != 'master']
+    return releases[:1]
+
+
+def is_stock(inputs: dict) -> bool:
+    """
+    Only configurations without uploaded icons, logos or files are pooled;
+    their fingerprint depends on the dispatch inputs alone.
+    """
+    return (
+        inputs.get("iconlink") in (None, "", "null")
+        and inputs.get("logolink") in (None, "", "null")
+        and not inputs.get("custom_file_url")
+        and not inputs.get("custom_target_path")
+    )
+
+
+def with_version(inputs: dict, version: str) -> dict:
+    inputs = json.loads(json.dumps(inputs))
+    extras = json.loads(inputs.get("extras") or "{}")
+    extras["version"] = version
+    inputs["extras"] = json.dumps(extras)
+    return inputs
+
+
+def popular_configs(platform: str, since, limit: int) -> list[dict]:
+    """
+    The `limit` most requested stock configurations of `platform` since
+    `since`, counted across versions: submissions that created a run plus
+    those served from the cache or attached to an in-flight build.
+    """
+    rows = (
+        GithubRun.objects.filter(platform=platform, created_at__gte=since, dispatch_payload__isnull=False)
+        .exclude(fingerprint='')
+        .values('fingerprint')
+        .annotate(
+            requests=Count('id', filter=~Q(client_key=PREBUILD_CLIENT)) + Coalesce(Sum('hits'), 0),
+        )
+        .order_by('-requests')[:HISTORY_SCAN]
+    )
+    requests = {row['fingerprint']: row['requests'] for row in rows if row['requests']}
+    samples = {}
+    for run in (
+        GithubRun.objects.filter(platform=platform, fingerprint__in=list(requests))
+        .order_by('-created_at').only('fingerprint', 'direction', 'dispatch_payload')
+    ):
+        samples.setdefault(run.fingerprint, run)
+
+    configs = {}
+    for fingerprint, count in requests.items():
+        run = samples.get(fingerprint)
+        payload = run.dispatch_payload if run else None
+        inputs = (payload or {}).get("inputs") or {}
+        if not inputs or not is_stock(inputs):
+            continue
+        # The same configuration requested for different versions is one entry
+        key = compute_fingerprint(platform, with_version(inputs, ""), {})
+        entry = configs.setdefault(key, {
+            'platform': platform,
+            'direction': run.direction,
+            'ref': payload.get("ref", "master"),
+            'inputs': inputs,
+            'requests': 0,
+        })
+        entry['requests'] += count
+    return sorted(configs.values(), key=lambda c: -c['requests'])[:limit]
+
+
+def minutes_multiplier(platform: str) -> float:
+    return getattr(settings, 'PREBUILD_MINUTE_MULTIPLIERS', {}).get(platform, 1)
+
+
+def estimated_minutes(platform: str) -> float:
+    return scheduler.typical_duration(platform) / 60 * minutes_multiplier(platform)
+
+
+def minutes_spent(now=None) -> float:
+    """
+    Billable CI minutes used by pool builds dispatched in the last 24 hours:
+    measured for finished runs, estimated for ones still running.
+    """
+    now = now or timezone.now()
+    spent = 0.0
+    for run in GithubRun.objects.filter(
+        client_key=PREBUILD_CLIENT, dispatched_at__gte=now - timedelta(days=1),
+    ).only('platform', 'status', 'dispatched_at', 'updated_at'):
+        if run.status == "InProgress":
+            spent += estimated_minutes(run.platform)
+        else:
+            spent += max((run.updated_at - run.dispatched_at).total_seconds(), 0) / 60 * minutes_multiplier(run.platform)
+    return spent
+
+
+def fresh_build(fingerprint: str, max_age: timedelta) -> GithubRun | None:
+    run = find_cached_build(fingerprint)
+    if run and timezone.now() - run.updated_at <= max_age:
+        return run
+    return None
+
+
+def users_waiting() -> bool:
+    return GithubRun.objects.filter(
+        dispatch_state__in=['Queued', 'Sending'], status='InProgress',
+    ).exclude(client_key=PREBUILD_CLIENT).exists()
+
+
+def queue_prebuild(config: dict, inputs: dict, fingerprint: str) -> GithubRun | None:
+    myuuid = str(UUID(bytes=os.urandom(16)))
+    inputs = dict(inputs, uuid=myuuid)
+    run = GithubRun(
+        uuid=myuuid,
+        filename=inputs.get("filename") or "rustdesk",
+        direction=config['direction'],
+        platform=config['platform'],
+        status="InProgress",
+        fingerprint=fingerprint,
+        inflight_key=fingerprint,
+        client_key=PREBUILD_CLIENT,
+    )
+    enqueue_dispatch(run, workflow_for(config['platform']), {"ref": config['ref'], "inputs": inputs})
+    try:
+        with transaction.atomic():
+            run.save()
+    except IntegrityError:
+        # A user submission for the same configuration got there first
+        return None
+    return run
+
+
+def refresh_pool(top_n: int | None = None, dry_run: bool = False) -> dict:
+    """
+    One pass of the prebuild manager: rank configurations per platform,
+    retarget them to the current version(s) and queue builds for the ones
+    without a fresh cached or in-flight build, most requested first, while
+    the daily CI-minutes budget allows. Nothing is queued while users'
+    builds are waiting for a runner.
+    """
+    now = timezone.now()
+    top_n = top_n if top_n is not None else getattr(settings, 'PREBUILD_TOP_N', 5)
+    since = now - timedelta(days=getattr(settings, 'PREBUILD_HISTORY_DAYS', 30))
+    max_age = timedelta(seconds=getattr(settings, 'PREBUILD_MAX_AGE', 7 * 86400))
+    budget = getattr(settings, 'PREBUILD_CI_MINUTES', 600)
+    max_inflight = getattr(settings, 'PREBUILD_MAX_INFLIGHT', 2)
+    platforms = getattr(settings, 'PREBUILD_PLATFORMS', None) or [p for p, _label in GithubRun.PLATFORM_CHOICES]
+
+    wanted = []
+    for platform in platforms:
+        for config in popular_configs(platform, since, top_n):
+            for version in target_versions():
+                inputs = with_version(config['inputs'], version)
+                wanted.append((config, inputs, compute_fingerprint(platform, inputs, {})))
+    wanted.sort(key=lambda item: -item[0]['requests'])
+
+    summary = {'wanted': len(wanted), 'fresh': 0, 'building': 0, 'queued': 0, 'skipped_budget': 0,
+               'minutes_spent': round(minutes_spent(now), 1), 'budget': budget, 'queued_runs': []}
+    inflight = GithubRun.objects.filter(client_key=PREBUILD_CLIENT, status='InProgress').count()
+    spent = summary['minutes_spent']
+    deferred = users_waiting()
+    summary['deferred'] = deferred
+    for config, inputs, fingerprint in wanted:
+        if fresh_build(fingerprint, max_age):
+            summary['fresh'] += 1
+            continue
+        if find_inflight_build(fingerprint):
+            summary['building'] += 1
+            continue
+        if deferred or inflight >= max_inflight:
+            continue
+        cost = estimated_minutes(config['platform'])
+        if spent + cost > budget:
+            summary['skipped_budget'] += 1
+            continue
+        if dry_run:
+            run_uuid = None
+        else:
+            run = queue_prebuild(config, inputs, fingerprint)
+            if run is None:
+                summary['building'] += 1
+                continue
+            run_uuid = run.uuid
+            logger.info(f"Queued prebuild {run.uuid} of {fingerprint[:12]} ({config['platform']}, "
+                        f"{config['requests']} requests)")
+        spent += cost
+        inflight += 1
+        summary['queued'] += 1
+        summary['queued_runs'].append((config['platform'], fingerprint[:12], run_uuid))
+    return summary
@@ -0,0 +1,184 @@
+import re
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import outbound, targets
+from .dispatch import api_url, github_headers
+from .events import publish
+from .fingerprint import artifacts_present
+from .models import GithubRun
+
+logger = logging.getLogger(__name__)
+
+# run-name of the generator workflows ends with "(<uuid>)"
+UUID_IN_TITLE = re.compile(r'([0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12})')
+
+FAILED_CONCLUSIONS = {'failure', 'timed_out', 'startup_failure', 'action_required', 'stale', 'neutral', 'skipped'}
+PER_PAGE = 100
+MAX_PAGES = 10
+# Slack between our dispatched_at and the created_at GitHub gives the run
+CLOCK_SKEW = timedelta(minutes=5)
+
+# (target name, page) -> (ETag, runs on that page) from the previous poll
+_page_cache: dict[tuple, tuple[str, list]] = {}
+
+
+def runs_url(target: dict) -> str:
+    return f"{api_url()}/repos/{target['owner']}/{target['repo']}/actions/runs"
+
+
+def list_runs(target: dict, since) -> tuple[list[dict], int, int, object]:
+    """
+    Workflow_dispatch runs created since `since`, newest first. Pages whose
+    ETag is unchanged come back as 304 (free against the rate limit) and
+    are served from the previous poll. Returns (runs, requests, not-modified,
+    covered): every run created after `covered` is in the list. That is
+    `since` when the listing ran to the end, the oldest run seen when it was
+    cut off at MAX_PAGES, and None if that can't be told.
+    """
+    collected = []
+    calls = not_modified = 0
+    page = 1
+    while True:
+        key = (target['name'], page)
+        headers = github_headers(target)
+        cached = _page_cache.get(key)
+        if cached:
+            headers['If-None-Match'] = cached[0]
+        response = outbound.get(
+            runs_url(target),
+            upstream=targets.breaker_name(target),
+            headers=headers,
+            params={
+                'event': 'workflow_dispatch',
+                'created': f">={since.strftime('%Y-%m-%dT%H:%M:%SZ')}",
+                'per_page': PER_PAGE,
+                'page': page,
+            },
+        )
+        calls += 1
+        targets.note_rate_limit(target, response)
+        if response.status_code == 304 and cached:
+            not_modified += 1
+            runs = cached[1]
+        else:
+            response.raise_for_status()
+            runs = response.json().get('workflow_runs', [])
+            if response.headers.get('ETag'):
+                _page_cache[key] = (response.headers['ETag'], runs)
+        collected.extend(runs)
+        link = response.headers.get('Link')
+        if len(runs) < PER_PAGE or (link is not None and 'rel="next"' not in link):
+            return collected, calls, not_modified, since
+        if page >= MAX_PAGES:
+            break
+        page += 1
+
+    created = [parse_datetime(run.get('created_at') or '') for run in collected]
+    created = [stamp for stamp in created if stamp is not None]
+    logger.warning(f"Actions runs listing for {target['name']} cut off after {MAX_PAGES} pages")
+    return collected, calls, not_modified, min(created) if created else None
+
+
+def resolve_status(run: GithubRun, gh_run: dict) -> str | None:
+    """
+    Our status for a finished Actions run, or None while it is still going.
+    A 'success' whose artifacts never arrived counts as failed.
+    """
+    if gh_run.get('status') != 'completed':
+        return None
+    conclusion = gh_run.get('conclusion')
+    if conclusion == 'success':
+        return 'Success' if artifacts_present(run.uuid) else 'Failed'
+    if conclusion == 'cancelled':
+        return 'Cancelled'
+    if conclusion in FAILED_CONCLUSIONS or conclusion:
+        return 'Failed'
+    return None
+
+
+def reconcile(dry_run: bool = False) -> dict:
+    """
+    One pass: for every target with dispatched runs still InProgress after
+    RECONCILE_MIN_AGE, list its recent Actions runs, match them by uuid and
+    bulk-update the rows whose workflow has finished. Runs missing from the
+    listing for longer than RECONCILE_LOST_AFTER are marked Failed, as long
+    as the listing went back far enough to have included them.
+    """
+    now = timezone.now()
+    min_age = timedelta(seconds=getattr(settings, 'RECONCILE_MIN_AGE', 600))
+    lost_after = timedelta(seconds=getattr(settings, 'RECONCILE_LOST_AFTER', 12 * 3600))
+    stale = list(GithubRun.objects.filter(
+        status='InProgress', dispatch_state='Dispatched', dispatched_at__lte=now - min_age,
+    ))
+    by_target = {}
+    default_target = targets.configured_targets()[0]['name']
+    for run in stale:
+        # Runs dispatched before targets were recorded went to the first (only) target
+        by_target.setdefault(run.dispatch_target or default_target, []).append(run)
+
+    summary = {'stale': len(stale), 'updated': 0, 'lost': 0, 'requests': 0, 'not_modified': 0, 'errors': 0}
+    changed = []
+    for name, runs in by_target.items():
+        target = targets.get_target(name)
+        if target is None:
+            logger.warning(f"{len(runs)} stale run(s) point at unknown dispatch target {name!r}")
+            continue
+        since = min(run.dispatched_at for run in runs) - CLOCK_SKEW
+        try:
+            gh_runs, calls, not_modified, covered = list_runs(target, since)
+        except Exception as e:
+            summary['errors'] += 1
+            logger.error(f"Listing Actions runs for {name} failed: {e}")
+            continue
+        summary['requests'] += calls
+        summary['not_modified'] += not_modified
+
+        latest = {}
+        for gh_run in gh_runs:
+            match = UUID_IN_TITLE.search(gh_run.get('display_title') or gh_run.get('name') or '')
+            if match:
+                # Newest attempt wins; the listing is sorted newest first
+                latest.setdefault(match.group(1).lower(), gh_run)
+
+        for run in runs:
+            gh_run = latest.get(run.uuid.lower())
+            if gh_run is not None:
+                status = resolve_status(run, gh_run)
+                if status is None:
+                    continue
+                run.dispatch_error = f"reconciled from Actions run {gh_run.get('id')} ({gh_run.get('conclusion')})"
+            elif (now - run.dispatched_at > lost_after and covered is not None
+                  and run.dispatched_at - CLOCK_SKEW >= covered):
+                # Only when the listing reaches back past the run; a truncated
+                # one says nothing about older runs
+                status = 'Failed'
+                run.dispatch_error = "no matching Actions run found"
+                summary['lost'] += 1
+            else:
+                continue
+            run.status = status
+            run.inflight_key = None
+            run.updated_at = now
+            changed.append(run)
+
+    if changed and not dry_run:
+        with transaction.atomic():
+            # A callback may have landed since the rows were read; it wins
+            still_running = set(GithubRun.objects.filter(
+                pk__in=[run.pk for run in changed], status='InProgress',
+            ).values_list('pk', flat=True))
+            changed = [run for run in changed if run.pk in still_running]
+            GithubRun.objects.bulk_update(
+                changed, ['status', 'inflight_key', 'dispatch_error', 'updated_at'], batch_size=200,
+            )
+        for run in changed:
+            publish(run.uuid)
+    summary['updated'] = len(changed)
+    summary['changed'] = [(run.uuid, run.status) for run in changed]
+    return summary
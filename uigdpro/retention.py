@@ -0,0 +1,228 @@
+import os
+import shutil
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import blobstore, chunked
+from .models import GithubRun
+
+logger = logging.getLogger(__name__)
+
+# Per-build directories the retention engine manages, relative to BASE_DIR.
+ARTIFACT_DIRS = ("exe", "png")
+
+# Runs that may still write into their directories.
+PROTECTED_STATUSES = {"InProgress"}
+PROTECTED_DISPATCH_STATES = {"Queued", "Sending"}
+
+
+def artifact_dirs(uuid_str: str) -> list[Path]:
+    base = Path(settings.BASE_DIR)
+    return [base / name / uuid_str for name in ARTIFACT_DIRS]
+
+
+def _scan_dir(path: Path) -> dict:
+    """
+    (st_dev, st_ino) -> size for every file under `path`, so hardlinked
+    copies of one blob are only counted once.
+    """
+    files = {}
+    for root, _dirs, names in os.walk(path):
+        for name in names:
+            try:
+                st = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            files[(st.st_dev, st.st_ino)] = st.st_size
+    return files
+
+
+def scan_usage() -> dict[str, dict]:
+    """
+    Map each build UUID found under exe/ or png/ to its files and the newest
+    directory mtime (used to age directories with no GithubRun row).
+    """
+    usage = {}
+    base = Path(settings.BASE_DIR)
+    for name in ARTIFACT_DIRS:
+        parent = base / name
+        if not parent.is_dir():
+            continue
+        for entry in parent.iterdir():
+            if not entry.is_dir():
+                continue
+            info = usage.setdefault(entry.name, {"files": {}, "mtime": 0.0})
+            info["files"].update(_scan_dir(entry))
+            try:
+                info["mtime"] = max(info["mtime"], entry.stat().st_mtime)
+            except OSError:
+                pass
+    return usage
+
+
+def _last_used(run: GithubRun):
+    if run.last_downloaded_at and run.last_downloaded_at > run.updated_at:
+        return run.last_downloaded_at
+    return run.updated_at
+
+
+def plan_eviction(usage: dict, max_age: timedelta | None, max_bytes: int | None,
+                  orphan_grace: timedelta) -> tuple[list[str], int, int]:
+    """
+    Choose which build UUIDs to evict. Returns (uuids in eviction order,
+    unique bytes in use now, unique bytes left after eviction).
+
+    Directories without a run row are evicted once older than `orphan_grace`
+    (generator_view writes png/<uuid> just before creating the row). Then
+    runs idle for longer than `max_age`, then least recently downloaded runs
+    until the unique on-disk size fits in `max_bytes`. InProgress runs and
+    runs still waiting to be dispatched are never chosen.
+    """
+    now = timezone.now()
+    refs = {}
+    sizes = {}
+    for info in usage.values():
+        for key, size in info["files"].items():
+            refs[key] = refs.get(key, 0) + 1
+            sizes[key] = size
+    total = sum(sizes.values())
+
+    runs = {
+        run.uuid: run
+        for run in GithubRun.objects.filter(uuid__in=list(usage)).only(
+            'uuid', 'status', 'dispatch_state', 'updated_at', 'last_downloaded_at'
+        )
+    }
+
+    orphans = []
+    candidates = []
+    for uuid_str, info in usage.items():
+        run = runs.get(uuid_str)
+        if run is None:
+            mtime = datetime.fromtimestamp(info["mtime"], tz=dt_timezone.utc)
+            if now - mtime > orphan_grace:
+                orphans.append((mtime, uuid_str))
+            continue
+        if run.status in PROTECTED_STATUSES or run.dispatch_state in PROTECTED_DISPATCH_STATES:
+            continue
+        candidates.append((_last_used(run), uuid_str))
+    orphans.sort()
+    candidates.sort()
+
+    chosen = [uuid_str for _, uuid_str in orphans]
+    remaining = []
+    for last_used, uuid_str in candidates:
+        if max_age is not None and now - last_used > max_age:
+            chosen.append(uuid_str)
+        else:
+            remaining.append(uuid_str)
+
+    def release(uuid_str):
+        nonlocal total
+        for key in usage[uuid_str]["files"]:
+            refs[key] -= 1
+            if refs[key] == 0:
+                total -= sizes[key]
+
+    for uuid_str in chosen:
+        release(uuid_str)
+    if max_bytes is not None:
+        for uuid_str in remaining:
+            if total <= max_bytes:
+                break
+            chosen.append(uuid_str)
+            release(uuid_str)
+
+    return chosen, sum(sizes.values()), total
+
+
+def evict(uuid_str: str) -> None:
+    """
+    Delete exe/<uuid> and png/<uuid>. Blobs they linked to are left for
+    collect_orphaned_blobs.
+    """
+    for path in artifact_dirs(uuid_str):
+        if path.exists():
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def collect_orphaned_blobs(grace: timedelta) -> tuple[int, int]:
+    """
+    Remove blobs nothing has linked to for `grace`. Returns (count, bytes).
+    """
+    count = freed = 0
+    for path, size in blobstore.orphaned_blobs(grace.total_seconds()):
+        try:
+            path.unlink()
+        except OSError as e:
+            logger.warning(f"Could not remove orphaned blob {path}: {e}")
+            continue
+        count += 1
+        freed += size
+    return count, freed
+
+
+def disk_usage() -> int:
+    """
+    Unique bytes held by exe/, png/ and the blob store (hardlinks counted once).
+    """
+    files = {}
+    for path in [Path(settings.BASE_DIR) / name for name in ARTIFACT_DIRS] + [blobstore.blob_root()]:
+        if path.is_dir():
+            files.update(_scan_dir(path))
+    return sum(files.values())
+
+
+def prune(max_age: timedelta | None = None, max_bytes: int | None = None,
+          orphan_grace: timedelta | None = None, dry_run: bool = False) -> dict:
+    """
+    One retention pass over exe/, png/ and the blob store. Evicted successful
+    runs are marked Expired so the UI and the build cache stop pointing at
+    them; every evicted run gets evicted_at.
+    """
+    if orphan_grace is None:
+        orphan_grace = timedelta(seconds=getattr(settings, 'RETENTION_ORPHAN_GRACE', 3600))
+    usage = scan_usage()
+    chosen, artifact_bytes, planned_bytes = plan_eviction(usage, max_age, max_bytes, orphan_grace)
+    if dry_run:
+        orphans = list(blobstore.orphaned_blobs(orphan_grace.total_seconds()))
+        return {
+            "evicted": chosen,
+            "artifact_bytes": artifact_bytes,
+            "bytes_reclaimed": artifact_bytes - planned_bytes + sum(size for _path, size in orphans),
+            "orphaned_blobs": len(orphans),
+            "stale_uploads": 0,
+        }
+
+    before = disk_usage()
+    evicted = []
+    for uuid_str in chosen:
+        # Re-check the latest state: the run may have been rebuilt since planning.
+        run = GithubRun.objects.filter(uuid=uuid_str).only('status', 'dispatch_state').first()
+        if run is not None and (run.status in PROTECTED_STATUSES
+                                or run.dispatch_state in PROTECTED_DISPATCH_STATES):
+            continue
+        evict(uuid_str)
+        evicted.append(uuid_str)
+        logger.info(f"Evicted artifacts of {uuid_str}")
+
+    if evicted:
+        now = timezone.now()
+        runs = GithubRun.objects.filter(uuid__in=evicted).exclude(status__in=PROTECTED_STATUSES)
+        # Failed and Cancelled builds keep their status so users still see why they have no files
+        runs.filter(status='Success').update(status='Expired', evicted_at=now, updated_at=now)
+        runs.exclude(status='Expired').update(evicted_at=now, updated_at=now)
+
+    blobs, _blob_bytes = collect_orphaned_blobs(orphan_grace)
+    stale_uploads = chunked.expire_sessions(getattr(settings, 'UPLOAD_SESSION_TTL', 24 * 3600))
+    return {
+        "evicted": evicted,
+        "artifact_bytes": artifact_bytes,
+        "bytes_reclaimed": max(before - disk_usage(), 0),
+        "orphaned_blobs": blobs,
+        "stale_uploads": stale_uploads,
+    }
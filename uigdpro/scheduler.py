@@ -0,0 +1,176 @@
+import math
+import time
+import hashlib
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import GithubRun
+
+logger = logging.getLogger(__name__)
+
+# How far ahead of the dispatcher we look when choosing what to send next
+CANDIDATE_WINDOW = 500
+
+_duration_cache: dict[str, tuple[float, float]] = {}
+
+
+def client_key(request) -> str:
+    """
+    Stable, non-reversible key for the submitting client. Behind the reverse
+    proxy the last X-Forwarded-For hop is the address the proxy saw.
+    """
+    ip = request.META.get('REMOTE_ADDR', '')
+    if getattr(settings, 'TRUST_X_FORWARDED_FOR', False):
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+        if forwarded:
+            ip = forwarded.split(',')[-1].strip()
+    return hashlib.sha256(f"ip:{ip}".encode()).hexdigest()[:32]
+
+
+def platform_cap(platform: str) -> int:
+    caps = getattr(settings, 'PLATFORM_CONCURRENCY', {})
+    return caps.get(platform, getattr(settings, 'DEFAULT_PLATFORM_CONCURRENCY', 20))
+
+
+def active_filter(now=None) -> Q:
+    """
+    Runs currently occupying a runner: dispatched and not finished, or being
+    sent under a live lease. Dispatched runs that never reported back stop
+    counting after INFLIGHT_MAX_AGE.
+    """
+    now = now or timezone.now()
+    max_age = timedelta(seconds=getattr(settings, 'INFLIGHT_MAX_AGE', 3 * 3600))
+    return Q(status='InProgress') & (
+        Q(dispatch_state='Dispatched', dispatched_at__gte=now - max_age)
+        | Q(dispatch_state='Sending', next_dispatch_at__gt=now)
+    )
+
+
+def active_counts() -> tuple[dict, dict]:
+    """
+    (runs per platform, runs per client) currently occupying runners.
+    """
+    per_platform = {}
+    per_client = {}
+    rows = (
+        GithubRun.objects.filter(active_filter())
+        .values('platform', 'client_key')
+        .annotate(n=Count('id'))
+    )
+    for row in rows:
+        per_platform[row['platform']] = per_platform.get(row['platform'], 0) + row['n']
+        per_client[row['client_key']] = per_client.get(row['client_key'], 0) + row['n']
+    return per_platform, per_client
+
+
+def fair_order(candidates: list[dict], per_client: dict) -> list[dict]:
+    """
+    Order queued runs: higher priority lane first; within a lane, clients
+    take turns (a client's n-th queued run ranks behind every other client's
+    earlier ones, counting what it already has running); then oldest first.
+    """
+    ordered = sorted(candidates, key=lambda r: (r['next_dispatch_at'] or r['created_at'], r['id']))
+    seen = {}
+    keyed = []
+    for row in ordered:
+        client = row['client_key']
+        turn = per_client.get(client, 0) + seen.get(client, 0)
+        seen[client] = seen.get(client, 0) + 1
+        keyed.append(((-row['priority'], turn, row['next_dispatch_at'] or row['created_at'], row['id']), row))
+    keyed.sort(key=lambda item: item[0])
+    return [row for _, row in keyed]
+
+
+def _queued_rows(due_only: bool, platforms=None) -> list[dict]:
+    now = timezone.now()
+    queryset = GithubRun.objects.filter(
+        Q(dispatch_state='Queued') | Q(dispatch_state='Sending', next_dispatch_at__lte=now)
+    )
+    if due_only:
+        queryset = queryset.filter(Q(next_dispatch_at__isnull=True) | Q(next_dispatch_at__lte=now))
+    if platforms is not None:
+        queryset = queryset.filter(platform__in=platforms)
+    return list(
+        queryset.order_by('next_dispatch_at', 'id').values(
+            'id', 'uuid', 'platform', 'client_key', 'priority', 'dispatch_attempts',
+            'next_dispatch_at', 'created_at',
+        )[:CANDIDATE_WINDOW]
+    )
+
+
+def pick_due(limit: int) -> list[dict]:
+    """
+    Choose up to `limit` due runs to dispatch now, respecting each
+    platform's concurrency cap and fair share between clients.
+    """
+    per_platform, per_client = active_counts()
+    picked = []
+    taken = dict(per_platform)
+    for row in fair_order(_queued_rows(due_only=True), per_client):
+        if len(picked) >= limit:
+            break
+        if taken.get(row['platform'], 0) >= platform_cap(row['platform']):
+            continue
+        taken[row['platform']] = taken.get(row['platform'], 0) + 1
+        picked.append(row)
+    return picked
+
+
+def typical_duration(platform: str) -> float:
+    """
+    Mean seconds from dispatch to the final status over recent successful
+    builds of `platform`, cached for five minutes.
+    """
+    cached = _duration_cache.get(platform)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+    recent = list(
+        GithubRun.objects.filter(platform=platform, status='Success', dispatched_at__isnull=False)
+        .order_by('-updated_at').values_list('dispatched_at', 'updated_at')[:20]
+    )
+    durations = [(done - started).total_seconds() for started, done in recent if done > started]
+    fallback = getattr(settings, 'BUILD_DURATION_ESTIMATE', 25 * 60)
+    estimate = sum(durations) / len(durations) if durations else fallback
+    _duration_cache[platform] = (estimate, time.monotonic() + 300)
+    return estimate
+
+
+def queue_info(runs) -> dict[str, dict]:
+    """
+    Queue position (1-based, per platform) and an estimated start time for
+    each queued run in `runs`, keyed by uuid. Runs not waiting for dispatch
+    are left out.
+    """
+    waiting = [r for r in runs if r.status == 'InProgress' and r.dispatch_state in ('Queued', 'Sending')]
+    if not waiting:
+        return {}
+    platforms = {r.platform for r in waiting}
+    per_platform, per_client = active_counts()
+    by_platform = {}
+    for row in fair_order(_queued_rows(due_only=False, platforms=platforms), per_client):
+        by_platform.setdefault(row['platform'], []).append(row['uuid'])
+
+    now = timezone.now()
+    info = {}
+    for run in waiting:
+        order = by_platform.get(run.platform, [])
+        if run.uuid not in order:
+            continue
+        position = order.index(run.uuid) + 1
+        cap = platform_cap(run.platform)
+        free = max(cap - per_platform.get(run.platform, 0), 0)
+        if position <= free:
+            wait = 0.0
+        else:
+            wait = math.ceil((position - free) / max(cap, 1)) * typical_duration(run.platform)
+        # Minute resolution, so the estimate (and the status ETag) only moves when it means something
+        start = (now + timedelta(seconds=wait)).replace(second=0, microsecond=0)
+        info[run.uuid] = {
+            'queue_position': position,
+            'estimated_start': start.isoformat(),
+        }
+    return info
@@ -0,0 +1,250 @@
+import hashlib
+import secrets
+import threading
+import mimetypes
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+logger = logging.getLogger(__name__)
+
+
+def offload_response(target_file: Path, root_dir: Path, filename: str) -> HttpResponse | None:
+    """
+    Hand the byte transfer of an already-authorised file to the front proxy.
+
+    DOWNLOAD_OFFLOAD selects the mechanism:
+      'nginx'    -> X-Accel-Redirect to DOWNLOAD_ACCEL_PREFIX + path relative to root_dir
+      'sendfile' -> X-Sendfile with the absolute path (Apache mod_xsendfile, lighttpd)
+    Returns None when offloading is disabled so the caller serves the file itself.
+    """
+    mode = (getattr(settings, 'DOWNLOAD_OFFLOAD', '') or '').lower()
+    if not mode:
+        return None
+
+    content_type, encoding = mimetypes.guess_type(filename)
+    response = HttpResponse(content_type=content_type or 'application/octet-stream')
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+
+    if mode == 'nginx':
+        prefix = getattr(settings, 'DOWNLOAD_ACCEL_PREFIX', '/_protected/').rstrip('/')
+        relative = target_file.relative_to(root_dir).as_posix()
+        response['X-Accel-Redirect'] = f"{prefix}/{quote(relative)}"
+    elif mode == 'sendfile':
+        response['X-Sendfile'] = str(target_file)
+    else:
+        logger.error(f"Unknown DOWNLOAD_OFFLOAD mode: {mode}")
+        return None
+    return response
+
+
+MAX_RANGES = 16
+CHUNK_SIZE = 64 * 1024
+
+
+def artifact_etag(stat_result) -> str:
+    """
+    Strong ETag from file metadata. Artifacts are written once and replaced
+    by rename, so inode + size + mtime identify the exact bytes.
+    """
+    return f'"{stat_result.st_ino:x}-{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def parse_range_header(header: str, size: int) -> list[tuple[int, int]] | None:
+    """
+    Parse an RFC 7233 byte range header into inclusive (start, end) pairs.
+    Returns None when the header should be ignored (malformed, not bytes,
+    too many ranges) and [] when no range is satisfiable.
+    """
+    units, _, spec = header.partition('=')
+    if units.strip().lower() != 'bytes' or not spec:
+        return None
+    parts = [p.strip() for p in spec.split(',') if p.strip()]
+    if not parts or len(parts) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for part in parts:
+        first, dash, last = part.partition('-')
+        if not dash:
+            return None
+        try:
+            if first == '':
+                suffix = int(last)
+                if suffix <= 0:
+                    continue
+                start, end = max(size - suffix, 0), size - 1
+            else:
+                start = int(first)
+                end = int(last) if last else size - 1
+                if last and start > end:
+                    return None
+                end = min(end, size - 1)
+        except ValueError:
+            return None
+        if start < 0:
+            return None
+        if start < size:
+            ranges.append((start, end))
+    return ranges
+
+
+def _iter_file(path: Path, ranges: list[tuple[int, int]], prefixes: list[bytes] = (), suffix: bytes = b''):
+    with open(path, 'rb') as f:
+        for i, (start, end) in enumerate(ranges):
+            if prefixes:
+                yield prefixes[i]
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+    if suffix:
+        yield suffix
+
+
+def _range_requested(request, etag: str, last_modified: int) -> bool:
+    if 'HTTP_RANGE' not in request.META or request.method not in ('GET', 'HEAD'):
+        return False
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def file_response(request, target_file: Path, filename: str):
+    """
+    Serve a file with HEAD, conditional GET (If-None-Match / If-Modified-Since)
+    and single or multi-part byte ranges.
+    """
+    try:
+        stat_result = target_file.stat()
+    except OSError:
+        return HttpResponse("File not found", status=404)
+    size = stat_result.st_size
+    etag = artifact_etag(stat_result)
+    last_modified = int(stat_result.st_mtime)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    def with_headers(response):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Accept-Ranges'] = 'bytes'
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+        return response
+
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if conditional is not None:
+        return with_headers(conditional)
+
+    ranges = None
+    if _range_requested(request, etag, last_modified):
+        ranges = parse_range_header(request.META['HTTP_RANGE'], size)
+        if ranges == []:
+            response = with_headers(HttpResponse(status=416))
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    is_head = request.method == 'HEAD'
+    if not ranges:
+        if is_head:
+            response = HttpResponse(content_type=content_type)
+        else:
+            response = FileResponse(open(target_file, 'rb'), content_type=content_type)
+        response['Content-Length'] = str(size)
+        return with_headers(response)
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        length = end - start + 1
+        if is_head:
+            response = HttpResponse(status=206, content_type=content_type)
+        else:
+            response = StreamingHttpResponse(_iter_file(target_file, ranges), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(length)
+        return with_headers(response)
+
+    boundary = secrets.token_hex(16)
+    prefixes = [
+        (
+            f'\r\n--{boundary}\r\n'
+            f'Content-Type: {content_type}\r\n'
+            f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'
+        ).encode('ascii')
+        for start, end in ranges
+    ]
+    suffix = f'\r\n--{boundary}--\r\n'.encode('ascii')
+    length = sum(len(p) for p in prefixes) + sum(e - s + 1 for s, e in ranges) + len(suffix)
+    multipart_type = f'multipart/byteranges; boundary={boundary}'
+    if is_head:
+        response = HttpResponse(status=206, content_type=multipart_type)
+    else:
+        response = StreamingHttpResponse(
+            _iter_file(target_file, ranges, prefixes, suffix), status=206, content_type=multipart_type
+        )
+    response['Content-Length'] = str(length)
+    return with_headers(response)
+
+
+class ByteLRU:
+    """
+    Thread-safe LRU of small immutable files, bounded by total bytes.
+    Entries are keyed on path + inode/size/mtime so a replaced file is
+    never served stale.
+    """
+
+    def __init__(self, max_bytes: int, max_item_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, path: Path) -> tuple[bytes, str]:
+        """
+        Return (content, etag) for `path`, reading from disk only on a miss.
+        The ETag is a SHA-256 of the content.
+        """
+        st = path.stat()
+        key = (str(path), st.st_ino, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+
+        with open(path, 'rb') as f:
+            data = f.read()
+        entry = (data, f'"{hashlib.sha256(data).hexdigest()[:32]}"')
+        if len(data) <= self.max_item_bytes:
+            self._put(key, entry)
+        return entry
+
+    def _put(self, key, entry):
+        size = len(entry[0])
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = entry
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes and self._entries:
+                _, (old_data, _) = self._entries.popitem(last=False)
+                self.current_bytes -= len(old_data)
+
+
+png_cache = ByteLRU(
+    max_bytes=getattr(settings, 'PNG_CACHE_MAX_BYTES', 32 * 1024 * 1024),
+    max_item_bytes=getattr(settings, 'PNG_CACHE_MAX_ITEM_BYTES', 2 * 1024 * 1024),
+)
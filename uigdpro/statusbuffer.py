@@ -0,0 +1,121 @@
+import time
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import GithubRun
+
+logger = logging.getLogger(__name__)
+
+# Callbacks waiting for the next commit: uuid -> status, the latest report
+# per build wins, and the (loop, future) of every caller
+_pending: dict[str, str] = {}
+_waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+_lock = threading.Lock()
+
+# Set when there is something to commit; a burst of callbacks shares one transaction
+_wake = threading.Event()
+_thread: threading.Thread | None = None
+
+
+def window() -> float:
+    return getattr(settings, 'STATUS_BATCH_WINDOW', 0.05)
+
+
+def write(updates: dict[str, str]) -> None:
+    """
+    Write a set of status changes in one transaction, one UPDATE per status
+    instead of one transaction per callback. The whole set is stamped with
+    a single updated_at so it really does collapse to one row per status.
+    """
+    groups = defaultdict(list)
+    for uuid_str, status in updates.items():
+        groups[status].append(uuid_str)
+    now = timezone.now()
+    with transaction.atomic():
+        for status, uuids in groups.items():
+            changes = {'status': status, 'updated_at': now}
+            if status != 'InProgress':
+                changes['inflight_key'] = None
+            GithubRun.objects.filter(uuid__in=uuids).update(**changes)
+
+
+def _resolve(waiters: list, error: Exception | None) -> None:
+    for loop, future in waiters:
+        def settle(future=future):
+            if future.done():
+                return
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+        try:
+            loop.call_soon_threadsafe(settle)
+        except RuntimeError:
+            # The caller's loop is gone; nobody is left to answer
+            pass
+
+
+def commit() -> int:
+    """
+    Write every waiting status in one transaction and release the callers,
+    with the database error if it failed. Returns the number of builds written.
+    """
+    with _lock:
+        updates = dict(_pending)
+        waiters = list(_waiters)
+        _pending.clear()
+        _waiters.clear()
+    if not updates:
+        return 0
+    try:
+        write(updates)
+    except Exception as e:
+        logger.error(f"Writing {len(updates)} status update(s) failed: {e}")
+        _resolve(waiters, e)
+        return 0
+    _resolve(waiters, None)
+    return len(updates)
+
+
+def _committer() -> None:
+    while True:
+        _wake.wait()
+        time.sleep(window())
+        _wake.clear()
+        close_old_connections()
+        commit()
+
+
+def _start() -> None:
+    global _thread
+    with _lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_committer, name='status-committer', daemon=True)
+            _thread.start()
+
+
+async def record(uuid_str: str, status: str) -> None:
+    """
+    Store a status callback. Returns once it is committed, so an
+    acknowledged callback is never lost; callbacks arriving within
+    STATUS_BATCH_WINDOW seconds of each other share one transaction.
+    With the window at 0 every callback is its own UPDATE.
+    """
+    if window() <= 0:
+        await sync_to_async(write)({uuid_str: status})
+        return
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    with _lock:
+        _pending[uuid_str] = status
+        _waiters.append((loop, future))
+    _start()
+    _wake.set()
+    await future
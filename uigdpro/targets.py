@@ -0,0 +1,143 @@
+import time
+import logging
+import threading
+
+from django.conf import settings
+from django.db.models import Count
+
+from . import breakers
+from .models import GithubRun
+from .scheduler import active_filter
+
+logger = logging.getLogger(__name__)
+
+# target name -> (remaining requests, reset epoch) from the last GitHub response
+_rate_limits: dict[str, tuple[int, float]] = {}
+_rate_lock = threading.Lock()
+
+
+def configured_targets() -> list[dict]:
+    """
+    DISPATCH_TARGETS entries with defaults filled in. Without any, the
+    single GHUSER/REPONAME/GHBEARER repository is the only target.
+    """
+    targets = getattr(settings, 'DISPATCH_TARGETS', None) or [{
+        'name': 'default',
+        'owner': settings.GHUSER,
+        'repo': settings.REPONAME,
+        'token': settings.GHBEARER,
+    }]
+    return [
+        {
+            'name': t.get('name') or f"{t['owner']}/{t['repo']}",
+            'owner': t['owner'],
+            'repo': t['repo'],
+            'token': t['token'],
+            'weight': float(t.get('weight', 1)) or 1.0,
+            'max_running': int(t.get('max_running', 0)),
+        }
+        for t in targets
+    ]
+
+
+def get_target(name: str) -> dict | None:
+    for target in configured_targets():
+        if target['name'] == name:
+            return target
+    return None
+
+
+def breaker_name(target: dict) -> str:
+    return f"github:{target['name']}"
+
+
+def note_rate_limit(target: dict, response) -> None:
+    remaining = response.headers.get('X-RateLimit-Remaining')
+    reset = response.headers.get('X-RateLimit-Reset')
+    if remaining is None or reset is None:
+        return
+    try:
+        with _rate_lock:
+            _rate_limits[target['name']] = (int(remaining), float(reset))
+    except ValueError:
+        pass
+
+
+def rate_limit_remaining(target: dict) -> int | None:
+    """
+    Requests left for the target's token, or None when unknown or the
+    window has already reset.
+    """
+    with _rate_lock:
+        known = _rate_limits.get(target['name'])
+    if not known or known[1] <= time.time():
+        return None
+    return known[0]
+
+
+def running_counts() -> dict[str, int]:
+    rows = (
+        GithubRun.objects.filter(active_filter())
+        .values('dispatch_target')
+        .annotate(n=Count('id'))
+    )
+    return {row['dispatch_target']: row['n'] for row in rows}
+
+
+def available_targets() -> list[dict]:
+    """
+    Targets that can take a dispatch now: circuit not open, rate limit not
+    exhausted and below their max_running.
+    """
+    reserve = getattr(settings, 'DISPATCH_RATE_LIMIT_RESERVE', 50)
+    running = running_counts()
+    usable = []
+    for target in configured_targets():
+        if not breakers.is_available(breaker_name(target)):
+            continue
+        remaining = rate_limit_remaining(target)
+        if remaining is not None and remaining <= reserve:
+            continue
+        if target['max_running'] and running.get(target['name'], 0) >= target['max_running']:
+            continue
+        usable.append(dict(target, running=running.get(target['name'], 0), remaining=remaining))
+    return usable
+
+
+def _load(target: dict) -> tuple:
+    return (
+        (target['running'] + 1) / target['weight'],
+        -(target['remaining'] if target['remaining'] is not None else 10 ** 9),
+    )
+
+
+def choose_targets(count: int) -> list[dict | None]:
+    """
+    Targets for `count` dispatches about to be sent together, one at a
+    time: least-loaded by running jobs per unit of weight, ties to the token
+    with the most rate limit left. Each pick counts towards its target's
+    load and max_running, so a batch spreads out instead of all landing on
+    the target that was least loaded before it. None where nothing is left.
+    """
+    reserve = getattr(settings, 'DISPATCH_RATE_LIMIT_RESERVE', 50)
+    usable = available_targets()
+    picks = []
+    for _ in range(count):
+        open_targets = [
+            t for t in usable
+            if (not t['max_running'] or t['running'] < t['max_running'])
+            and (t['remaining'] is None or t['remaining'] > reserve)
+        ]
+        if not open_targets:
+            picks.append(None)
+            continue
+        target = min(open_targets, key=_load)
+        target['running'] += 1
+        if target['remaining'] is not None:
+            target['remaining'] -= 1
+        picks.append(dict(target))
+    return picks
+
+
+def choose_target() -> dict | None:
+    return choose_targets(1)[0]
@@ -1,3 +1,1207 @@
-from django.test import TestCase
+import io
+import os
+import re
+import json
+import base64
+import hashlib
+import shutil
+import tempfile
+import time
+import threading
+from datetime import timedelta
+from io import StringIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+from uuid import uuid4
 
-# Create your tests here.
+import httpx
+import requests
+from asgiref.sync import async_to_sync
+from PIL import Image
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import blobstore, breakers, chunked, outbound, prebuild, reconcile, retention, scheduler, statusbuffer, targets, utils
+from .dispatch import claim_due_runs, enqueue_dispatch, send_dispatch, workflow_for
+from .fingerprint import compute_fingerprint
+from .images import ImageRejected, probe_image, process_image, read_image_bytes, render_icon_assets
+from .management.commands.fake_github_api import FakeActions, make_handler
+from .middleware import DeadlineMiddleware
+from .models import BuildBatch, GithubRun, UpstreamBreaker
+from .serving import ByteLRU, parse_range_header
+
+API_TOKEN = 'test-api-token'
+
+GENERATOR_FORM = {
+    'platform': 'windows', 'version': '1.4.4', 'exename': 'client', 'direction': 'both',
+    'installation': 'installationY', 'settings': 'settingsY', 'theme': 'system',
+    'themeDorO': 'default', 'passApproveMode': 'password', 'permissionsDorO': 'default',
+    'permissionsType': 'custom',
+}
+
+
+def png_bytes(size=(64, 64), mode='RGB', color=(200, 30, 30)) -> bytes:
+    output = io.BytesIO()
+    Image.new(mode, size, color).save(output, format='PNG')
+    return output.getvalue()
+
+
+class TempStorageMixin:
+    """
+    Point exe/, png/ and the blob store at a temporary directory and reset
+    the per-process caches the modules keep between calls.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        storage = override_settings(
+            BASE_DIR=self.tmp, BLOB_ROOT=str(self.tmp / 'blobs'), IMAGE_WORKERS=0,
+            EXTERNAL_API_TOKEN=API_TOKEN, GH_UPLOAD_TOKEN='upload-token', STATUS_BATCH_WINDOW=0,
+        )
+        storage.enable()
+        self.addCleanup(storage.disable)
+        breakers._cached.clear()
+        breakers._windows.clear()
+        reconcile._page_cache.clear()
+        targets._rate_limits.clear()
+        scheduler._duration_cache.clear()
+
+    def api_headers(self, **extra):
+        return dict(HTTP_AUTHORIZATION=f'Bearer {API_TOKEN}', **extra)
+
+    def make_run(self, **fields):
+        values = dict(uuid=str(uuid4()), filename='client', direction='both', platform='windows', status='InProgress')
+        values.update(fields)
+        return GithubRun.objects.create(**values)
+
+    def queue_run(self, platform='linux', **fields):
+        run = GithubRun(uuid=str(uuid4()), filename='client', direction='both', platform=platform,
+                        status='InProgress', **fields)
+        enqueue_dispatch(run, workflow_for(platform), {'ref': 'master', 'inputs': {'uuid': run.uuid}})
+        run.save()
+        return run
+
+
+class FakeGitHubMixin(TempStorageMixin):
+    """
+    Serve fake_github_api's FakeActions on a free local port for the test.
+    """
+    queue_seconds = 0
+    run_seconds = 0
+    conclusion = 'success'
+
+    def setUp(self):
+        super().setUp()
+        self.actions = FakeActions(self.queue_seconds, self.run_seconds, self.conclusion, rate_limit=5000)
+        server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(self.actions, verbose=False))
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        github = override_settings(
+            GITHUB_API_URL=f'http://127.0.0.1:{server.server_address[1]}',
+            GHUSER='owner', REPONAME='repo', GHBEARER='token', DISPATCH_TARGETS=None,
+        )
+        github.enable()
+        self.addCleanup(github.disable)
+
+
+class FingerprintTests(SimpleTestCase):
+
+    def test_volatile_inputs_are_ignored(self):
+        a = compute_fingerprint('windows', {'uuid': 'a', 'appname': 'x', 'extras': '{"upload_token": "1", "k": 2}'}, {})
+        b = compute_fingerprint('windows', {'uuid': 'b', 'appname': 'x', 'extras': '{"upload_token": "2", "k": 2}'}, {})
+        self.assertEqual(a, b)
+
+    def test_platform_inputs_and_files_matter(self):
+        base = compute_fingerprint('windows', {'appname': 'x'}, {'icon': 'aa'})
+        self.assertNotEqual(base, compute_fingerprint('linux', {'appname': 'x'}, {'icon': 'aa'}))
+        self.assertNotEqual(base, compute_fingerprint('windows', {'appname': 'y'}, {'icon': 'aa'}))
+        self.assertNotEqual(base, compute_fingerprint('windows', {'appname': 'x'}, {'icon': 'bb'}))
+
+
+class CachedBuildTests(TempStorageMixin, TestCase):
+
+    def test_cached_build_is_reused(self):
+        self.client.post('/generator/', GENERATOR_FORM)
+        run = GithubRun.objects.get()
+        GithubRun.objects.filter(pk=run.pk).update(status='Success', inflight_key=None)
+        (self.tmp / 'exe' / run.uuid).mkdir(parents=True)
+        (self.tmp / 'exe' / run.uuid / 'client.exe').write_bytes(b'exe')
+        response = self.client.post('/generator/', GENERATOR_FORM)
+        self.assertEqual(GithubRun.objects.count(), 1)
+        self.assertContains(response, run.uuid)
+
+    def test_missing_artifacts_rebuild(self):
+        self.client.post('/generator/', GENERATOR_FORM)
+        GithubRun.objects.update(status='Success', inflight_key=None)
+        self.client.post('/generator/', GENERATOR_FORM)
+        self.assertEqual(GithubRun.objects.count(), 2)
+
+
+class ClaimTests(TempStorageMixin, TestCase):
+
+    def test_claimed_run_is_leased(self):
+        run = self.queue_run()
+        self.assertEqual([r.pk for r in claim_due_runs(5)], [run.pk])
+        run.refresh_from_db()
+        self.assertEqual((run.dispatch_state, run.dispatch_attempts), ('Sending', 1))
+        self.assertEqual(claim_due_runs(5), [])
+
+    def test_expired_lease_is_claimed_again(self):
+        run = self.queue_run()
+        claim_due_runs(5)
+        GithubRun.objects.filter(pk=run.pk).update(next_dispatch_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual([r.pk for r in claim_due_runs(5)], [run.pk])
+        run.refresh_from_db()
+        self.assertEqual(run.dispatch_attempts, 2)
+
+    def test_future_runs_wait(self):
+        run = self.queue_run()
+        GithubRun.objects.filter(pk=run.pk).update(next_dispatch_at=timezone.now() + timedelta(minutes=5))
+        self.assertEqual(claim_due_runs(5), [])
+
+
+class DispatchRetryTests(TempStorageMixin, TestCase):
+
+    def send(self, status, headers=None):
+        response = requests.Response()
+        response.status_code = status
+        response._content = b'{"message": "Resource not accessible by integration"}'
+        response.headers.update(headers or {})
+        run = self.queue_run()
+        [run] = claim_due_runs(1)
+        with mock.patch('uigdpro.dispatch.outbound.post', return_value=response):
+            send_dispatch(run, targets.choose_target())
+        run.refresh_from_db()
+        return run
+
+    def test_permission_403_fails_fast(self):
+        run = self.send(403)
+        self.assertEqual((run.dispatch_state, run.status), ('Failed', 'Failed'))
+        self.assertIn('HTTP 403', run.dispatch_error)
+
+    def test_rate_limited_403_is_retried(self):
+        run = self.send(403, {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '0'})
+        self.assertEqual((run.dispatch_state, run.status), ('Queued', 'InProgress'))
+        self.assertEqual(self.send(403, {'Retry-After': '60'}).dispatch_state, 'Queued')
+
+    def test_server_errors_are_retried(self):
+        self.assertEqual(self.send(502).dispatch_state, 'Queued')
+
+
+# The dispatcher sends from worker threads, which need committed rows
+class DispatcherTests(FakeGitHubMixin, TransactionTestCase):
+
+    def test_queued_runs_are_dispatched(self):
+        runs = [self.queue_run(platform) for platform in ('linux', 'windows', 'macos')]
+        call_command('run_dispatcher', '--once', '--concurrency', '2', stdout=StringIO())
+        for run in runs:
+            run.refresh_from_db()
+            self.assertEqual(run.dispatch_state, 'Dispatched')
+            self.assertEqual(run.dispatch_target, 'default')
+        titles = sorted(r['display_title'] for r in self.actions.runs)
+        self.assertEqual(titles, sorted(f"{workflow_for(run.platform)} ({run.uuid})" for run in runs))
+
+    def test_permanent_failure(self):
+        run = self.queue_run()
+        with override_settings(GITHUB_API_URL=settings.GITHUB_API_URL + '/missing'):
+            call_command('run_dispatcher', '--once', stdout=StringIO())
+        run.refresh_from_db()
+        self.assertEqual((run.dispatch_state, run.status), ('Failed', 'Failed'))
+        self.assertIn('HTTP 404', run.dispatch_error)
+
+
+class StatusStreamTests(TempStorageMixin, TestCase):
+
+    def stream(self, uuid_str):
+        async def read():
+            response = await self.async_client.get(f'/status_stream/?uuid={uuid_str}')
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            return b''.join([chunk async for chunk in response.streaming_content]).decode()
+        return async_to_sync(read)()
+
+    def test_current_status_is_sent(self):
+        run = self.make_run(status='Success')
+        body = self.stream(run.uuid)
+        self.assertIn('event: status', body)
+        self.assertIn('"status": "Success"', body)
+
+    def test_unknown_build(self):
+        self.assertIn('event: missing', self.stream(uuid4()))
+        self.assertEqual(self.client.get('/status_stream/?uuid=nope').status_code, 400)
+
+
+class RunAdminTests(TempStorageMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+
+    def test_requeue_resets_dispatch(self):
+        run = self.queue_run()
+        GithubRun.objects.filter(pk=run.pk).update(
+            status='Failed', dispatch_state='Failed', dispatch_attempts=6, inflight_key='abc',
+            updated_at=timezone.now() - timedelta(hours=1),
+        )
+        self.client.post('/admin/uigdpro/githubrun/', {'action': 'requeue_dispatch', '_selected_action': [run.pk]})
+        run.refresh_from_db()
+        self.assertEqual((run.status, run.dispatch_state, run.dispatch_attempts), ('InProgress', 'Queued', 0))
+        self.assertIsNone(run.inflight_key)
+        self.assertGreater(run.updated_at, timezone.now() - timedelta(minutes=1))
+
+
+class BuildStatusApiTests(TempStorageMixin, TestCase):
+
+    def test_batch_lookup(self):
+        done, running = self.make_run(status='Success'), self.make_run()
+        unknown = str(uuid4())
+        response = self.client.get(f'/api/status/?uuid={done.uuid}&uuids={running.uuid},{unknown}')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['runs'][done.uuid]['status'], 'Success')
+        self.assertEqual(data['runs'][running.uuid]['status'], 'InProgress')
+        self.assertEqual(data['missing'], [unknown])
+
+    def test_etag_changes_with_status(self):
+        run = self.make_run()
+        url = f'/api/status/?uuid={run.uuid}'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        GithubRun.objects.filter(pk=run.pk).update(status='Success', updated_at=timezone.now())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.get('/api/status/').status_code, 400)
+        self.assertEqual(self.client.get('/api/status/?uuid=nope').status_code, 400)
+        with override_settings(STATUS_API_MAX_UUIDS=1):
+            self.assertEqual(self.client.get(f'/api/status/?uuids={uuid4()},{uuid4()}').status_code, 400)
+
+
+class RangeHeaderTests(SimpleTestCase):
+
+    def test_single_and_open_ended_ranges(self):
+        self.assertEqual(parse_range_header('bytes=0-9', 100), [(0, 9)])
+        self.assertEqual(parse_range_header('bytes=90-', 100), [(90, 99)])
+        self.assertEqual(parse_range_header('bytes=95-200', 100), [(95, 99)])
+
+    def test_suffix_and_multiple_ranges(self):
+        self.assertEqual(parse_range_header('bytes=-10', 100), [(90, 99)])
+        self.assertEqual(parse_range_header('bytes=0-0, -1', 100), [(0, 0), (99, 99)])
+
+    def test_unsatisfiable_range_is_empty(self):
+        self.assertEqual(parse_range_header('bytes=100-', 100), [])
+
+    def test_malformed_headers_are_ignored(self):
+        for header in ('items=0-1', 'bytes=', 'bytes=5-1', 'bytes=a-b', 'bytes=1',
+                       'bytes=' + ','.join(['0-1'] * 17)):
+            self.assertIsNone(parse_range_header(header, 100), header)
+
+
+class DownloadTests(TempStorageMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.run = self.make_run(status='Success')
+        build_dir = self.tmp / 'exe' / self.run.uuid
+        build_dir.mkdir(parents=True)
+        (build_dir / 'client.exe').write_bytes(b'0123456789')
+        self.url = f'/download/?uuid={self.run.uuid}&filename=client.exe'
+
+    def test_range_request(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=50-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_if_range_with_stale_validator_sends_everything(self):
+        etag = self.client.head(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+
+    def test_conditional_get(self):
+        response = self.client.head(self.url)
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_not_ready(self):
+        GithubRun.objects.filter(pk=self.run.pk).update(status='InProgress')
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_nginx_offload(self):
+        with override_settings(DOWNLOAD_OFFLOAD='nginx', DOWNLOAD_ACCEL_PREFIX='/_protected/'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/_protected/{self.run.uuid}/client.exe')
+        self.assertEqual(response.content, b'')
+        self.assertIn('client.exe', response['Content-Disposition'])
+
+    def test_sendfile_offload(self):
+        with override_settings(DOWNLOAD_OFFLOAD='sendfile'):
+            response = self.client.get(self.url)
+        self.assertEqual(Path(response['X-Sendfile']), (self.tmp / 'exe' / self.run.uuid / 'client.exe').resolve())
+
+    def test_offload_checks_the_build_first(self):
+        GithubRun.objects.filter(pk=self.run.pk).update(status='InProgress')
+        with override_settings(DOWNLOAD_OFFLOAD='nginx'):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('X-Accel-Redirect', response)
+
+
+class PngServingTests(TempStorageMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.uuid = str(uuid4())
+        (self.tmp / 'png' / self.uuid).mkdir(parents=True)
+        (self.tmp / 'png' / self.uuid / 'icon.png').write_bytes(b'png-bytes')
+        self.url = f'/get_png/?uuid={self.uuid}&filename=icon.png'
+
+    def test_immutable_caching(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.content, b'png-bytes')
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('immutable', response['Cache-Control'])
+        again = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again['ETag'], response['ETag'])
+
+    def test_rejected_names(self):
+        self.assertEqual(self.client.get(f'/get_png/?uuid={self.uuid}&filename=icon.exe').status_code, 400)
+        self.assertEqual(self.client.get(f'/get_png/?uuid={self.uuid}&filename=logo.png').status_code, 404)
+
+    def test_lru_is_bounded(self):
+        cache = ByteLRU(max_bytes=10, max_item_bytes=6)
+        for name, data in (('a', b'12345'), ('b', b'12345'), ('c', b'12345'), ('big', b'1234567')):
+            (self.tmp / name).write_bytes(data)
+            cache.load(self.tmp / name)
+        self.assertEqual(cache.current_bytes, 10)
+        self.assertEqual(len(cache._entries), 2)
+        (self.tmp / 'c').write_bytes(b'changed')
+        self.assertEqual(cache.load(self.tmp / 'c')[0], b'changed')
+
+
+@override_settings(IMAGE_WORKERS=0, IMAGE_MAX_PIXELS=128 * 128)
+class ImagePipelineTests(SimpleTestCase):
+
+    def test_normalises_to_rgba_png(self):
+        data = 'data:image/png;base64,' + base64.b64encode(png_bytes()).decode()
+        image = Image.open(io.BytesIO(process_image(data)))
+        self.assertEqual((image.format, image.mode, image.size), ('PNG', 'RGBA', (64, 64)))
+
+    def test_oversized_image_is_rejected_from_the_header(self):
+        with self.assertRaisesRegex(ImageRejected, 'too large'):
+            probe_image(png_bytes(size=(256, 256)))
+
+    def test_invalid_input_is_rejected(self):
+        with self.assertRaises(ImageRejected):
+            probe_image(b'not an image')
+        with self.assertRaises(ImageRejected):
+            read_image_bytes('image/png;base64,AAAA')
+        with self.assertRaises(ImageRejected):
+            process_image(b'bytes are not a supported input')
+
+
+class IconAssetTests(TempStorageMixin, TestCase):
+
+    def submit(self):
+        icon = SimpleUploadedFile('icon.png', png_bytes(mode='RGBA', color=(0, 0, 0, 255)), content_type='image/png')
+        return self.client.post('/generator/', dict(GENERATOR_FORM, iconfile=icon))
+
+    def test_every_platform_asset_is_rendered(self):
+        assets = render_icon_assets(png_bytes(mode='RGBA', color=(0, 0, 0, 255)))
+        for name in ('icon.ico', 'AppIcon.icns', 'icon.svg', 'icon.pbm', '32x32.png',
+                     'app_icon_1024.png', 'mac-tray-dark-x2.png', 'mac-tray-light-x2.png'):
+            self.assertIn(name, assets)
+        tray = Image.open(io.BytesIO(assets['mac-tray-light-x2.png']))
+        self.assertEqual((tray.mode, tray.size), ('LA', (22, 22)))
+        self.assertEqual(tray.getchannel('A').getextrema(), (255, 255))
+
+    def test_assets_are_stored_with_the_icon(self):
+        self.submit()
+        run = GithubRun.objects.get()
+        iconlink = json.loads(run.dispatch_payload['inputs']['iconlink'])
+        self.assertIn('icon.ico', iconlink['assets'])
+        stored = self.tmp / 'png' / run.uuid
+        for name in ['icon.png'] + iconlink['assets']:
+            self.assertTrue((stored / name).is_file(), name)
+
+    def test_render_failure_rejects_the_submission(self):
+        with mock.patch('uigdpro.views.render_icon_assets', side_effect=OSError('encoder missing')):
+            response = self.submit()
+        errors = [str(message) for message in get_messages(response.wsgi_request)]
+        self.assertEqual(errors, ['icon.png could not be processed, please upload a different image'])
+        self.assertFalse(GithubRun.objects.exists())
+
+
+class BlobStoreTests(TempStorageMixin, SimpleTestCase):
+
+    def test_identical_content_is_stored_once(self):
+        first, second = self.tmp / 'png' / 'a' / 'icon.png', self.tmp / 'png' / 'b' / 'icon.png'
+        digest = blobstore.write_bytes(first, b'icon')
+        self.assertEqual(blobstore.write_bytes(second, b'icon'), digest)
+        blob = blobstore.blob_path(digest)
+        self.assertEqual(blob.read_bytes(), b'icon')
+        self.assertEqual(first.stat().st_ino, blob.stat().st_ino)
+        self.assertEqual(second.stat().st_ino, blob.stat().st_ino)
+        self.assertEqual(blob.stat().st_nlink, 3)
+
+    def test_relinking_replaces_the_file(self):
+        dest = self.tmp / 'exe' / 'a' / 'client.exe'
+        blobstore.write_bytes(dest, b'old')
+        blobstore.write_bytes(dest, b'new')
+        self.assertEqual(dest.read_bytes(), b'new')
+        self.assertEqual(list(dest.parent.iterdir()), [dest])
+
+    def test_copy_fallback_is_recorded(self):
+        dest = self.tmp / 'exe' / 'a' / 'client.exe'
+        with mock.patch('uigdpro.blobstore.os.link', side_effect=OSError('cross-device link')):
+            blobstore.write_bytes(dest, b'data')
+        self.assertEqual(dest.read_bytes(), b'data')
+        self.assertEqual(dest.stat().st_nlink, 1)
+        self.assertTrue(blobstore.copies_marker().exists())
+
+
+class RetentionTests(TempStorageMixin, TestCase):
+
+    def build(self, content, status='Success', idle_days=0, **fields):
+        run = self.make_run(status=status, **fields)
+        GithubRun.objects.filter(pk=run.pk).update(updated_at=timezone.now() - timedelta(days=idle_days))
+        blobstore.write_bytes(self.tmp / 'exe' / run.uuid / 'client.exe', content)
+        return run
+
+    def test_budget_evicts_least_recently_used(self):
+        old, recent = self.build(b'a' * 100, idle_days=2), self.build(b'b' * 100, idle_days=1)
+        running = self.build(b'c' * 100, status='InProgress', idle_days=3)
+        result = retention.prune(max_bytes=250, orphan_grace=timedelta(hours=1))
+        self.assertEqual(result['evicted'], [old.uuid])
+        self.assertFalse((self.tmp / 'exe' / old.uuid).exists())
+        self.assertTrue((self.tmp / 'exe' / recent.uuid).exists())
+        self.assertTrue((self.tmp / 'exe' / running.uuid).exists())
+
+    def test_shared_blobs_are_counted_once(self):
+        self.build(b'a' * 100, idle_days=2)
+        self.build(b'a' * 100, idle_days=1)
+        self.assertEqual(retention.prune(max_bytes=100, orphan_grace=timedelta(hours=1))['evicted'], [])
+
+    def test_evicted_runs_keep_failures_visible(self):
+        succeeded = self.build(b'a', idle_days=40)
+        failed = self.build(b'b', status='Failed', idle_days=40)
+        cancelled = self.build(b'c', status='Cancelled', idle_days=40)
+        retention.prune(max_age=timedelta(days=30), orphan_grace=timedelta(hours=1))
+        for run, status in ((succeeded, 'Expired'), (failed, 'Failed'), (cancelled, 'Cancelled')):
+            run.refresh_from_db()
+            self.assertEqual(run.status, status)
+            self.assertIsNotNone(run.evicted_at)
+
+    def test_dry_run_changes_nothing(self):
+        run = self.build(b'a', idle_days=40)
+        result = retention.prune(max_age=timedelta(days=30), dry_run=True)
+        self.assertEqual(result['evicted'], [run.uuid])
+        self.assertTrue((self.tmp / 'exe' / run.uuid / 'client.exe').exists())
+
+    def test_orphaned_blobs_are_collected_after_the_grace(self):
+        run = self.build(b'a', idle_days=40)
+        blob = blobstore.blob_path(blobstore.store_bytes(b'a'))
+        retention.prune(max_age=timedelta(days=30), orphan_grace=timedelta(hours=1))
+        self.assertTrue(blob.exists(), "unlinked just now, still within the grace")
+        time.sleep(1.1)
+        self.assertEqual(retention.collect_orphaned_blobs(timedelta(seconds=1)), (1, 1))
+        self.assertFalse(blob.exists())
+
+    def test_copied_links_stop_collection(self):
+        blob = blobstore.blob_path(blobstore.store_bytes(b'a'))
+        blobstore.copies_marker().touch()
+        time.sleep(1.1)
+        self.assertEqual(retention.collect_orphaned_blobs(timedelta(seconds=1)), (0, 0))
+        self.assertTrue(blob.exists())
+
+    def test_reuse_keeps_download_validators(self):
+        run = self.build(b'0123456789')
+        url = f'/download/?uuid={run.uuid}&filename=client.exe'
+        before = self.client.head(url)
+        time.sleep(0.01)
+        blobstore.write_bytes(self.tmp / 'exe' / str(uuid4()) / 'client.exe', b'0123456789')
+        after = self.client.head(url)
+        self.assertEqual((after['ETag'], after['Last-Modified']), (before['ETag'], before['Last-Modified']))
+
+
+class CustomClientUploadTests(TempStorageMixin, TestCase):
+
+    def upload(self, content=b'MZ-artifact', token='upload-token', name='client.exe'):
+        self.uuid = str(uuid4())
+        return self.client.post('/save_custom_client/', {
+            'token': token, 'uuid': self.uuid, 'file': SimpleUploadedFile(name, content),
+        })
+
+    def staged(self):
+        return list((self.tmp / 'blobs' / 'tmp').iterdir())
+
+    def test_upload_is_linked_from_the_blob_store(self):
+        self.assertEqual(self.upload().status_code, 200)
+        stored = self.tmp / 'exe' / self.uuid / 'client.exe'
+        self.assertEqual(stored.read_bytes(), b'MZ-artifact')
+        blob = blobstore.blob_path(hashlib.sha256(b'MZ-artifact').hexdigest())
+        self.assertEqual(stored.stat().st_ino, blob.stat().st_ino)
+        self.assertEqual(self.staged(), [])
+
+    def test_rejected_upload_leaves_nothing_behind(self):
+        self.assertEqual(self.upload(token='wrong').status_code, 403)
+        self.assertEqual(self.staged(), [])
+        self.assertFalse((self.tmp / 'exe').exists())
+        self.assertEqual(self.upload(name='client exe').status_code, 400)
+        self.assertEqual(self.staged(), [])
+
+
+@override_settings(UPLOAD_PART_SIZE=chunked.MIN_PART_SIZE)
+class ChunkedUploadTests(TempStorageMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.uuid = str(uuid4())
+        self.data = os.urandom(chunked.MIN_PART_SIZE * 2 + 10)
+        self.auth = {'HTTP_AUTHORIZATION': 'Bearer upload-token'}
+
+    def init(self, filename='client.exe', sha256=None):
+        return self.client.post('/upload/init/', {
+            'uuid': self.uuid, 'filename': filename, 'size': len(self.data),
+            'sha256': sha256 or hashlib.sha256(self.data).hexdigest(),
+        }, **self.auth)
+
+    def put(self, index, filename='client.exe'):
+        part = self.data[index * chunked.MIN_PART_SIZE:(index + 1) * chunked.MIN_PART_SIZE]
+        return self.client.put(f'/upload/part/?uuid={self.uuid}&filename={filename}&part={index}', part,
+                               content_type='application/octet-stream', **self.auth)
+
+    def complete(self, filename='client.exe'):
+        return self.client.post('/upload/complete/', {'uuid': self.uuid, 'filename': filename}, **self.auth)
+
+    def test_parts_in_any_order(self):
+        self.assertEqual(self.init().json()['parts'], 3)
+        for index in (2, 0):
+            self.assertEqual(self.put(index).status_code, 200)
+        status = self.client.get(f'/upload/status/?uuid={self.uuid}&filename=client.exe', **self.auth).json()
+        self.assertEqual((status['committed'], status['committed_offset']), ([0, 2], chunked.MIN_PART_SIZE))
+        self.assertEqual(self.complete().status_code, 409)
+        self.put(1)
+        self.assertEqual(self.complete().json()['size'], len(self.data))
+        self.assertEqual((self.tmp / 'exe' / self.uuid / 'client.exe').read_bytes(), self.data)
+
+    def test_resume_keeps_committed_parts(self):
+        self.init()
+        self.put(0)
+        self.assertEqual(self.init().json()['committed'], [0])
+
+    def test_checksum_mismatch_keeps_the_session(self):
+        self.init(sha256='0' * 64)
+        for index in range(3):
+            self.put(index)
+        self.assertEqual(self.complete().status_code, 422)
+        self.assertFalse((self.tmp / 'exe' / self.uuid).exists())
+        self.assertEqual(self.init().json()['committed'], [])
+
+    def test_dot_names_are_rejected(self):
+        self.init()
+        for filename in ('..', '.', '.hidden'):
+            self.assertEqual(self.init(filename=filename).status_code, 400, filename)
+            self.assertEqual(self.complete(filename=filename).status_code, 400, filename)
+        with self.assertRaises(chunked.ChunkedUploadError):
+            chunked.session_dir(self.uuid, '..')
+        with self.assertRaises(chunked.ChunkedUploadError):
+            chunked.session_dir('..', 'client.exe')
+        self.assertEqual(self.put(0).status_code, 200, "the other session is untouched")
+
+    def test_requires_the_upload_token(self):
+        self.auth = {}
+        self.assertEqual(self.init().status_code, 403)
+
+
+class OutboundPoolTests(FakeGitHubMixin, SimpleTestCase):
+
+    def test_one_session_per_host(self):
+        self.addCleanup(outbound.close_all)
+        session = outbound.session_for('https://api.github.com/repos')
+        self.assertIs(outbound.session_for('https://api.github.com/other'), session)
+        self.assertIsNot(outbound.session_for('https://upload.example.com/'), session)
+        self.assertIsNot(outbound.session_for('http://api.github.com/'), session)
+
+    def test_default_timeouts_are_explicit(self):
+        self.addCleanup(outbound.close_all)
+        url = f'{settings.GITHUB_API_URL}/repos/owner/repo/actions/runs'
+        with override_settings(HTTP_CONNECT_TIMEOUT=2, HTTP_READ_TIMEOUT=7), \
+                mock.patch.object(requests.Session, 'request', wraps=outbound.session_for(url).request) as sent:
+            self.assertEqual(outbound.get(url).status_code, 200)
+        self.assertEqual(sent.call_args.kwargs['timeout'], (2, 7))
+
+    def test_async_client_is_shared_per_loop(self):
+        async def fetch():
+            url = f'{settings.GITHUB_API_URL}/repos/owner/repo/actions/runs'
+            first = await outbound.aget(url)
+            client = outbound.async_client()
+            await outbound.aget(url)
+            self.assertIs(outbound.async_client(), client)
+            await client.aclose()
+            return first.status_code
+        self.assertEqual(async_to_sync(fetch)(), 200)
+
+
+
+@override_settings(BREAKER_MIN_CALLS=3, BREAKER_FAILURE_RATE=0.5, BREAKER_COOLDOWN=30, BREAKER_SLOW_SECONDS=10)
+class CircuitBreakerTests(TempStorageMixin, TestCase):
+    name = 'github:test'
+
+    def state(self):
+        breakers._forget(self.name)
+        return breakers.get_breaker(self.name).state
+
+    def trip(self):
+        for _ in range(3):
+            breakers.record(self.name, False, 0.1, 'HTTP 502')
+
+    def cool_down(self):
+        UpstreamBreaker.objects.filter(name=self.name).update(opened_at=timezone.now() - timedelta(seconds=31))
+        breakers._forget(self.name)
+
+    def test_trips_on_failure_rate(self):
+        breakers.record(self.name, True, 0.1)
+        breakers.record(self.name, False, 0.1, 'HTTP 502')
+        self.assertEqual(self.state(), 'Closed')
+        breakers.record(self.name, False, 0.1, 'HTTP 503')
+        self.assertEqual(self.state(), 'Open')
+        row = UpstreamBreaker.objects.get(name=self.name)
+        self.assertEqual((row.window_calls, row.window_failures, row.last_error), (3, 2, 'HTTP 503'))
+
+    def test_slow_calls_count_as_bad(self):
+        for _ in range(3):
+            breakers.record(self.name, True, 11)
+        self.assertEqual(self.state(), 'Open')
+
+    def test_open_breaker_fails_fast_until_the_cooldown(self):
+        self.trip()
+        with self.assertRaises(breakers.UpstreamUnavailable) as raised:
+            breakers.acquire(self.name)
+        self.assertGreater(raised.exception.retry_after, 25)
+        self.cool_down()
+        breakers.acquire(self.name)
+        self.assertEqual(self.state(), 'HalfOpen')
+        with self.assertRaises(breakers.UpstreamUnavailable):
+            breakers.acquire(self.name)
+
+    def test_probe_success_closes(self):
+        self.trip()
+        self.cool_down()
+        breakers.acquire(self.name)
+        time.sleep(0.01)
+        breakers.record(self.name, True, 0.001)
+        self.assertEqual(self.state(), 'Closed')
+        breakers.acquire(self.name)
+
+    def test_probe_failure_reopens(self):
+        self.trip()
+        self.cool_down()
+        breakers.acquire(self.name)
+        time.sleep(0.01)
+        breakers.record(self.name, False, 0.001, 'HTTP 500')
+        self.assertEqual(self.state(), 'Open')
+        self.assertGreater(breakers.retry_after(breakers.get_breaker(self.name)), 25)
+
+    def test_late_results_do_not_move_the_breaker(self):
+        self.trip()
+        opened_at = UpstreamBreaker.objects.get(name=self.name).opened_at
+        breakers.record(self.name, True, 0.1)
+        breakers.record(self.name, False, 0.1, 'HTTP 500')
+        self.assertEqual(self.state(), 'Open')
+        self.assertEqual(UpstreamBreaker.objects.get(name=self.name).opened_at, opened_at)
+        self.cool_down()
+        breakers.acquire(self.name)
+        # Started long before the probe was let through
+        breakers.record(self.name, True, 5)
+        self.assertEqual(self.state(), 'HalfOpen')
+
+    def test_closed_calls_stay_in_memory(self):
+        breakers.get_breaker(self.name)
+        with self.assertNumQueries(0):
+            for _ in range(20):
+                breakers.acquire(self.name)
+                breakers.record(self.name, True, 0.1)
+
+
+class DeadlineTests(FakeGitHubMixin, SimpleTestCase):
+
+    def test_budget_is_shared_by_outbound_calls(self):
+        url = f'{settings.GITHUB_API_URL}/repos/owner/repo/actions/runs'
+        with outbound.deadline(0.001):
+            time.sleep(0.01)
+            with self.assertRaises(outbound.DeadlineExceeded):
+                outbound.get(url)
+        self.assertIsNone(outbound.remaining_budget())
+
+    def test_nested_budgets_only_shrink(self):
+        with outbound.deadline(1):
+            with outbound.deadline(60):
+                self.assertLessEqual(outbound.remaining_budget(), 1)
+
+    def test_exhausted_budget_raises_neutral_error_on_both_paths(self):
+        url = f'{settings.GITHUB_API_URL}/repos/owner/repo/actions/runs'
+        with outbound.deadline(0.001):
+            time.sleep(0.01)
+            with self.assertRaises(outbound.DeadlineExceeded) as sync_error:
+                outbound.get(url)
+            with self.assertRaises(outbound.DeadlineExceeded) as async_error:
+                async_to_sync(outbound.aget)(url)
+        for error in (sync_error.exception, async_error.exception):
+            self.assertNotIsInstance(error, (requests.RequestException, httpx.HTTPError))
+
+    @override_settings(REQUEST_DEADLINE=20, UPLOAD_REQUEST_DEADLINE=600)
+    def test_generator_view_gets_the_upload_budget(self):
+        budgets = {}
+
+        def get_response(request):
+            budgets[request.path] = outbound.remaining_budget()
+            return HttpResponse('')
+
+        middleware = DeadlineMiddleware(get_response)
+        for path in ('/', '/generator/', '/startgh/', '/no-such-page/'):
+            middleware(RequestFactory().get(path))
+        self.assertGreater(budgets['/'], 500)
+        self.assertGreater(budgets['/generator/'], 500)
+        self.assertLessEqual(budgets['/startgh/'], 20)
+        self.assertLessEqual(budgets['/no-such-page/'], 20)
+
+
+class FakeSeafile(BaseHTTPRequestHandler):
+    """Upload link, file detail and upload endpoints of a Seafile server."""
+    stored: dict = {}
+    uploads: list = []
+
+    def reply(self, status, body=b''):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.startswith('/api/v2.1/repos/repo/upload-link/'):
+            return self.reply(200, json.dumps(f'http://{self.headers["Host"]}/upload').encode())
+        if self.path.startswith('/api2/repos/repo/file/detail/'):
+            name = self.path.rsplit('%2F', 1)[-1]
+            return self.reply(200 if name in self.stored else 404, b'{}')
+        self.reply(404)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.uploads.append(body)
+        name = re.search(rb'filename="([^"]+)"', body).group(1).decode()
+        self.stored[name] = body
+        self.reply(200, b'"ok"')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class UploadServerTests(TempStorageMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        FakeSeafile.stored, FakeSeafile.uploads = {}, []
+        server = ThreadingHTTPServer(('127.0.0.1', 0), FakeSeafile)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        for name, value in (('UP_SERVER', f'http://127.0.0.1:{server.server_address[1]}'),
+                            ('UP_TOKEN', 'token'), ('UP_REPO_ID', 'repo'), ('UP_UPLOAD_DIR', '/uploads/')):
+            patcher = mock.patch.object(utils, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        utils._known_files.clear()
+        utils._link_cache.update(link=None, expires=0.0)
+        self.data = os.urandom(utils.STREAM_CHUNK + 100)
+
+    def upload(self, name='setup.exe'):
+        return async_to_sync(utils.upload_to_server)(io.BytesIO(self.data), name)
+
+    def test_file_is_streamed_under_its_digest(self):
+        digest = hashlib.sha256(self.data).hexdigest()
+        self.assertEqual(self.upload(), f'/uploads/{digest}.exe')
+        [body] = FakeSeafile.uploads
+        self.assertIn(self.data, body)
+
+    def test_identical_content_is_uploaded_once(self):
+        first = self.upload()
+        self.assertEqual(self.upload(name='renamed.exe'), first)
+        utils._known_files.clear()
+        self.assertEqual(self.upload(), first)
+        self.assertEqual(len(FakeSeafile.uploads), 1)
+
+    def test_multipart_length_matches_the_body(self):
+        stream = utils.MultipartStream({'parent_dir': '/uploads/'}, 'file', io.BytesIO(self.data), 'x.bin', len(self.data))
+        self.assertEqual(len(b''.join(stream)), len(stream))
+
+
+class CoalescingTests(TempStorageMixin, TestCase):
+
+    def test_identical_submissions_share_one_build(self):
+        self.client.post('/generator/', GENERATOR_FORM)
+        self.client.post('/generator/', GENERATOR_FORM)
+        run = GithubRun.objects.get()
+        self.assertEqual(run.inflight_key, run.fingerprint)
+        self.assertEqual(run.hits, 1)
+
+    def test_finished_build_releases_the_inflight_key(self):
+        self.client.post('/generator/', GENERATOR_FORM)
+        run = GithubRun.objects.get()
+        response = self.client.post('/updategh/', json.dumps({'uuid': run.uuid, 'status': 'Failed'}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.client.post('/generator/', GENERATOR_FORM)
+        self.assertEqual(GithubRun.objects.count(), 2)
+        self.assertEqual(GithubRun.objects.filter(inflight_key__isnull=False).count(), 1)
+
+
+class StartGhTests(TempStorageMixin, TestCase):
+
+    def post(self, body, **headers):
+        return self.client.post('/startgh/', json.dumps(body), content_type='application/json',
+                                **self.api_headers(**headers))
+
+    def test_generated_uuid_is_dispatched(self):
+        response = self.post({'ref': 'master', 'platform': 'linux', 'inputs': {'filename': 'x'}})
+        self.assertEqual(response.status_code, 204)
+        run = GithubRun.objects.get(uuid=response['X-Build-UUID'])
+        self.assertEqual(run.dispatch_payload['inputs']['uuid'], run.uuid)
+        self.assertEqual(run.dispatch_state, 'Queued')
+
+    def test_idempotency_key_replays(self):
+        body = {'ref': 'master', 'platform': 'linux', 'inputs': {'filename': 'x'}}
+        first = self.post(body, HTTP_IDEMPOTENCY_KEY='abc')
+        second = self.post(body, HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(first['X-Build-UUID'], second['X-Build-UUID'])
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(GithubRun.objects.count(), 1)
+
+    def test_requests_without_key_are_independent(self):
+        other = self.make_run()
+        response = self.post({'ref': 'master', 'platform': 'linux', 'inputs': {'filename': 'x'}})
+        self.assertNotEqual(response['X-Build-UUID'], other.uuid)
+        self.assertEqual(GithubRun.objects.count(), 2)
+
+    def test_caller_uuid_replays(self):
+        myuuid = str(uuid4())
+        body = {'ref': 'master', 'platform': 'linux', 'inputs': {'uuid': myuuid}}
+        self.assertEqual(self.post(body)['X-Build-UUID'], myuuid)
+        self.assertEqual(self.post(body)['Idempotent-Replayed'], 'true')
+        self.assertEqual(GithubRun.objects.count(), 1)
+
+    def test_unauthorized(self):
+        response = self.client.post('/startgh/', '{}', content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+
+class FairShareTests(TempStorageMixin, TestCase):
+
+    def row(self, pk, client, priority=0):
+        return {'id': pk, 'uuid': str(pk), 'client_key': client, 'priority': priority,
+                'next_dispatch_at': None, 'created_at': timezone.now() + timedelta(seconds=pk)}
+
+    def test_clients_take_turns(self):
+        rows = [self.row(1, 'a'), self.row(2, 'a'), self.row(3, 'a'), self.row(4, 'b'), self.row(5, 'c')]
+        self.assertEqual([r['id'] for r in scheduler.fair_order(rows, {})], [1, 4, 5, 2, 3])
+
+    def test_running_builds_count_against_the_client(self):
+        rows = [self.row(1, 'a'), self.row(2, 'b')]
+        self.assertEqual([r['id'] for r in scheduler.fair_order(rows, {'a': 2})], [2, 1])
+
+    def test_priority_lane_goes_first(self):
+        rows = [self.row(1, 'a'), self.row(2, 'b', priority=10)]
+        self.assertEqual([r['id'] for r in scheduler.fair_order(rows, {})], [2, 1])
+
+    @override_settings(PLATFORM_CONCURRENCY={'linux': 1})
+    def test_platform_cap(self):
+        linux, _, windows = self.queue_run('linux'), self.queue_run('linux'), self.queue_run('windows')
+        self.assertEqual({r['id'] for r in scheduler.pick_due(5)}, {linux.pk, windows.pk})
+        claim_due_runs(5)
+        self.assertEqual(scheduler.pick_due(5), [])
+
+    def test_queue_position(self):
+        first, second = self.queue_run('linux'), self.queue_run('linux')
+        info = scheduler.queue_info([first, second])
+        self.assertEqual((info[first.uuid]['queue_position'], info[second.uuid]['queue_position']), (1, 2))
+
+
+class ClientKeyTests(SimpleTestCase):
+
+    def key(self, **meta):
+        return scheduler.client_key(RequestFactory().get('/', REMOTE_ADDR='10.0.0.1', **meta))
+
+    def test_forwarded_for_is_ignored_by_default(self):
+        self.assertEqual(self.key(HTTP_X_FORWARDED_FOR='1.2.3.4'), self.key())
+
+    @override_settings(TRUST_X_FORWARDED_FOR=True)
+    def test_trusted_proxy_uses_the_last_hop(self):
+        self.assertEqual(self.key(HTTP_X_FORWARDED_FOR='9.9.9.9, 1.2.3.4'), self.key(HTTP_X_FORWARDED_FOR='1.2.3.4'))
+        self.assertNotEqual(self.key(HTTP_X_FORWARDED_FOR='1.2.3.4'), self.key())
+
+
+# The dispatcher sends from worker threads, which need committed rows
+class DispatchPoolTests(FakeGitHubMixin, TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        pool = override_settings(DISPATCH_TARGETS=[
+            {'name': 'a', 'owner': 'owner', 'repo': 'repo-a', 'token': 't1', 'max_running': 2},
+            {'name': 'b', 'owner': 'owner', 'repo': 'repo-b', 'token': 't2', 'max_running': 2, 'weight': 2},
+        ])
+        pool.enable()
+        self.addCleanup(pool.disable)
+
+    def test_batch_respects_max_running(self):
+        runs = [self.queue_run() for _ in range(5)]
+        call_command('run_dispatcher', '--once', '--concurrency', '5', stdout=StringIO())
+        states = []
+        for run in runs:
+            run.refresh_from_db()
+            states.append((run.dispatch_state, run.dispatch_target if run.dispatch_state == 'Dispatched' else ''))
+        self.assertEqual(sorted(states), [('Dispatched', 'a'), ('Dispatched', 'a'), ('Dispatched', 'b'),
+                                          ('Dispatched', 'b'), ('Queued', '')])
+        self.assertEqual(sorted(r['repo'] for r in self.actions.runs), ['owner/repo-a'] * 2 + ['owner/repo-b'] * 2)
+        queued = GithubRun.objects.get(dispatch_state='Queued')
+        self.assertEqual(queued.dispatch_attempts, 0)
+
+    def test_picks_count_towards_the_load(self):
+        picks = [t and t['name'] for t in targets.choose_targets(5)]
+        self.assertEqual(sorted(picks[:4]), ['a', 'a', 'b', 'b'])
+        self.assertIsNone(picks[4])
+
+    def test_weight_breaks_ties(self):
+        self.assertEqual(targets.choose_target()['name'], 'b')
+
+    def test_open_circuit_skips_the_target(self):
+        for _ in range(5):
+            breakers.record('github:b', False, 0.1, 'HTTP 502')
+        self.assertEqual([t and t['name'] for t in targets.choose_targets(3)], ['a', 'a', None])
+
+
+class ReconcileTests(FakeGitHubMixin, TestCase):
+    conclusion = 'failure'
+
+    def dispatched_run(self, minutes_ago=30):
+        run = self.queue_run()
+        self.actions.dispatch('owner', 'repo', run.workflow, run.dispatch_payload)
+        GithubRun.objects.filter(pk=run.pk).update(
+            dispatch_state='Dispatched', dispatch_target='default',
+            dispatched_at=timezone.now() - timedelta(minutes=minutes_ago),
+        )
+        self.actions.runs[-1]['created'] -= minutes_ago * 60
+        return run
+
+    def test_finished_runs_are_reconciled(self):
+        run = self.dispatched_run()
+        summary = reconcile.reconcile()
+        self.assertEqual(summary['updated'], 1)
+        run.refresh_from_db()
+        self.assertEqual(run.status, 'Failed')
+        self.assertIsNone(run.inflight_key)
+
+    def test_success_needs_artifacts(self):
+        self.actions.conclusion = 'success'
+        with_files, without = self.dispatched_run(), self.dispatched_run()
+        (self.tmp / 'exe' / with_files.uuid).mkdir(parents=True)
+        (self.tmp / 'exe' / with_files.uuid / 'client.exe').write_bytes(b'exe')
+        reconcile.reconcile()
+        with_files.refresh_from_db()
+        without.refresh_from_db()
+        self.assertEqual((with_files.status, without.status), ('Success', 'Failed'))
+
+    def test_recent_runs_are_left_alone(self):
+        run = self.dispatched_run(minutes_ago=1)
+        self.assertEqual(reconcile.reconcile()['stale'], 0)
+        run.refresh_from_db()
+        self.assertEqual(run.status, 'InProgress')
+
+    def test_unchanged_listing_is_not_modified(self):
+        run = self.dispatched_run()
+        self.actions.runs[-1]['created'] = timezone.now().timestamp()
+        self.actions.queue_seconds = 3600
+        reconcile.reconcile()
+        summary = reconcile.reconcile()
+        self.assertEqual(summary['not_modified'], summary['requests'])
+        run.refresh_from_db()
+        self.assertEqual(run.status, 'InProgress')
+
+    def test_dry_run_command(self):
+        run = self.dispatched_run()
+        call_command('reconcile_runs', '--dry-run', stdout=StringIO())
+        run.refresh_from_db()
+        self.assertEqual(run.status, 'InProgress')
+
+    def test_lost_runs_fail_when_the_listing_is_complete(self):
+        run = self.queue_run()
+        GithubRun.objects.filter(pk=run.pk).update(
+            dispatch_state='Dispatched', dispatch_target='default',
+            dispatched_at=timezone.now() - timedelta(hours=13),
+        )
+        self.assertEqual(reconcile.reconcile()['lost'], 1)
+        run.refresh_from_db()
+        self.assertEqual(run.status, 'Failed')
+
+    def test_truncated_listing_does_not_lose_older_runs(self):
+        old = self.queue_run()
+        GithubRun.objects.filter(pk=old.pk).update(
+            dispatch_state='Dispatched', dispatch_target='default',
+            dispatched_at=timezone.now() - timedelta(hours=13),
+        )
+        newer = [self.dispatched_run() for _ in range(3)]
+        with mock.patch.object(reconcile, 'PER_PAGE', 1), mock.patch.object(reconcile, 'MAX_PAGES', 2):
+            summary = reconcile.reconcile()
+        self.assertEqual((summary['lost'], summary['requests']), (0, 2))
+        old.refresh_from_db()
+        self.assertEqual(old.status, 'InProgress')
+        self.assertEqual(sum(1 for run in newer if GithubRun.objects.get(pk=run.pk).status == 'Failed'), 2)
+
+
+class BulkBuildTests(TempStorageMixin, TestCase):
+
+    def post(self, body, **headers):
+        return self.client.post('/api/bulk/', json.dumps(body), content_type='application/json',
+                                **self.api_headers(**headers))
+
+    def test_batch_of_builds(self):
+        body = {'builds': [
+            {'exename': 'a', 'serverIP': 'a.example', 'platforms': ['windows', 'linux']},
+            {'exename': 'b', 'serverIP': 'b.example', 'platforms': ['macos']},
+        ]}
+        response = self.post(body)
+        self.assertEqual(response.status_code, 202)
+        data = response.json()
+        self.assertEqual(data['total'], 3)
+        uuids = [uuid_str for entry in data['builds'] for uuid_str in entry.values()]
+        self.assertEqual(GithubRun.objects.filter(uuid__in=uuids).count(), 3)
+        batch = BuildBatch.objects.get(batch_id=data['batch_id'])
+        self.assertEqual(set(batch.runs.values_list('uuid', flat=True)), set(uuids))
+
+    def test_identical_entries_coalesce(self):
+        entry = {'exename': 'a', 'serverIP': 'a.example', 'platforms': ['linux']}
+        data = self.post({'builds': [entry, entry]}).json()
+        self.assertEqual(data['builds'][0], data['builds'][1])
+        self.assertEqual(GithubRun.objects.count(), 1)
+
+    def test_idempotency_key_replays_batch(self):
+        body = {'builds': [{'exename': 'a', 'platforms': ['linux']}]}
+        first = self.post(body, HTTP_IDEMPOTENCY_KEY='k1').json()
+        second = self.post(body, HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()['batch_id'], first['batch_id'])
+        self.assertEqual(BuildBatch.objects.count(), 1)
+
+    def test_invalid_entries_are_reported(self):
+        response = self.post({'builds': [{'exename': 'a', 'platforms': ['beos']}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('0', response.json()['errors'])
+        self.assertFalse(GithubRun.objects.exists())
+
+    def test_batch_status_etag(self):
+        data = self.post({'builds': [{'exename': 'a', 'platforms': ['linux']}]}).json()
+        response = self.client.get(data['status_url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['finished'], 0)
+        again = self.client.get(data['status_url'], HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(self.client.get('/api/batch/?id=missing').status_code, 404)
+
+
+class MultiPlatformSubmissionTests(TempStorageMixin, TestCase):
+
+    def test_one_submission_builds_each_platform(self):
+        icon = SimpleUploadedFile('icon.png', png_bytes(mode='RGBA', color=(0, 0, 0, 255)), content_type='image/png')
+        response = self.client.post('/generator/', dict(GENERATOR_FORM, platform=['windows', 'linux'], iconfile=icon))
+        batch = BuildBatch.objects.get()
+        self.assertRedirects(response, f'/batch/?id={batch.batch_id}', fetch_redirect_response=False)
+        runs = list(batch.runs.all())
+        self.assertEqual(sorted(run.platform for run in runs), ['linux', 'windows'])
+        # The icon is processed once and shared through the blob store
+        icons = [self.tmp / 'png' / run.uuid / 'icon.png' for run in runs]
+        self.assertEqual(icons[0].stat().st_ino, icons[1].stat().st_ino)
+        self.assertEqual(self.client.get(f'/batch/?id={batch.batch_id}').status_code, 200)
+
+
+@override_settings(PREBUILD_VERSIONS=['9.9.9'], PREBUILD_PLATFORMS=['windows'], PREBUILD_CI_MINUTES=600,
+                   PREBUILD_MAX_INFLIGHT=2, BUILD_DURATION_ESTIMATE=600)
+class PrebuildPoolTests(TempStorageMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.post('/generator/', GENERATOR_FORM)
+        GithubRun.objects.update(status='Failed', dispatch_state='Dispatched', inflight_key=None)
+
+    def test_popular_configuration_is_prebuilt_for_the_current_version(self):
+        summary = prebuild.refresh_pool()
+        self.assertEqual((summary['wanted'], summary['queued']), (1, 1))
+        run = GithubRun.objects.get(client_key=prebuild.PREBUILD_CLIENT)
+        self.assertEqual(json.loads(run.dispatch_payload['inputs']['extras'])['version'], '9.9.9')
+        self.assertEqual(run.dispatch_state, 'Queued')
+        self.assertEqual(prebuild.refresh_pool()['queued'], 0)
+
+    def test_users_waiting_defer_the_pool(self):
+        self.queue_run()
+        summary = prebuild.refresh_pool()
+        self.assertTrue(summary['deferred'])
+        self.assertEqual(summary['queued'], 0)
+
+    @override_settings(PREBUILD_CI_MINUTES=10)
+    def test_budget_limits_the_pool(self):
+        summary = prebuild.refresh_pool()
+        self.assertEqual((summary['queued'], summary['skipped_budget']), (0, 1))
+
+
+class StatusBufferTests(TempStorageMixin, TestCase):
+
+    def test_flush_writes_one_update_per_status(self):
+        runs = [self.make_run(inflight_key=f'key-{i}') for i in range(3)]
+        self.addCleanup(statusbuffer._pending.clear)
+        statusbuffer._pending.update({runs[0].uuid: 'Success', runs[1].uuid: 'Success', runs[2].uuid: 'InProgress'})
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(statusbuffer.commit(), 3)
+        self.assertEqual(sum(q['sql'].startswith('UPDATE') for q in queries.captured_queries), 2)
+        written = {run.uuid: run for run in GithubRun.objects.all()}
+        self.assertEqual(written[runs[0].uuid].status, 'Success')
+        self.assertIsNone(written[runs[0].uuid].inflight_key)
+        self.assertEqual(written[runs[2].uuid].inflight_key, 'key-2')
+        self.assertEqual(len({run.updated_at for run in written.values()}), 1)
+
+    def test_record_without_window_writes_directly(self):
+        run = self.make_run()
+        async_to_sync(statusbuffer.record)(run.uuid, 'Success')
+        run.refresh_from_db()
+        self.assertEqual(run.status, 'Success')
+        self.assertEqual(statusbuffer._pending, {})
+
+    def test_failed_write_asks_the_runner_to_retry(self):
+        run = self.make_run()
+        with mock.patch.object(statusbuffer, 'write', side_effect=DatabaseError('database is locked')):
+            response = self.client.post('/updategh/', json.dumps({'uuid': run.uuid, 'status': 'Success'}),
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 503)
+        run.refresh_from_db()
+        self.assertEqual(run.status, 'InProgress')
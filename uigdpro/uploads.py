@@ -0,0 +1,77 @@
+import os
+import hashlib
+import logging
+
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+
+from . import blobstore
+
+logger = logging.getLogger(__name__)
+
+
+class StagedUploadedFile(UploadedFile):
+    """
+    An upload already written to the blob volume, with its SHA-256 and size.
+    Closing it removes the staging file unless it was adopted into the store.
+    """
+
+    def __init__(self, temp_path, name, content_type, size, charset, sha256, content_type_extra=None):
+        super().__init__(open(temp_path, "rb"), name, content_type, size, charset, content_type_extra)
+        self.temp_path = temp_path
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return str(self.temp_path)
+
+    def adopt(self):
+        """
+        Move the staged file into the blob store. Returns the digest.
+        """
+        self.file.close()
+        blobstore.adopt(self.temp_path, self.sha256)
+        return self.sha256
+
+    def close(self):
+        try:
+            return self.file.close()
+        finally:
+            self.temp_path.unlink(missing_ok=True)
+
+
+class BlobUploadHandler(FileUploadHandler):
+    """
+    Stream file fields straight into a staging file next to the blob store,
+    hashing as the bytes arrive, so an artifact is written to disk once
+    instead of being spooled to /tmp and copied again.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.out, self.temp_path = blobstore.staging_file()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.digest.update(raw_data)
+        self.out.write(raw_data)
+        self.size += len(raw_data)
+        # Returning None keeps the chunk from reaching any later handler
+        return None
+
+    def file_complete(self, file_size):
+        self.out.flush()
+        os.fsync(self.out.fileno())
+        self.out.close()
+        upload = StagedUploadedFile(
+            self.temp_path, self.file_name, self.content_type, self.size,
+            self.charset, self.digest.hexdigest(), self.content_type_extra,
+        )
+        self.out = None
+        return upload
+
+    def upload_interrupted(self):
+        if getattr(self, 'out', None) is not None:
+            self.out.close()
+            self.temp_path.unlink(missing_ok=True)
+            logger.warning(f"Upload of {self.file_name} interrupted; discarded {self.size} bytes")
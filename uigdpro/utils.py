@@ -1,6 +1,15 @@
 import os
-import requests
+import re
+import time
+import asyncio
+import uuid
+import hashlib
 import logging
+import threading
+from pathlib import Path
+
+from . import outbound
+from .breakers import UpstreamUnavailable
 
 logger = logging.getLogger(__name__)
 
@@ -8,28 +17,175 @@ UP_SERVER = os.getenv('UP_SERVER')
 UP_TOKEN = os.getenv('UP_TOKEN')
 UP_REPO_ID = os.getenv('UP_REPO_ID')
 UP_UPLOAD_DIR = os.getenv('UP_UPLOAD_DIR', '/uploads/')
+# Seafile upload links stay valid for an hour by default; refresh a little earlier
+UP_LINK_TTL = int(os.getenv('UP_LINK_TTL', '3000'))
+# How long to remember that a digest is already on the server
+UP_KNOWN_TTL = int(os.getenv('UP_KNOWN_TTL', '86400'))
+
+STREAM_CHUNK = 1024 * 1024
+
+_link_cache = {"link": None, "expires": 0.0}
+_known_files: dict[str, float] = {}
+_cache_lock = threading.Lock()
+
+
+class MultipartStream:
+    """
+    multipart/form-data body that reads the file in chunks as it is sent.
+    It has a known length, so the request carries Content-Length and is
+    streamed without buffering the whole file in memory. Iterating it
+    asynchronously reads each chunk in a worker thread.
+    """
+
+    def __init__(self, fields: dict, file_field: str, file_obj, filename: str, size: int):
+        self.boundary = uuid.uuid4().hex
+        self.file_obj = file_obj
+        head = b""
+        for name, value in fields.items():
+            head += (
+                f"--{self.boundary}\r\n"
+                f'Content-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+            ).encode()
+        head += (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+            f"Content-Type: application/octet-stream\r\n\r\n"
+        ).encode()
+        self.head = head
+        self.tail = f"\r\n--{self.boundary}--\r\n".encode()
+        self.size = size
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        return len(self.head) + self.size + len(self.tail)
+
+    def __iter__(self):
+        yield self.head
+        if hasattr(self.file_obj, "seek"):
+            self.file_obj.seek(0)
+        for chunk in iter(lambda: self.file_obj.read(STREAM_CHUNK), b""):
+            yield chunk
+        yield self.tail
+
+    async def __aiter__(self):
+        yield self.head
+        if hasattr(self.file_obj, "seek"):
+            self.file_obj.seek(0)
+        while chunk := await asyncio.to_thread(self.file_obj.read, STREAM_CHUNK):
+            yield chunk
+        yield self.tail
+
+
+def _file_size(file_obj) -> int:
+    size = getattr(file_obj, "size", None)
+    if size is None:
+        file_obj.seek(0, os.SEEK_END)
+        size = file_obj.tell()
+        file_obj.seek(0)
+    return size
+
 
-def upload_to_server(file_obj, filename: str) -> str | None:
+def _sha256(file_obj) -> str:
+    digest = hashlib.sha256()
+    file_obj.seek(0)
+    for chunk in iter(lambda: file_obj.read(STREAM_CHUNK), b""):
+        digest.update(chunk)
+    file_obj.seek(0)
+    return digest.hexdigest()
 
+
+def stored_name(digest: str, filename: str) -> str:
+    """
+    Content-addressed name on the upload server; keeps a safe extension so
+    the runner's downloaded copy still looks like the original file type.
+    """
+    suffix = Path(filename).suffix.lower()
+    if not re.fullmatch(r'\.[a-z0-9]{1,10}', suffix):
+        suffix = ""
+    return f"{digest}{suffix}"
+
+
+def _auth_headers() -> dict:
+    return {"Authorization": f"Token {UP_TOKEN}"}
+
+
+async def get_upload_link(refresh: bool = False) -> str:
+    """
+    Upload link for the repo, reused until UP_LINK_TTL seconds have passed.
+    """
+    with _cache_lock:
+        if not refresh and _link_cache["link"] and _link_cache["expires"] > time.monotonic():
+            return _link_cache["link"]
+    resp = await outbound.aget(
+        f"{UP_SERVER}/api/v2.1/repos/{UP_REPO_ID}/upload-link/",
+        upstream='upload', headers=_auth_headers(),
+    )
+    resp.raise_for_status()
+    link = resp.json().strip('"')
+    with _cache_lock:
+        _link_cache.update(link=link, expires=time.monotonic() + UP_LINK_TTL)
+    return link
+
+
+async def file_exists(internal_path: str) -> bool:
+    with _cache_lock:
+        if _known_files.get(internal_path, 0) > time.monotonic():
+            return True
+    resp = await outbound.aget(
+        f"{UP_SERVER}/api2/repos/{UP_REPO_ID}/file/detail/",
+        upstream='upload', headers=_auth_headers(), params={"p": internal_path},
+    )
+    if resp.status_code == 404:
+        return False
+    resp.raise_for_status()
+    _remember(internal_path)
+    return True
+
+
+def _remember(internal_path: str) -> None:
+    with _cache_lock:
+        _known_files[internal_path] = time.monotonic() + UP_KNOWN_TTL
+
+
+async def upload_to_server(file_obj, filename: str, sha256: str | None = None) -> str | None:
+    """
+    Upload `file_obj` under its SHA-256 name and return its path on the
+    server. A file whose digest is already stored is not sent again.
+    """
     if not UP_SERVER or not UP_TOKEN or not UP_REPO_ID:
         logger.error("UP_SERVER, UP_TOKEN, or UP_REPO_ID is not set. Please check the environment variables")
         return None
     try:
-        upload_url = f"{UP_SERVER}/api/v2.1/repos/{UP_REPO_ID}/upload-link/"
-        headers = {"Authorization": f"Token {UP_TOKEN}"}
-        resp = requests.get(upload_url, headers=headers)
-        resp.raise_for_status()
-        upload_link = resp.json().strip('"')
-
-        files = {'file': (filename, file_obj.read(), 'application/octet-stream')}
-        data = {'parent_dir': UP_UPLOAD_DIR}
-        upload_resp = requests.post(upload_link, files=files, data=data)
-        upload_resp.raise_for_status()
-
-        internal_path = f"{UP_UPLOAD_DIR}{filename}"
+        digest = sha256 or await asyncio.to_thread(_sha256, file_obj)
+        name = stored_name(digest, filename)
+        internal_path = f"{UP_UPLOAD_DIR}{name}"
+        if await file_exists(internal_path):
+            logger.info(f"Reusing {internal_path} already on the upload server")
+            return internal_path
+
+        size = _file_size(file_obj)
+        for attempt in range(2):
+            # A cached link may have expired early on the server side; retry once with a fresh one
+            upload_link = await get_upload_link(refresh=attempt > 0)
+            body = MultipartStream({'parent_dir': UP_UPLOAD_DIR}, 'file', file_obj, name, size)
+            upload_resp = await outbound.apost(
+                upload_link, upstream='upload', content=aiter(body),
+                headers={'Content-Type': body.content_type, 'Content-Length': str(len(body))},
+            )
+            if upload_resp.status_code in (403, 404) and attempt == 0:
+                continue
+            upload_resp.raise_for_status()
+            break
+
+        _remember(internal_path)
         logger.info(f"The file has been uploaded to : {internal_path}")
         return internal_path
 
+    except UpstreamUnavailable:
+        raise
     except Exception as e:
         logger.error(f"upload failed: {e}")
         return None
@@ -1,39 +1,62 @@
-import io
 import json
+import asyncio
 import os
 import re
 import base64
+import hashlib
+import shutil
 import logging
+from collections import Counter
+from datetime import timedelta
 from pathlib import Path
 from uuid import UUID
-import requests
-from PIL import Image
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.contrib import messages
 from django.core.exceptions import ValidationError
 from django.core.files.uploadedfile import UploadedFile
-from django.db.models import Q
+from django.core.handlers.asgi import ASGIRequest
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import F, Q
 from django.http import (
     HttpResponse,
     JsonResponse,
     Http404,
     FileResponse,
+    StreamingHttpResponse,
 )
-from django.shortcuts import render
+from django.shortcuts import redirect, render
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from urllib.parse import urljoin
+from . import blobstore, scheduler, statusbuffer
+from .breakers import UpstreamUnavailable
+from .builds import build_dispatch_data
+from .chunked import ChunkedUploadError, complete_upload, init_upload, upload_status, write_part
+from .dispatch import enqueue_dispatch, workflow_for
+from .events import publish, subscribe
+from .images import ImageRejected, process_image, render_icon_assets, run_in_pool
+from .middleware import request_deadline
+from .fingerprint import compute_fingerprint, find_cached_build, find_inflight_build, sha256_file
 from .forms import GenerateForm
-from .models import GithubRun
+from .models import BuildBatch, GithubRun
+from .serving import file_response, offload_response, png_cache
+from .uploads import BlobUploadHandler
 from .utils import upload_to_server
 
 logger = logging.getLogger(__name__)
 logger.info(f"upload_token value: {settings.GH_UPLOAD_TOKEN}")
 
 
-def save_png(file_input, uuid_str: str, domain: str, name: str) -> str | None:
+def render_png(file_input, name: str) -> dict[str, bytes] | None:
     """
-    Save PNG file (from UploadedFile or base64 string) to disk.
-    Returns JSON string with url/uuid/file on success, None on failure.
+    Validate and normalise an icon or logo. The icon also gets every
+    platform variant rendered, so runners do no image work. Returns
+    {file name: bytes}, or None if the image is rejected.
     """
     allowed_names = {"icon.png", "logo.png"}
     if name not in allowed_names:
@@ -41,66 +64,39 @@ def save_png(file_input, uuid_str: str, domain: str, name: str) -> str | None:
         return None
 
     try:
-        UUID(uuid_str)
-    except ValueError:
-        logger.error(f"Invalid UUID: {uuid_str}")
+        final_bytes = process_image(file_input)
+    except ImageRejected as e:
+        logger.warning(f"Image rejected: {e}")
         return None
 
-    # Limit image size to prevent DoS
-    MAX_IMAGE_SIZE = 5 * 1024 * 1024  # 5MB
-
-    image_bytes = None
-    if isinstance(file_input, str):
-        if not file_input.startswith("data:image/"):
-            logger.warning("Base64 input missing 'data:image/' prefix")
-            return None
+    files = {name: final_bytes}
+    if name == "icon.png":
+        # The workflows download these instead of rendering them, so a build
+        # without them would fail later on the runner
         try:
-            header, b64_part = file_input.split(";base64,", 1)
-            image_bytes = base64.b64decode(b64_part)
-            if len(image_bytes) > MAX_IMAGE_SIZE:
-                logger.warning("Base64 image too large")
-                return None
-        except (ValueError, base64.binascii.Error) as e:
-            logger.error(f"Base64 decode error: {e}")
-            return None
-    elif hasattr(file_input, 'chunks'):
-        try:
-            chunks = []
-            total = 0
-            for chunk in file_input.chunks():
-                total += len(chunk)
-                if total > MAX_IMAGE_SIZE:
-                    logger.warning("Uploaded image too large")
-                    return None
-                chunks.append(chunk)
-            image_bytes = b''.join(chunks)
+            files.update(run_in_pool(render_icon_assets, final_bytes))
         except Exception as e:
-            logger.error(f"File read error: {e}")
+            logger.error(f"Icon asset rendering failed: {e!r}")
             return None
-    else:
-        logger.error("Unsupported file_input type")
-        return None
+    return files
+
 
+def store_png(files: dict[str, bytes], uuid_str: str, domain: str, name: str) -> str | None:
+    """
+    Expose rendered files under png/<uuid>/ (content-addressed, so a batch
+    sharing one icon stores it once) and return the iconlink/logolink JSON.
+    """
     try:
-        img = Image.open(io.BytesIO(image_bytes))
-        img.verify()
-        img = Image.open(io.BytesIO(image_bytes))
-        if img.mode != "RGBA":
-            img = img.convert("RGBA")
-        output_buffer = io.BytesIO()
-        img.save(output_buffer, format="PNG")
-        final_bytes = output_buffer.getvalue()
-    except Exception as e:
-        logger.error(f"Image processing failed: {e}")
+        UUID(uuid_str)
+    except ValueError:
+        logger.error(f"Invalid UUID: {uuid_str}")
         return None
 
     save_dir = Path(settings.BASE_DIR) / "png" / uuid_str
     save_dir.mkdir(parents=True, exist_ok=True)
-    file_path = save_dir / name
-
     try:
-        with open(file_path, "wb") as f:
-            f.write(final_bytes)
+        for file_name, content in files.items():
+            blobstore.write_bytes(save_dir / file_name, content)
     except OSError as e:
         logger.error(f"File write error: {e}")
         return None
@@ -110,261 +106,252 @@ def save_png(file_input, uuid_str: str, domain: str, name: str) -> str | None:
         "uuid": uuid_str,
         "file": name,
     }
+    if len(files) > 1:
+        result["assets"] = sorted(n for n in files if n != name)
     return json.dumps(result)
 
 
-def create_github_run(myuuid: str, filename: str, direction: str, platform: str):
+ASSET_CONTENT_TYPES = {
+    '.png': 'image/png',
+    '.ico': 'image/x-icon',
+    '.icns': 'image/icns',
+    '.svg': 'image/svg+xml',
+    '.pbm': 'image/x-portable-bitmap',
+}
+
+
+def create_github_run(myuuid: str, filename: str, direction: str, platform: str, fingerprint: str = "",
+                      workflow_file: str = "", data: dict | None = None, idempotency_key: str | None = None,
+                      client_key: str = "", priority: int = 0):
+    new_run = new_github_run(myuuid, filename, direction, platform, fingerprint, workflow_file, data,
+                             idempotency_key, client_key, priority)
+    new_run.save()
+    return new_run
+
+
+def new_github_run(myuuid: str, filename: str, direction: str, platform: str, fingerprint: str = "",
+                   workflow_file: str = "", data: dict | None = None, idempotency_key: str | None = None,
+                   client_key: str = "", priority: int = 0) -> GithubRun:
+    """
+    Unsaved queued run, so callers creating many at once can bulk_create them.
+    """
     new_run = GithubRun(
         uuid=myuuid,
         filename=filename,
         direction=direction,
         platform=platform,
-        status="InProgress"
+        status="InProgress",
+        fingerprint=fingerprint,
+        # Unique while InProgress: a concurrent identical submission fails to insert and attaches instead
+        inflight_key=fingerprint or None,
+        idempotency_key=idempotency_key or None,
+        client_key=client_key,
+        priority=priority,
     )
-    new_run.save()
+    if data is not None:
+        enqueue_dispatch(new_run, workflow_file, data)
+    return new_run
+
+
+def render_waiting(request, filename: str, uuid_str: str, status: str, platform: str):
+    run = GithubRun.objects.filter(uuid=uuid_str).first()
+    initial = {'status': status}
+    if run is not None:
+        initial = run_status(run, scheduler.queue_info([run]).get(run.uuid))
+    return render(request, 'waiting.html', {
+        'filename': filename,
+        'uuid': uuid_str,
+        'status': status,
+        'initial_status': initial,
+        'platform': platform,
+        # Streams hold a connection open, which only an ASGI server can afford
+        'use_sse': isinstance(request, ASGIRequest),
+    })
+
+
+def run_status(run: GithubRun, queue: dict | None = None) -> dict:
+    payload = {
+        'uuid': run.uuid,
+        'status': run.status,
+        'dispatch_state': run.dispatch_state,
+        'dispatched_at': run.dispatched_at.isoformat() if run.dispatched_at else None,
+        'updated_at': run.updated_at.isoformat(),
+    }
+    if queue:
+        payload.update(queue)
+    return payload
 
 
-@csrf_exempt
-def generator_view(request):
+def render_generated(request, gh_run: GithubRun, filename: str, platform: str):
+    short_uuid = gh_run.uuid.replace('-', '')[:4]
+    return render(request, 'generated.html', {
+        'filename': filename,
+        'uuid': gh_run.uuid,
+        'platform': platform,
+        'short_uuid': short_uuid,
+        'direction': gh_run.direction.lower(),
+    })
 
-    
+
+def plan_build(cd: dict, platform: str, images: dict, full_url: str, planned: dict,
+               custom_file_sha256: str = "", client_key: str = "", priority: int = 0) -> tuple[GithubRun, bool]:
+    """
+    One platform of a submission. Returns (run, True) for an identical build
+    that is cached, in flight or already planned in this submission, else
+    (unsaved new run, False) with its icon/logo linked under png/<uuid>/.
+    `images` maps icon.png/logo.png to (rendered files, SHA-256 of the PNG).
+    """
+    myuuid = str(UUID(bytes=os.urandom(16)))
+    filename, data = build_dispatch_data(cd, platform, myuuid, None, None)
+    fingerprint = compute_fingerprint(platform, data["inputs"], {
+        "icon.png": images["icon.png"][1] if "icon.png" in images else "",
+        "logo.png": images["logo.png"][1] if "logo.png" in images else "",
+        "custom_file": custom_file_sha256,
+    })
+    reused = planned.get(fingerprint)
+    if reused is None:
+        reused = find_cached_build(fingerprint) or find_inflight_build(fingerprint)
+        if reused:
+            # Popularity for the prebuild pool; cache hits create no row of their own
+            GithubRun.objects.filter(pk=reused.pk).update(hits=F('hits') + 1)
+    if reused:
+        planned[fingerprint] = reused
+        return reused, True
+
+    for name, (files, _digest) in images.items():
+        link = store_png(files, myuuid, full_url, name)
+        data["inputs"]["iconlink" if name == "icon.png" else "logolink"] = link or "null"
+    run = new_github_run(myuuid, filename, cd['direction'], platform, fingerprint, workflow_for(platform), data,
+                         client_key=client_key, priority=priority)
+    planned[fingerprint] = run
+    return run, False
+
+
+def validate_submission(request) -> tuple[GenerateForm, bool]:
+    # Parsing the multipart body and probing images is blocking work
+    form = GenerateForm(request.POST, request.FILES)
+    return form, form.is_valid()
+
+
+def create_batch(runs: list[GithubRun], client_key: str) -> BuildBatch:
+    batch = BuildBatch.objects.create(batch_id=str(UUID(bytes=os.urandom(16))), client_key=client_key)
+    batch.runs.add(*runs)
+    return batch
+
+
+def submission_error(request, form: GenerateForm, message: str):
+    messages.error(request, message)
+    return render(request, 'generator.html', {'form': form, 'errors': form.errors})
+
+
+@request_deadline('UPLOAD_REQUEST_DEADLINE')
+@csrf_exempt
+async def generator_view(request):
+    """
+    Async, so a submission waiting on the upload server holds no thread.
+    Database work and rendering go through sync_to_async; image processing
+    and hashing run in worker threads, off the event loop.
+    """
     if request.method == 'POST':
-        form = GenerateForm(request.POST, request.FILES)
-        if not form.is_valid():
-            return render(request, 'generator.html', {'form': form, 'errors': form.errors})
+        form, valid = await sync_to_async(validate_submission, thread_sensitive=False)(request)
+        if not valid:
+            return await sync_to_async(render)(request, 'generator.html', {'form': form, 'errors': form.errors})
 
         # Extract cleaned data
         cd = form.cleaned_data
         custom_file = cd.get('custom_file')
         custom_target_path = cd.get('custom_target_path')
-        custom_file_url = "" 
+        custom_file_sha256 = ""
         if custom_file and custom_target_path:
-            filename_for_upload = custom_file.name
-            internal_path = upload_to_seafile(custom_file, filename_for_upload)
-            if internal_path:
-                custom_file_url = internal_path
-            else:
-                messages.error(request, "upload failed")
-                return render(request, 'generator.html', {'form': form, 'errors': form.errors})
-        
-        platform = cd['platform']
-        version = cd['version']
-        delayFix = cd['delayFix']
-        cycleMonitor = cd['cycleMonitor']
-        xOffline = cd['xOffline']
-        hidecm = cd['hidecm']
-        removeNewVersionNotif = cd['removeNewVersionNotif']
-        hidePassword = cd['hidePassword']
-        hideMenuBar = cd['hideMenuBar']
-        removeTopNotice = cd['removeTopNotice']
-        password_security_length = cd['password_security_length']
-        server = cd['serverIP'] or 'rs-ny.rustdesk.com'
-        key = cd['key'] or 'OeVuKk5nlHiXp+APNn0Y3pC1Iwpwn44JGqrQCsWqmBw='
-        apiServer = cd['apiServer'] or f"{server}:21114"
-        urlLink = cd['urlLink'] or "https://rustdesk.com"
-        downloadLink = cd['downloadLink'] or "https://rustdesk.com/download"
-        direction = cd['direction']
-        installation = cd['installation']
-        settings_flag = cd['settings']
-        appname = cd['appname']
-        filename = cd['exename']
-        compname = (cd['compname'] or "Purslane Ltd").replace("&", "\\&")
-        permPass = cd['permanentPassword']
-        theme = cd['theme']
-        themeDorO = cd['themeDorO']
-        passApproveMode = cd['passApproveMode']
-        denyLan = cd['denyLan']
-        enableDirectIP = cd['enableDirectIP']
-        autoClose = cd['autoClose']
-        permissionsDorO = cd['permissionsDorO']
-        permissionsType = cd['permissionsType']
-
-        # Boolean flags
-        bool_flags = {
-            'enableKeyboard': cd['enableKeyboard'],
-            'enableClipboard': cd['enableClipboard'],
-            'enableFileTransfer': cd['enableFileTransfer'],
-            'enableAudio': cd['enableAudio'],
-            'enableTCP': cd['enableTCP'],
-            'enableRemoteRestart': cd['enableRemoteRestart'],
-            'enableRecording': cd['enableRecording'],
-            'enableBlockingInput': cd['enableBlockingInput'],
-            'enableRemoteModi': cd['enableRemoteModi'],
-            'removeWallpaper': cd['removeWallpaper'],
-            'enablePrinter': cd['enablePrinter'],
-            'enableCamera': cd['enableCamera'],
-            'enableTerminal': cd['enableTerminal'],
-        }
-
-        # Sanitize filename
-        if filename and all(c.isascii() for c in filename):
-            filename = re.sub(r'[^\w\s\-]', '_', filename).strip().replace(' ', '_')
-            if not filename:
-                filename = "rustdesk"
-        else:
-            filename = "rustdesk"
-
-        # Sanitize appname
-        if not appname or not all(c.isascii() for c in appname):
-            appname = "rustdesk"
+            custom_file_sha256 = await sync_to_async(sha256_file, thread_sensitive=False)(custom_file)
 
-        myuuid = str(UUID(int=0))  # placeholder; will replace
-        myuuid = str(UUID(bytes=os.urandom(16)))  # better randomness
+        platforms = cd['platform']
         protocol = getattr(settings, 'PROTOCOL', 'https')
         host = request.get_host()
         full_url = f"{protocol}://{host}"
-
-        # Process icon
-        iconlink = None
-        try:
-            iconfile = cd.get('iconfile') or cd.get('iconbase64')
-            if iconfile:
-                iconlink = save_png(iconfile, myuuid, full_url, "icon.png")
-        except Exception as e:
-            logger.error(f"Icon processing failed: {e}", exc_info=True)
-
-        # Process logo
-        logolink = None
-        try:
-            logofile = cd.get('logofile') or cd.get('logobase64')
-            if logofile:
-                logolink = save_png(logofile, myuuid, full_url, "logo.png")
-        except Exception as e:
-            logger.error(f"Logo processing failed: {e}", exc_info=True)
-
-        # Build custom config
-        decodedCustom = {}
-        decodedCustom['conn-type'] = direction
-        if installation == "installationN":
-            decodedCustom['disable-installation'] = 'Y'
-        if settings_flag == "settingsN":
-            decodedCustom['disable-settings'] = 'Y'
-        if appname.lower() != "rustdesk":
-            decodedCustom['app-name'] = appname
-
-        decodedCustom['override-settings'] = {}
-        decodedCustom['default-settings'] = {}
-
-        if permPass:
-            decodedCustom['password'] = permPass
-
-        # Theme handling
-        if theme != "system":
-            target = decodedCustom['default-settings'] if themeDorO == "default" else decodedCustom['override-settings']
-            if platform == "windows-x86":
-                target['allow-darktheme'] = 'Y' if theme == "dark" else 'N'
-            else:
-                target['theme'] = theme
-
-        decodedCustom['enable-lan-discovery'] = 'N' if denyLan else 'Y'
-        decodedCustom['allow-auto-disconnect'] = 'Y' if autoClose else 'N'
-
-        # Permissions
-        target_perm = decodedCustom['default-settings'] if permissionsDorO == "default" else decodedCustom['override-settings']
-        target_perm.update({
-            'access-mode': permissionsType,
-            'verification-method': 'use-permanent-password' if hidecm else 'use-both-passwords',
-            'approve-mode': passApproveMode,
-            'allow-hide-cm': 'Y' if hidecm else 'N',
-            'allow-remove-wallpaper': 'Y' if cd['removeWallpaper'] else 'N',
-            'direct-server': 'Y' if enableDirectIP else 'N',
-        })
-        for key_name, value in bool_flags.items():
-            target_perm[key_name] = 'Y' if value else 'N'
-
-        # Manual overrides
-        for line in (cd.get('defaultManual') or '').splitlines():
-            if '=' in line:
-                k, v = line.split('=', 1)
-                decodedCustom['default-settings'][k.strip()] = v.strip()
-        for line in (cd.get('overrideManual') or '').splitlines():
-            if '=' in line:
-                k, v = line.split('=', 1)
-                decodedCustom['override-settings'][k.strip()] = v.strip()
-
-        # Encode custom config
-        custom_json = json.dumps(decodedCustom)
-        encodedCustom = base64.b64encode(custom_json.encode("ascii")).decode("ascii")
-
-        # Extras
-        extras = {
-            'genurl': getattr(settings, 'GENURL', ''),
-            'urlLink': urlLink,
-            'downloadLink': downloadLink,
-            'delayFix': delayFix,
-            'version': version,
-            'gdpro': "true",
-            'cycleMonitor': cycleMonitor,
-            'xOffline': xOffline,
-            'removeNewVersionNotif': removeNewVersionNotif,
-            'hidePassword': hidePassword,
-            'hideMenuBar': hideMenuBar,
-            'removeTopNotice': removeTopNotice,
-            'password_security_length': password_security_length,
-            'compname': compname,
-            'upload_token': getattr(settings, 'GH_UPLOAD_TOKEN', ''),
-        }
-        extra_input = json.dumps(extras)
-
-        # Determine workflow URL
-        workflow_map = {
-            'windows-x86': 'generator-windows-x86.yml',
-            'windows': 'generator-windows.yml',
-            'linux': 'generator-linux.yml',
-            'android': 'generator-android.yml',
-            'macos': 'generator-macos.yml',
-        }
-        workflow_file = workflow_map.get(platform, 'generator-windows.yml')
-        url = f"https://api.github.com/repos/{settings.GHUSER}/{settings.REPONAME}/actions/workflows/{workflow_file}/dispatches"
-
-        # Prepare GitHub Action payload
-        data = {
-            "ref": "master",
-            "inputs": {
-                "server": server,
-                "key": key,
-                "apiServer": apiServer,
-                "custom": encodedCustom,
-                "uuid": myuuid,
-                "iconlink": iconlink or "null",
-                "logolink": logolink or "null",
-                "appname": appname,
-                "extras": extra_input,
-                "filename": filename,
-                "upload_token": getattr(settings, 'GH_UPLOAD_TOKEN', ''),
-                "custom_file_url": custom_file_url,
-                "custom_target_path": custom_target_path or "",
-            }
-        }
-
-        headers = {
-            'Accept': 'application/vnd.github+json',
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {settings.GHBEARER}',
-            'X-GitHub-Api-Version': '2022-11-28'
-        }
-
-        create_github_run(myuuid, filename, direction, platform)
-        response = requests.post(url, json=data, headers=headers)
-        logger.info(f"GitHub Action trigger: {response.status_code} for {myuuid}")
-
-        if response.status_code == 204:
-            return render(request, 'waiting.html', {
-                'filename': filename,
-                'uuid': myuuid,
-                'status': "InProgress",
-                'platform': platform
-            })
-        else:
-            logger.error(f"GitHub API error: {response.text}")
-            return JsonResponse({"error": "Failed to start build"}, status=500)
-
-    else:
-        form = GenerateForm()
-    return render(request, 'generator.html', {'form': form})
-
-
-def check_for_file(request):
+        client_key = scheduler.client_key(request)
+
+        # Icon and logo are processed once, whatever the number of platforms
+        images = {}
+        for name, source in (
+            ("icon.png", cd.get('iconfile') or cd.get('iconbase64')),
+            ("logo.png", cd.get('logofile') or cd.get('logobase64')),
+        ):
+            if not source:
+                continue
+            try:
+                files = await sync_to_async(render_png, thread_sensitive=False)(source, name)
+            except Exception as e:
+                logger.error(f"{name} processing failed: {e}", exc_info=True)
+                files = None
+            if not files:
+                return await sync_to_async(submission_error)(
+                    request, form, f"{name} could not be processed, please upload a different image"
+                )
+            images[name] = (files, hashlib.sha256(files[name]).hexdigest())
+
+        # Reuse finished or in-flight builds with identical inputs instead of dispatching again
+        planned = {}
+        runs = []
+        for platform in platforms:
+            run, reused = await sync_to_async(plan_build)(cd, platform, images, full_url, planned,
+                                                          custom_file_sha256, client_key=client_key)
+            runs.append((run, reused))
+        new_runs = [run for run, reused in runs if not reused]
+
+        if custom_file_sha256 and new_runs:
+            try:
+                internal_path = await upload_to_server(custom_file, custom_file.name, custom_file_sha256)
+            except UpstreamUnavailable as e:
+                logger.warning(f"Skipping upload for {new_runs[0].uuid}: {e}")
+                return await sync_to_async(submission_error)(
+                    request, form, "The upload server is temporarily unavailable, please try again in a few minutes"
+                )
+            if not internal_path:
+                return await sync_to_async(submission_error)(request, form, "upload failed")
+            for run in new_runs:
+                run.dispatch_payload["inputs"]["custom_file_url"] = internal_path
+
+        # The dispatcher worker (manage.py run_dispatcher) sends the workflow_dispatch
+        created = iter(await sync_to_async(insert_runs)(new_runs))
+        for run in new_runs:
+            logger.info(f"Queued GitHub Action dispatch for {run.uuid}")
+        for run, reused in runs:
+            if reused:
+                logger.info(f"Reusing build {run.uuid} ({run.status}) for {run.platform}")
+        runs = [run if reused else next(created) for run, reused in runs]
+
+        if len(runs) == 1:
+            run = runs[0]
+            if run.status == "Success":
+                return await sync_to_async(render_generated)(request, run, run.filename, run.platform)
+            return await sync_to_async(render_waiting)(request, run.filename, run.uuid, run.status, run.platform)
+
+        batch = await sync_to_async(create_batch)(runs, client_key)
+        # Redirect so the batch page can be reloaded and bookmarked without resubmitting
+        return redirect(f"{reverse('batch')}?id={batch.batch_id}")
+
+    return await sync_to_async(render)(request, 'generator.html', {'form': GenerateForm()})
+
+
+@require_http_methods(["GET", "HEAD"])
+def batch_view(request):
+    """
+    Waiting page for a multi-platform submission: /batch/?id=<batch_id>.
+    """
+    batch = BuildBatch.objects.filter(batch_id=request.GET.get('id', '')).first()
+    if batch is None:
+        raise Http404("Batch not found")
+    runs = list(batch.runs.order_by('id'))
+    return render(request, 'batch_waiting.html', {
+        'batch': batch,
+        'runs': runs,
+        'initial_progress': batch_progress(batch, runs),
+        'status_url': f"{reverse('batch_status')}?id={batch.batch_id}",
+    })
+
+
+async def check_for_file(request):
     filename = request.GET.get('filename')
     uuid = request.GET.get('uuid')
     platform = request.GET.get('platform')
@@ -372,28 +359,110 @@ def check_for_file(request):
     if not all([filename, uuid, platform]):
         raise Http404("Missing parameters")
 
-    gh_run = GithubRun.objects.filter(uuid=uuid).first()
+    gh_run = await GithubRun.objects.filter(uuid=uuid).afirst()
     if not gh_run:
         raise Http404("Build not found")
 
     if gh_run.status == "Success":
-        short_uuid = gh_run.uuid.replace('-', '')[:4]
-        return render(request, 'generated.html', {
-            'filename': filename,
-            'uuid': uuid,
-            'platform': platform,
-            'short_uuid': short_uuid,
-            'direction': gh_run.direction.lower(),
-        })
+        return await sync_to_async(render_generated)(request, gh_run, filename, platform)
     else:
-        return render(request, 'waiting.html', {
-            'filename': filename,
-            'uuid': uuid,
-            'status': gh_run.status,
-            'platform': platform,
-        })
+        return await sync_to_async(render_waiting)(request, filename, uuid, gh_run.status, platform)
 
 
+@require_http_methods(["GET", "HEAD"])
+def build_status(request):
+    """
+    Compact JSON status for one or more builds:
+    /api/status/?uuid=<a>&uuid=<b> or /api/status/?uuids=<a>,<b>
+    Queued runs include queue_position and estimated_start. Supports
+    If-None-Match, and If-Modified-Since while none of the runs is queued.
+    """
+    max_uuids = getattr(settings, 'STATUS_API_MAX_UUIDS', 200)
+    requested = request.GET.getlist('uuid')
+    for value in request.GET.getlist('uuids'):
+        requested.extend(part for part in value.split(',') if part)
+    requested = sorted(set(u.strip() for u in requested))
+
+    if not requested:
+        return JsonResponse({"error": "Missing uuid"}, status=400)
+    if len(requested) > max_uuids:
+        return JsonResponse({"error": f"At most {max_uuids} UUIDs per request"}, status=400)
+    try:
+        for uuid_str in requested:
+            UUID(uuid_str)
+    except ValueError:
+        return JsonResponse({"error": f"Invalid UUID: {uuid_str}"}, status=400)
+
+    gh_runs = list(GithubRun.objects.filter(uuid__in=requested).only(
+        'uuid', 'platform', 'status', 'dispatch_state', 'dispatched_at', 'updated_at'
+    ))
+    queue = scheduler.queue_info(gh_runs)
+    runs = {run.uuid: run_status(run, queue.get(run.uuid)) for run in gh_runs}
+    missing = [u for u in requested if u not in runs]
+
+    # Queue positions move without touching updated_at, so they are part of the ETag
+    version = json.dumps(runs, sort_keys=True) + "|" + ",".join(missing)
+    etag = f'"{hashlib.sha256(version.encode()).hexdigest()[:32]}"'
+    last_modified = None
+    if gh_runs and not queue:
+        last_modified = int(max(run.updated_at for run in gh_runs).timestamp())
+
+    response = JsonResponse({"runs": runs, "missing": missing})
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, no_cache=True)
+    return get_conditional_response(request, etag=etag, last_modified=last_modified, response=response)
+
+
+async def status_stream(request):
+    """
+    Server-Sent Events feed of one build's status. Sends the current status,
+    then every change until the build leaves InProgress. Changes written in
+    this process arrive immediately via events.publish; changes from other
+    processes are caught by a periodic recheck that doubles as a keep-alive.
+    """
+    uuid_str = request.GET.get('uuid')
+    try:
+        UUID(uuid_str)
+    except (TypeError, ValueError):
+        return HttpResponse("Invalid UUID", status=400)
+
+    recheck = getattr(settings, 'SSE_RECHECK_INTERVAL', 15)
+    max_duration = getattr(settings, 'SSE_MAX_DURATION', 300)
+    one_shot = not isinstance(request, ASGIRequest)
+
+    async def stream():
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + max_duration
+        last_sent = None
+        yield f"retry: {recheck * 1000}\n\n"
+        with subscribe(uuid_str) as changed:
+            while True:
+                changed.clear()
+                run = await GithubRun.objects.filter(uuid=uuid_str).afirst()
+                if run is None:
+                    yield "event: missing\ndata: {}\n\n"
+                    return
+                queue = await sync_to_async(scheduler.queue_info)([run])
+                payload = run_status(run, queue.get(run.uuid))
+                if payload != last_sent:
+                    last_sent = payload
+                    yield f"event: status\ndata: {json.dumps(payload)}\n\n"
+                if run.status != "InProgress" or one_shot or loop.time() >= deadline:
+                    return
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=recheck)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@require_http_methods(["GET", "HEAD"])
 def download(request):
     uuid_str = request.GET.get('uuid')
     full_filename = request.GET.get('filename')
@@ -411,6 +480,8 @@ def download(request):
         return HttpResponse("Invalid UUID", status=400)
 
     gh_run = GithubRun.objects.filter(uuid=uuid_str).first()
+    if gh_run and gh_run.status == "Expired":
+        return HttpResponse("Build has expired, please generate it again", status=410)
     if not gh_run or gh_run.status != "Success":
         return HttpResponse("Build not ready or not found", status=404)
 
@@ -427,20 +498,38 @@ def download(request):
     if not target_file.is_file():
         return HttpResponse("File not found", status=404)
 
+    touch_download(gh_run)
+    offloaded = offload_response(target_file, (Path(settings.BASE_DIR) / 'exe').resolve(), full_filename)
+    if offloaded is not None:
+        return offloaded
+
     try:
-        return FileResponse(open(target_file, 'rb'), as_attachment=True, filename=full_filename)
+        return file_response(request, target_file, full_filename)
     except (IOError, OSError):
         return HttpResponse("Failed to read file", status=500)
 
 
+def touch_download(gh_run):
+    """
+    Record the download for LRU retention, at most once an hour per build
+    so range requests and retries don't turn every GET into a write.
+    """
+    now = timezone.now()
+    if gh_run.last_downloaded_at and now - gh_run.last_downloaded_at < timedelta(hours=1):
+        return
+    GithubRun.objects.filter(pk=gh_run.pk).update(last_downloaded_at=now)
+
+
+@require_http_methods(["GET", "HEAD"])
 def get_png(request):
     filename = request.GET.get('filename')
     uuid_str = request.GET.get('uuid')
 
     if not filename or not uuid_str:
         return HttpResponse("Missing filename or UUID", status=400)
-    if not filename.lower().endswith('.png'):
-        return HttpResponse("Only PNG files allowed", status=400)
+    content_type = ASSET_CONTENT_TYPES.get(Path(filename).suffix.lower())
+    if content_type is None:
+        return HttpResponse("Only PNG, ICO, ICNS, SVG or PBM files allowed", status=400)
     if not re.fullmatch(r'^[a-zA-Z0-9._\-]+$', filename):
         return HttpResponse("Invalid filename", status=400)
 
@@ -463,24 +552,34 @@ def get_png(request):
         raise Http404("File not found")
 
     try:
-        with open(target_file, 'rb') as f:
-            response = HttpResponse(f.read(), content_type='image/png')
-            response['Content-Disposition'] = f'inline; filename="{filename}"'
-            return response
+        data, etag = png_cache.load(target_file)
     except (IOError, OSError):
         return HttpResponse("Failed to read file", status=500)
 
+    # Files under png/<uuid>/ are never rewritten after store_png, so they can be cached forever
+    not_modified = get_conditional_response(request, etag=etag)
+    response = not_modified or HttpResponse(data, content_type=content_type)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response['Content-Disposition'] = f'inline; filename="{filename}"'
+    return response
+
 
 @csrf_exempt
 @require_http_methods(["POST"])
-def update_github_run(request):
+async def update_github_run(request):
     try:
         data = json.loads(request.body)
         myuuid = data.get('uuid')
         mystatus = data.get('status')
         if myuuid and mystatus:
-            GithubRun.objects.filter(uuid=myuuid).update(status=mystatus)
+            await statusbuffer.record(myuuid, mystatus)
+            publish(myuuid)
         return HttpResponse('')
+    except DatabaseError as e:
+        # Not stored: let the caller retry rather than acknowledge it
+        logger.error(f"Update run error: {e}")
+        return HttpResponse("Service Unavailable", status=503)
     except Exception as e:
         logger.error(f"Update run error: {e}")
         return HttpResponse("Bad Request", status=400)
@@ -490,6 +589,8 @@ def update_github_run(request):
 def save_custom_client(request):
     if request.method != 'POST':
         return HttpResponse("Method not allowed", status=405)
+    # Must be set before request.POST / request.FILES are first touched
+    request.upload_handlers = [BlobUploadHandler(request)]
     client_token = request.POST.get('token')
     expected_token = getattr(settings, 'GH_UPLOAD_TOKEN', None)
 
@@ -504,46 +605,410 @@ def save_custom_client(request):
     myuuid = request.POST.get('uuid')
     if not file or not myuuid:
         return HttpResponse("Missing file or uuid", status=400)
-    exe_dir = Path(settings.BASE_DIR) / "exe" / myuuid
-    exe_dir.mkdir(parents=True, exist_ok=True)
-    file_path = exe_dir / file.name
+    try:
+        UUID(myuuid)
+    except ValueError:
+        return HttpResponse("Invalid UUID", status=400)
+    file_name = Path(file.name).name
+    if not re.fullmatch(r'^[a-zA-Z0-9._\-]+$', file_name):
+        return HttpResponse("Invalid filename format", status=400)
+    file_path = Path(settings.BASE_DIR) / "exe" / myuuid / file_name
 
-    with open(file_path, "wb+") as f:
-        for chunk in file.chunks():
-            f.write(chunk)
+    # The handler already streamed and hashed the upload on the blob volume;
+    # adopting it is a rename and exposing it under exe/<uuid> is a hardlink.
+    try:
+        digest = file.adopt()
+        blobstore.link_blob(digest, file_path)
+    except OSError as e:
+        logger.error(f"Artifact write error for {myuuid}/{file_name}: {e}")
+        return HttpResponse("Failed to store file", status=500)
+    logger.info(f"Stored artifact {myuuid}/{file_name} ({file.size} bytes, sha256 {digest[:12]})")
     return HttpResponse("OK", status=200)
 
+def upload_authorized(request) -> bool:
+    """
+    Runners send the upload token either as a `token` form field or as
+    `Authorization: Bearer <token>`.
+    """
+    expected_token = getattr(settings, 'GH_UPLOAD_TOKEN', None)
+    if not expected_token:
+        return False
+    auth_header = request.META.get('HTTP_AUTHORIZATION', '')
+    if auth_header == f"Bearer {expected_token}":
+        return True
+    return request.GET.get('token') == expected_token or (
+        request.method == 'POST' and request.POST.get('token') == expected_token
+    )
+
+
+def chunked_target(request) -> tuple[str, str]:
+    params = request.POST if request.method == 'POST' else request.GET
+    myuuid = params.get('uuid', '')
+    file_name = params.get('filename', '')
+    try:
+        UUID(myuuid)
+    except ValueError:
+        raise ChunkedUploadError("Invalid UUID")
+    # A leading alphanumeric rules out '.' and '..', which name directories, not files
+    if not re.fullmatch(r'^[a-zA-Z0-9][a-zA-Z0-9._\-]*$', file_name):
+        raise ChunkedUploadError("Invalid filename format")
+    return myuuid, file_name
+
+
+def chunked_upload_view(handler):
+    """
+    Shared plumbing for the chunked upload endpoints: token check, uuid and
+    filename validation, and ChunkedUploadError -> HTTP status.
+    """
+    @csrf_exempt
+    def view(request):
+        if not upload_authorized(request):
+            return HttpResponse("Forbidden", status=403)
+        try:
+            myuuid, file_name = chunked_target(request)
+            return JsonResponse(handler(request, myuuid, file_name))
+        except ChunkedUploadError as e:
+            return HttpResponse(str(e), status=e.status)
+        except OSError as e:
+            logger.error(f"Chunked upload error for {request.path}: {e}")
+            return HttpResponse("Failed to store file", status=500)
+    view.__name__ = handler.__name__
+    view.__doc__ = handler.__doc__
+    return view
+
+
+@require_http_methods(["POST"])
+@chunked_upload_view
+def upload_init(request, myuuid, file_name):
+    """
+    POST uuid, filename, size, sha256[, part_size]. Creates or resumes the
+    upload and returns the part layout and the parts already committed.
+    """
+    try:
+        size = int(request.POST.get('size', ''))
+        part_size = int(request.POST.get('part_size') or 0) or None
+    except ValueError:
+        raise ChunkedUploadError("size and part_size must be integers")
+    return init_upload(myuuid, file_name, size, request.POST.get('sha256', '').lower(), part_size)
+
+
+@require_http_methods(["PUT"])
+@chunked_upload_view
+def upload_part(request, myuuid, file_name):
+    """
+    PUT ?uuid=&filename=&part=N with the raw part bytes as the body.
+    An optional X-Part-SHA256 header is checked against the received bytes.
+    """
+    try:
+        index = int(request.GET.get('part', ''))
+        length = int(request.META.get('CONTENT_LENGTH') or -1)
+    except ValueError:
+        raise ChunkedUploadError("part and Content-Length must be integers")
+    return write_part(myuuid, file_name, index, request, length, request.headers.get('X-Part-SHA256'))
+
+
+@require_http_methods(["GET"])
+@chunked_upload_view
+def upload_status_view(request, myuuid, file_name):
+    """
+    GET ?uuid=&filename= -> committed parts and resumable offset.
+    """
+    return upload_status(myuuid, file_name)
+
+
+@require_http_methods(["POST"])
+@chunked_upload_view
+def upload_complete(request, myuuid, file_name):
+    """
+    POST uuid, filename. Verifies the assembled file's SHA-256 and only then
+    exposes it under exe/<uuid>/<filename>.
+    """
+    digest, size = complete_upload(myuuid, file_name)
+    blobstore.link_blob(digest, Path(settings.BASE_DIR) / "exe" / myuuid / file_name)
+    logger.info(f"Stored artifact {myuuid}/{file_name} via chunked upload ({size} bytes, sha256 {digest[:12]})")
+    return {"uuid": myuuid, "filename": file_name, "size": size, "sha256": digest}
+
+
+def api_authorized(request) -> bool:
+    expected = f"Bearer {getattr(settings, 'EXTERNAL_API_TOKEN', 'your-secret-token')}"
+    return request.META.get('HTTP_AUTHORIZATION') == expected
+
+
+def api_client_key(request) -> str:
+    # API callers share one token; X-Client-Id lets integrations get separate fair shares
+    return "api:" + hashlib.sha256(request.headers.get('X-Client-Id', '').encode()).hexdigest()[:28]
+
+
+def startgh_response(run: GithubRun, replayed: bool = False) -> HttpResponse:
+    response = HttpResponse(status=204)
+    response['X-Build-UUID'] = run.uuid
+    if replayed:
+        response['Idempotent-Replayed'] = 'true'
+    return response
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def startgh(request):
 
-    auth_header = request.META.get('HTTP_AUTHORIZATION')
-    expected = f"Bearer {getattr(settings, 'EXTERNAL_API_TOKEN', 'your-secret-token')}"
-    if auth_header != expected:
+    if not api_authorized(request):
         return HttpResponse("Unauthorized", status=401)
 
+    idempotency_key = request.headers.get('Idempotency-Key', '').strip()[:128]
+    if idempotency_key:
+        existing = GithubRun.objects.filter(idempotency_key=idempotency_key).first()
+        if existing:
+            return startgh_response(existing, replayed=True)
+
     try:
         data_ = json.loads(request.body)
-        platform = data_.get('platform', 'windows')
-        workflow_file = {
-            'windows-x86': 'generator-windows-x86.yml',
-            'windows': 'generator-windows.yml',
-            'linux': 'generator-linux.yml',
-            'android': 'generator-android.yml',
-            'macos': 'generator-macos.yml',
-        }.get(platform, 'generator-windows.yml')
-
-        url = f"https://api.github.com/repos/{settings.GHUSER}/{settings.REPONAME}/actions/workflows/{workflow_file}/dispatches."
-        headers = {
-            'Accept': 'application/vnd.github+json',
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {settings.GHBEARER}',
-            'X-GitHub-Api-Version': '2022-11-28'
-        }
-        response = requests.post(url, json=data_, headers=headers)
-        logger.info(f"External trigger: {response.status_code}")
-        return HttpResponse(status=204)
+        # 'platform' only selects the workflow; it is not a workflow_dispatch field
+        platform = data_.pop('platform', 'windows')
+        inputs = data_.get('inputs') or {}
+        try:
+            myuuid = str(UUID(str(inputs.get('uuid'))))
+        except ValueError:
+            myuuid = str(UUID(bytes=os.urandom(16)))
+        # The workflow reports status and uploads under this uuid
+        inputs['uuid'] = myuuid
+        data_['inputs'] = inputs
+        existing = GithubRun.objects.filter(uuid=myuuid).first()
+        if existing:
+            return startgh_response(existing, replayed=True)
+
+        try:
+            with transaction.atomic():
+                run = create_github_run(
+                    myuuid, str(inputs.get('filename') or 'startgh')[:255], '', platform,
+                    workflow_file=workflow_for(platform), data=data_, idempotency_key=idempotency_key,
+                    client_key=api_client_key(request), priority=getattr(settings, 'STARTGH_PRIORITY', 10),
+                )
+        except IntegrityError:
+            # A retry with the same key or uuid raced us
+            match = Q(uuid=myuuid)
+            if idempotency_key:
+                match |= Q(idempotency_key=idempotency_key)
+            existing = GithubRun.objects.filter(match).first()
+            if existing is None:
+                raise
+            return startgh_response(existing, replayed=True)
+        logger.info(f"External trigger queued: {myuuid}")
+        return startgh_response(run)
     except Exception as e:
         logger.error(f"startgh error: {e}")
         return HttpResponse("Bad Request", status=400)
     
+
+
+def bulk_form_data(spec: dict) -> dict:
+    """
+    GenerateForm data for one bulk entry: fields left out take the form's
+    initial value (as a fresh web form would) rather than unchecked/empty.
+    """
+    data = {
+        name: field.initial
+        for name, field in GenerateForm.base_fields.items()
+        if field.initial is not None
+    }
+    data.update(spec)
+    return data
+
+
+def batch_progress(batch: BuildBatch, runs: list[GithubRun] | None = None) -> dict:
+    if runs is None:
+        runs = list(batch.runs.only(
+            'uuid', 'platform', 'status', 'dispatch_state', 'dispatched_at', 'updated_at'
+        ))
+    queue = scheduler.queue_info(runs)
+    counts = Counter(run.status for run in runs)
+    return {
+        "batch_id": batch.batch_id,
+        "total": len(runs),
+        "counts": dict(counts),
+        "finished": len(runs) - counts.get("InProgress", 0),
+        "runs": {run.uuid: run_status(run, queue.get(run.uuid)) for run in runs},
+    }
+
+
+def insert_runs(new_runs: list[GithubRun]) -> list[GithubRun]:
+    """
+    bulk_create the batch's new runs in one statement. If a concurrent
+    submission claimed one of the fingerprints first, fall back to row by
+    row inserts and attach those runs to the in-flight build instead.
+    """
+    try:
+        with transaction.atomic():
+            return GithubRun.objects.bulk_create(new_runs, batch_size=200)
+    except IntegrityError:
+        pass
+    rows = []
+    for run in new_runs:
+        try:
+            with transaction.atomic():
+                run.save()
+            rows.append(run)
+            continue
+        except IntegrityError:
+            pass
+        inflight_run = find_inflight_build(run.fingerprint)
+        if inflight_run:
+            shutil.rmtree(Path(settings.BASE_DIR) / "png" / run.uuid, ignore_errors=True)
+            rows.append(inflight_run)
+        else:
+            run.inflight_key = None
+            run.save()
+            rows.append(run)
+    return rows
+
+
+def batch_response(batch: BuildBatch, status: int = 202, replayed: bool = False, **extra) -> JsonResponse:
+    payload = batch_progress(batch)
+    payload["status_url"] = f"{reverse('batch_status')}?id={batch.batch_id}"
+    payload.update(extra)
+    response = JsonResponse(payload, status=status)
+    if replayed:
+        response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def bulk_build(request):
+    """
+    Queue many builds in one call:
+    {"builds": [{<GenerateForm fields>, "platforms": ["windows", "macos"]}, ...],
+     "iconbase64": "data:image/png;base64,...", "logobase64": "..."}
+    Top-level images apply to entries without their own, and each distinct
+    image is processed once. Every (entry, platform) pair becomes one run of
+    a new batch; cached and in-flight identical builds are reused. Returns
+    202 with the batch's progress (see batch_status) plus "builds", the run
+    uuids per entry and platform. Honours Idempotency-Key.
+    """
+    if not api_authorized(request):
+        return HttpResponse("Unauthorized", status=401)
+
+    idempotency_key = request.headers.get('Idempotency-Key', '').strip()[:128]
+    if idempotency_key:
+        existing = BuildBatch.objects.filter(idempotency_key=idempotency_key).first()
+        if existing:
+            return batch_response(existing, status=200, replayed=True)
+
+    try:
+        body = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+    specs = body.get('builds') if isinstance(body, dict) else None
+    if not isinstance(specs, list) or not specs:
+        return JsonResponse({"error": "'builds' must be a non-empty list"}, status=400)
+
+    # Validate every entry against the web form's rules before doing any work
+    platform_choices = dict(GenerateForm.base_fields['platform'].choices)
+    max_builds = getattr(settings, 'BULK_MAX_BUILDS', 500)
+    errors = {}
+    jobs = []
+    for index, spec in enumerate(specs):
+        if not isinstance(spec, dict):
+            errors[index] = {"__all__": ["Entry must be an object"]}
+            continue
+        spec = dict(spec)
+        platforms = spec.pop('platforms', None) or [spec.get('platform') or 'windows']
+        if isinstance(platforms, str):
+            platforms = [platforms]
+        unknown = [p for p in platforms if p not in platform_choices]
+        if unknown:
+            errors[index] = {"platforms": [f"Unknown platform: {', '.join(map(str, unknown))}"]}
+            continue
+        for name in ('iconbase64', 'logobase64'):
+            if not spec.get(name) and body.get(name):
+                spec[name] = body[name]
+        form = GenerateForm(bulk_form_data(dict(spec, platform=platforms)))
+        if not form.is_valid():
+            errors[index] = form.errors.get_json_data()
+            continue
+        if form.cleaned_data.get('custom_target_path'):
+            errors[index] = {"custom_target_path": ["custom_file is not supported by the bulk API"]}
+            continue
+        jobs.append((index, form.cleaned_data, list(dict.fromkeys(platforms))))
+    if errors:
+        return JsonResponse({"errors": errors}, status=400)
+    total = sum(len(platforms) for _index, _cd, platforms in jobs)
+    if total > max_builds:
+        return JsonResponse({"error": f"At most {max_builds} builds per request, got {total}"}, status=400)
+
+    # Shared icons and logos: decode, validate and render each distinct image once
+    rendered = {}
+    for index, cd, _platforms in jobs:
+        for field, name in (('iconbase64', 'icon.png'), ('logobase64', 'logo.png')):
+            source = cd.get(field)
+            if not source:
+                continue
+            key = (name, hashlib.sha256(source.encode()).hexdigest())
+            if key not in rendered:
+                files = render_png(source, name)
+                rendered[key] = (files, hashlib.sha256(files[name]).hexdigest()) if files else None
+            if rendered[key] is None:
+                errors.setdefault(index, {})[field] = ["Image rejected"]
+    if errors:
+        return JsonResponse({"errors": errors}, status=400)
+
+    protocol = getattr(settings, 'PROTOCOL', 'https')
+    full_url = f"{protocol}://{request.get_host()}"
+    client_key = api_client_key(request)
+    priority = getattr(settings, 'BULK_BUILD_PRIORITY', 0)
+
+    builds = []
+    members = []
+    new_runs = []
+    planned = {}
+    for index, cd, platforms in jobs:
+        images = {}
+        for field, name in (('iconbase64', 'icon.png'), ('logobase64', 'logo.png')):
+            if cd.get(field):
+                images[name] = rendered[(name, hashlib.sha256(cd[field].encode()).hexdigest())]
+        entry = {}
+        for platform in platforms:
+            # Icons are hardlinks to the blobs rendered above; no image work per run
+            run, reused = plan_build(cd, platform, images, full_url, planned, client_key=client_key, priority=priority)
+            (members if reused else new_runs).append(run)
+            entry[platform] = run
+        builds.append(entry)
+
+    try:
+        with transaction.atomic():
+            batch = BuildBatch.objects.create(
+                batch_id=str(UUID(bytes=os.urandom(16))),
+                client_key=client_key,
+                idempotency_key=idempotency_key or None,
+            )
+            created = insert_runs(new_runs)
+            # insert_runs may have swapped a planned run for one another submission started
+            stored = {id(run): row for run, row in zip(new_runs, created)}
+            members = [stored.get(id(run), run) for run in members]
+            batch.runs.add(*members, *created)
+    except IntegrityError:
+        # A retry with the same Idempotency-Key raced us
+        existing = BuildBatch.objects.filter(idempotency_key=idempotency_key).first() if idempotency_key else None
+        if existing is None:
+            raise
+        return batch_response(existing, status=200, replayed=True)
+
+    builds = [{platform: stored.get(id(run), run).uuid for platform, run in entry.items()} for entry in builds]
+    logger.info(f"Bulk batch {batch.batch_id}: {len(created)} queued, {len(members)} reused")
+    return batch_response(batch, builds=builds)
+
+
+@require_http_methods(["GET", "HEAD"])
+def batch_status(request):
+    """
+    Aggregate progress of a bulk batch: /api/batch/?id=<batch_id>.
+    Supports If-None-Match like build_status.
+    """
+    batch = BuildBatch.objects.filter(batch_id=request.GET.get('id', '')).first()
+    if batch is None:
+        return JsonResponse({"error": "Batch not found"}, status=404)
+    payload = batch_progress(batch)
+    etag = f'"{hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:32]}"'
+    response = JsonResponse(payload)
+    response['ETag'] = etag
+    patch_cache_control(response, no_cache=True)
+    return get_conditional_response(request, etag=etag, response=response)